@@ -1,5 +1,5 @@
 from fastapi import APIRouter
-from app.api.api_v1.endpoints import auth, courses, lessons, tavily, users
+from app.api.api_v1.endpoints import auth, courses, lessons, llm, render, tavily, users
 
 api_router = APIRouter()
 api_router.include_router(auth.router, prefix="/auth", tags=["auth"])
@@ -7,3 +7,5 @@ api_router.include_router(users.router, prefix="/users", tags=["users"])
 api_router.include_router(courses.router, prefix="/courses", tags=["courses"])
 api_router.include_router(lessons.router, prefix="/lessons", tags=["lessons"])
 api_router.include_router(tavily.router, prefix="/tavily", tags=["tavily"])
+api_router.include_router(llm.router, prefix="/llm", tags=["llm"])
+api_router.include_router(render.router, prefix="/render", tags=["render"])
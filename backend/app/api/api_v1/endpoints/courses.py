@@ -1,4 +1,4 @@
-from typing import List, Any
+from typing import List, Any, Optional
 from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
 from fastapi.responses import FileResponse
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -14,11 +14,25 @@ from pathlib import Path
 logger = logging.getLogger(__name__)
 
 from app.api import deps
+from app.api.sse import sse_event, sse_response
 from app.core.db import get_db
 from app.core.config import settings
 from app.models.base import Course, User, Lesson
 from app.schemas import course as course_schema
+from app.services import (
+    course_export,
+    course_research,
+    epub_builder,
+    lesson_retrieval,
+    lesson_service,
+    pdf_merge,
+    render_cache,
+)
+from app.services.json_stream import JSONArrayStreamParser
+from app.services.lesson_prefetch import lesson_prefetcher
 from app.services.llm_service import LLMService
+from app.services.pipeline import Pipeline, Stage
+from app.services.question_cache import question_cache
 from app.services.pdf_service import PDFService
 
 router = APIRouter()
@@ -69,6 +83,93 @@ async def create_course(
     return course
 
 
+@router.post("/stream")
+async def create_course_stream(
+    course_in: course_schema.CourseCreate,
+    current_user: User = Depends(deps.get_current_user),
+) -> Any:
+    """
+    Streaming variant of course creation using Server-Sent Events.
+    Emits `status` right away, a `module` event ({"index", "title",
+    "lessons"}) as soon as each module of the syllabus is complete, then a
+    final `course` event once the validated index has been saved.
+    Failures are reported as an `error` event and nothing is saved.
+    """
+    from app.core.db import AsyncSessionLocal
+
+    language = course_in.language or "en"
+    user_id = current_user.id
+
+    async def events():
+        yield sse_event({"status": "generating"}, event="status")
+
+        parts = []
+        parser = JSONArrayStreamParser()
+        index_stream = LLMService.stream_course_index(
+            course_in.topic,
+            course_in.custom_instructions,
+            language,
+            use_web_research=course_in.use_web_research or False,
+            user=current_user,
+        )
+        try:
+            async for delta in index_stream:
+                parts.append(delta)
+                completed = parser.feed(delta)
+                # A delta can complete several modules (a cached index comes
+                # in one piece): number them from the first one it completed
+                start = len(parser.items) - len(completed)
+                for i, module in enumerate(completed, start):
+                    if not isinstance(module, dict):
+                        logger.warning("Skipping non-object course module %r", module)
+                        continue
+                    yield sse_event({"index": i, **module}, event="module")
+        except asyncio.CancelledError:
+            logger.info("Client disconnected, cancelled course index generation")
+            raise
+        except Exception as e:
+            logger.error("Streaming course generation failed: %s", e)
+            yield sse_event(
+                {"detail": f"Failed to generate course index: {str(e)}"},
+                event="error",
+            )
+            return
+        finally:
+            # Closes the upstream completion if we stopped early
+            await index_stream.aclose()
+
+        # Validate the whole index; fall back to the parsed modules if the
+        # model added text after the array
+        index_json_str = LLMService._clean_course_index("".join(parts))
+        try:
+            json.loads(index_json_str)
+        except ValueError as e:
+            if not (parser.finished and parser.items):
+                yield sse_event(
+                    {"detail": f"Failed to generate course index: {str(e)}"},
+                    event="error",
+                )
+                return
+            index_json_str = json.dumps(parser.items)
+
+        async with AsyncSessionLocal() as session:
+            course = Course(
+                user_id=user_id,
+                title=course_in.topic,
+                description=f"Course on {course_in.topic}",
+                index_json=index_json_str,
+                language=language,
+            )
+            session.add(course)
+            await session.commit()
+            await session.refresh(course)
+
+        course_out = course_schema.CourseOut.model_validate(course)
+        yield sse_event(course_out.model_dump(mode="json"), event="course")
+
+    return sse_response(events())
+
+
 @router.get("/", response_model=course_schema.CoursesListResponse)
 async def read_courses(
     skip: int = 0,
@@ -223,6 +324,7 @@ async def update_course(
 
     if course_in.title is not None:
         course.title = course_in.title
+        render_cache.evict_course(current_user.id, course_id)  # Title page changed
 
     await db.commit()
     await db.refresh(course)
@@ -262,14 +364,34 @@ async def delete_course(
         for question in questions_result.scalars().all():
             await db.delete(question)
         await db.delete(lesson)
+        question_cache.invalidate(lesson.id)
+        lesson_retrieval.forget_lesson(lesson.id)
+
+    await course_research.delete_research(db, course_id)
 
     # Delete the course
     await db.delete(course)
     await db.commit()
 
+    lesson_prefetcher.cancel(current_user.id, course_id)
+    lesson_prefetcher.forget_course(course_id)
+    render_cache.evict_course(current_user.id, course_id)
+
     return {"message": "Course deleted successfully"}
 
 
+@router.delete("/{course_id}/prefetch")
+async def cancel_lesson_prefetch(
+    course_id: int,
+    current_user: User = Depends(deps.get_current_user),
+) -> Any:
+    """
+    Cancel the speculative generation of upcoming lessons for this course.
+    """
+    cancelled = lesson_prefetcher.cancel(current_user.id, course_id)
+    return {"cancelled": cancelled}
+
+
 # Store generation status in memory (could be Redis in production)
 generation_status = {}
 
@@ -283,7 +405,8 @@ async def generate_all_lessons(
     db: AsyncSession = Depends(get_db),
 ) -> Any:
     """
-    Generate all lessons for a course in parallel with limited concurrency.
+    Generate all lessons for a course in parallel with limited concurrency,
+    or through the provider Batch API with mode="batch".
     """
     use_web_research = request.use_web_research
     # Verify course ownership
@@ -333,11 +456,18 @@ async def generate_all_lessons(
         "failed": 0,
         "in_progress": True,
         "errors": [],
+        "mode": request.mode,
+        "research_mode": request.research_mode if use_web_research else None,
+        "stages": {},  # Per-stage pipeline stats (interactive mode)
     }
 
     # Start background task
     background_tasks.add_task(
-        generate_lessons_background,
+        (
+            generate_lessons_batch_background
+            if request.mode == "batch"
+            else generate_lessons_background
+        ),
         course_id,
         course.title,
         course.index_json,
@@ -346,6 +476,7 @@ async def generate_all_lessons(
         current_user.id,
         status_key,
         use_web_research,  # From request body
+        request.research_mode,
     )
 
     return {
@@ -354,6 +485,7 @@ async def generate_all_lessons(
         "already_generated": len(existing_lessons),
         "to_generate": len(lessons_to_generate),
         "status_key": status_key,
+        "mode": request.mode,
     }
 
 
@@ -363,7 +495,9 @@ async def get_generation_status(
     current_user: User = Depends(deps.get_current_user),
 ) -> Any:
     """
-    Get the status of ongoing lesson generation.
+    Get the status of ongoing lesson generation. For interactive jobs
+    "stages" has the workers, active and queued lessons, throughput and
+    average time of each pipeline stage.
     """
     status_key = f"course_{course_id}_user_{current_user.id}"
     status = generation_status.get(
@@ -388,12 +522,16 @@ async def generate_lessons_background(
     user_id: int,
     status_key: str,
     use_web_research: bool = False,
+    research_mode: str = "lesson",
 ) -> None:
     """
-    Background task to generate all lessons with limited concurrency.
+    Background task to generate all lessons as a pipeline of stages (web
+    research -> LLM + save -> PDF render), each with its own worker count.
+    With research_mode="course" web context comes from one course-level
+    research pass instead of a search per lesson.
     """
     from app.core.db import AsyncSessionLocal
-    from app.services.pdf_service import PDFService
+    from app.services.tavily_service import TavilyService
 
     # Load user for per-user LLM/Tavily settings
     user = None
@@ -401,83 +539,199 @@ async def generate_lessons_background(
         result = await session.execute(select(User).where(User.id == user_id))
         user = result.scalars().first()
 
-    # Create semaphore for concurrency control
-    semaphore = asyncio.Semaphore(settings.MAX_CONCURRENT_WORKERS)
+    course_corpus = await _prepare_course_research(
+        course_id,
+        course_title,
+        index_json,
+        language,
+        user,
+        status_key,
+        use_web_research,
+        research_mode,
+    )
 
-    async def generate_single_lesson(lesson_data):
-        async with semaphore:
-            try:
-                # Generate content
-                content = await LLMService.generate_lesson_content(
-                    course_title,
-                    lesson_data["title"],
-                    index_json,
-                    language,
-                    use_web_research=use_web_research,
-                    user=user,
-                )
+    status = generation_status[status_key]
 
-                # Save to database
-                async with AsyncSessionLocal() as session:
-                    new_lesson = Lesson(
-                        course_id=course_id,
-                        title=lesson_data["title"],
-                        path_in_index=lesson_data["path"],
-                        content_markdown=content,
-                    )
-                    session.add(new_lesson)
-                    await session.commit()
-                    await session.refresh(new_lesson)
-                    lesson_id = new_lesson.id
-
-                # Generate PDF
-                pdf_path = await PDFService.convert_markdown_to_pdf(
-                    content, user_id, course_title, lesson_data["title"]
-                )
+    async def research(item: dict) -> dict:
+        if course_corpus:
+            item["research_context"] = await course_research.lesson_research_context(
+                course_id, course_title, item["title"]
+            )
+        else:
+            tavily = TavilyService.for_user(user)
+            web_context = await tavily.search_for_lesson_context(
+                course_title, item["title"], language
+            )
+            item["research_context"] = web_context or ""
+        return item
+
+    async def generate(item: dict) -> Optional[dict]:
+        # Generate content and save (shared with a concurrent /generate)
+        lesson, created = await lesson_service.generate_lesson(
+            course_id,
+            course_title,
+            index_json,
+            language,
+            item["title"],
+            item["path"],
+            user=user,
+            research_context=item.get("research_context"),
+        )
+        if not created:  # The concurrent request renders its PDF
+            status["completed"] += 1
+            return None
+        item["lesson"] = lesson
+        return item
+
+    async def render(item: dict) -> None:
+        await lesson_service.render_lesson_pdf(item["lesson"], user_id, course_title)
+        status["completed"] += 1
+
+    def on_error(item: dict, stage: str, e: BaseException) -> None:
+        status["failed"] += 1
+        status["errors"].append(
+            {"lesson": item["title"], "error": str(e), "stage": stage}
+        )
 
-                # Update with PDF path
-                async with AsyncSessionLocal() as session:
-                    result = await session.execute(
-                        select(Lesson).where(Lesson.id == lesson_id)
-                    )
-                    lesson = result.scalars().first()
-                    if lesson:
-                        lesson.pdf_path = pdf_path
-                        await session.commit()
+    # Research, LLM calls and rendering overlap, each with its own
+    # concurrency; bounded queues keep the stages in step
+    stages = []
+    if use_web_research:
+        stages.append(Stage("research", research, settings.PIPELINE_RESEARCH_WORKERS))
+    stages.append(Stage("llm", generate, settings.PIPELINE_LLM_WORKERS))
+    stages.append(Stage("render", render, settings.PIPELINE_RENDER_WORKERS))
+    pipeline = Pipeline(stages, settings.PIPELINE_QUEUE_SIZE, on_error=on_error)
+    status["stages"] = pipeline.snapshot()
 
-                # Update status
-                generation_status[status_key]["completed"] += 1
-                return {"success": True, "lesson": lesson_data["title"]}
+    try:
+        await pipeline.run(dict(lesson) for lesson in lessons_to_generate)
+    finally:
+        status["in_progress"] = False
 
-            except Exception as e:
-                generation_status[status_key]["failed"] += 1
-                generation_status[status_key]["errors"].append(
-                    {
-                        "lesson": lesson_data["title"],
-                        "error": str(e),
-                    }
-                )
-                return {
-                    "success": False,
-                    "lesson": lesson_data["title"],
-                    "error": str(e),
-                }
 
-    # Generate all lessons in parallel
-    tasks = [generate_single_lesson(lesson) for lesson in lessons_to_generate]
-    await asyncio.gather(*tasks, return_exceptions=True)
+async def _prepare_course_research(
+    course_id: int,
+    course_title: str,
+    index_json: str,
+    language: str,
+    user,
+    status_key: str,
+    use_web_research: bool,
+    research_mode: str,
+) -> bool:
+    """
+    Run (or reuse) the course research pass for research_mode="course".
+    Returns True if lessons should take their web context from the corpus;
+    without one they fall back to per-lesson searches.
+    """
+    if not use_web_research or research_mode != "course":
+        return False
+    try:
+        ready = await course_research.ensure_research(
+            course_id, course_title, index_json, language, user
+        )
+    except Exception as e:
+        logger.warning(f"Course research for {course_id} failed: {e}")
+        ready = False
+    generation_status[status_key]["research"] = "ready" if ready else "unavailable"
+    return ready
 
 
-def natural_sort_key(path_in_index: str):
+async def generate_lessons_batch_background(
+    course_id: int,
+    course_title: str,
+    index_json: str,
+    language: str,
+    lessons_to_generate: list,
+    user_id: int,
+    status_key: str,
+    use_web_research: bool = False,
+    research_mode: str = "lesson",
+) -> None:
     """
-    Sort helper for path_in_index like '1.1.1', '1.2.1', '10.1.1'
+    Background task to generate all lessons through one provider batch, then
+    render their PDFs. Falls back to interactive generation if the provider
+    doesn't support the Batch API.
     """
-    import re
+    from app.core.db import AsyncSessionLocal
+    from app.services import batch_service
 
-    return [
-        int(text) if text.isdigit() else text.lower()
-        for text in re.split("([0-9]+)", path_in_index)
-    ]
+    status = generation_status[status_key]
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(select(User).where(User.id == user_id))
+        user = result.scalars().first()
+
+    research_contexts = None
+    if await _prepare_course_research(
+        course_id,
+        course_title,
+        index_json,
+        language,
+        user,
+        status_key,
+        use_web_research,
+        research_mode,
+    ):
+        research_contexts = {
+            lesson["path"]: await course_research.lesson_research_context(
+                course_id, course_title, lesson["title"]
+            )
+            for lesson in lessons_to_generate
+        }
+
+    try:
+        created, errors = await batch_service.generate_lessons_batch(
+            course_id,
+            course_title,
+            index_json,
+            language,
+            lessons_to_generate,
+            user=user,
+            status=status,
+            use_web_research=use_web_research,
+            research_contexts=research_contexts,
+        )
+    except batch_service.BatchUnavailable as e:
+        logger.warning(f"Batch API unavailable ({e}), generating interactively")
+        status["mode"] = "interactive"
+        await generate_lessons_background(
+            course_id,
+            course_title,
+            index_json,
+            language,
+            lessons_to_generate,
+            user_id,
+            status_key,
+            use_web_research,
+            research_mode,
+        )
+        return
+    except Exception as e:
+        logger.error(f"Batch generation for course {course_id} failed: {e}")
+        status["failed"] = status["total"]
+        status["errors"].append({"lesson": None, "error": str(e)})
+        status["in_progress"] = False
+        return
+
+    titles = {l["path"]: l["title"] for l in lessons_to_generate}
+    status["completed"] = status["total"] - len(errors)
+    status["failed"] = len(errors)
+    status["errors"].extend(
+        {"lesson": titles.get(path, path), "error": error}
+        for path, error in errors.items()
+    )
+
+    semaphore = asyncio.Semaphore(settings.MAX_CONCURRENT_WORKERS)
+
+    async def render_pdf(lesson: Lesson) -> None:
+        async with semaphore:
+            try:
+                await lesson_service.render_lesson_pdf(lesson, user_id, course_title)
+            except Exception as e:
+                logger.error(f"PDF generation failed for lesson {lesson.id}: {e}")
+
+    await asyncio.gather(*(render_pdf(lesson) for lesson in created))
+    status["in_progress"] = False
 
 
 @router.get("/{course_id}/download-full-pdf")
@@ -518,76 +772,35 @@ async def download_full_course_pdf(
             detail=f"{len(not_generated)} lesson(s) not yet generated. All lessons must be generated before downloading full PDF.",
         )
 
-    # Sort lessons naturally by path_in_index
-    sorted_lessons = sorted(lessons, key=lambda l: natural_sort_key(l.path_in_index))
-
-    # Build merged markdown with page breaks
-    merged_md_parts = [
-        f"# {course.title}\n\n",
-        f"**Course Description:** {course.description}\n\n",
-        "\\newpage\n\n",
-        "# Table of Contents\n\n",
-    ]
-
-    # Add TOC
-    for lesson in sorted_lessons:
-        merged_md_parts.append(f"- {lesson.path_in_index}. {lesson.title}\n")
-
-    merged_md_parts.append("\n\\newpage\n\n")
-
-    # Add all lesson contents
-    for lesson in sorted_lessons:
-        merged_md_parts.append(f"# {lesson.path_in_index}. {lesson.title}\n\n")
-
-        # Sanitize markdown content to avoid Pandoc errors
-        content = lesson.content_markdown
-        if content:
-            import re
-
-            # Replace smart quotes with regular quotes
-            content = content.replace("\u2018", "'").replace("\u2019", "'")
-            content = content.replace("\u201c", '"').replace("\u201d", '"')
-            content = content.replace("\u2013", "-").replace("\u2014", "--")
-
-            # Remove Pandoc attributes and custom syntax
-            # Remove {.class}, {#id}, {key=value} patterns but preserve Jinja {{ }} syntax
-            # Only match single braces with Pandoc-specific prefixes: . # or key=value
-            content = re.sub(
-                r"\{(?:\.[a-zA-Z0-9_-]+|#[a-zA-Z0-9_-]+|[a-zA-Z_][a-zA-Z0-9_-]*=[^}]+)\}",
-                "",
-                content,
-            )
-
-            # Escape problematic patterns that Pandoc might interpret as metadata
-            # Replace standalone --- with a safe alternative
-            content = re.sub(r"^---$", "___", content, flags=re.MULTILINE)
+    merged_md = course_export.build_course_markdown(course, lessons)
 
-            # Fix italic Nota patterns that might confuse Pandoc
-            # Replace *Nota * patterns with **Nota ** (bold instead of italic)
-            content = re.sub(r"\*Nota([^*]+)\*", r"**Nota\1**", content)
-
-            merged_md_parts.append(content)
-
-        merged_md_parts.append("\n\n\\newpage\n\n")
-
-    merged_md = "".join(merged_md_parts)
-
-    # Generate PDF with pdf_service
+    # Rendered once per distinct content, then served from the render cache
     safe_course_title = PDFService._sanitize_filename(course.title)
-    pdf_path = await PDFService.convert_markdown_to_pdf(
-        merged_md, current_user.id, course.title, safe_course_title
-    )
+    full_path = None
+    if settings.FULL_PDF_MODE == "merge":
+        # Same content key, so a merged PDF is only rebuilt when a lesson changed
+        full_path = await render_cache.get_or_render(
+            merged_md,
+            "pdf",
+            current_user.id,
+            course.id,
+            variant="merge",
+            build=lambda path: pdf_merge.build_merged_pdf(
+                course, lessons, current_user.id, path
+            ),
+        )
+        if not full_path:
+            logger.warning(f"Merged PDF of course {course_id} failed, typesetting it")
+    if not full_path:
+        full_path = await render_cache.get_or_render(
+            merged_md, "pdf", current_user.id, course.id, label=safe_course_title
+        )
 
-    if not pdf_path:
+    if not full_path:
         raise HTTPException(
             status_code=500, detail="Failed to generate merged PDF. Check backend logs."
         )
 
-    # Return file
-    full_path = PDFService.BASE_DIR / pdf_path
-    if not full_path.exists():
-        raise HTTPException(status_code=404, detail="Generated PDF file not found")
-
     return FileResponse(
         path=str(full_path),
         media_type="application/pdf",
@@ -633,77 +846,34 @@ async def download_full_course_epub(
             detail=f"{len(not_generated)} lesson(s) not yet generated. All lessons must be generated before downloading full EPUB.",
         )
 
-    # Sort lessons naturally by path_in_index
-    sorted_lessons = sorted(lessons, key=lambda l: natural_sort_key(l.path_in_index))
-
-    # Build merged markdown with page breaks
-    merged_md_parts = [
-        f"# {course.title}\n\n",
-        f"**Course Description:** {course.description}\n\n",
-        "\n\n",
-        "# Table of Contents\n\n",
-    ]
-
-    # Add TOC
-    for lesson in sorted_lessons:
-        merged_md_parts.append(f"- {lesson.path_in_index}. {lesson.title}\n")
-
-    merged_md_parts.append("\n\n")
-
-    # Add all lesson contents
-    for lesson in sorted_lessons:
-        merged_md_parts.append(f"# {lesson.path_in_index}. {lesson.title}\n\n")
-
-        # Sanitize markdown content to avoid Pandoc errors
-        content = lesson.content_markdown
-        if content:
-            import re
-
-            # Replace smart quotes with regular quotes
-            content = content.replace("\u2018", "'").replace("\u2019", "'")
-            content = content.replace("\u201c", '"').replace("\u201d", '"')
-            content = content.replace("\u2013", "-").replace("\u2014", "--")
-
-            # Remove Pandoc attributes and custom syntax
-            # Remove {.class}, {#id}, {key=value} patterns but preserve Jinja {{ }} syntax
-            # Only match single braces with Pandoc-specific prefixes: . # or key=value
-            content = re.sub(
-                r"\{(?:\.[a-zA-Z0-9_-]+|#[a-zA-Z0-9_-]+|[a-zA-Z_][a-zA-Z0-9_-]*=[^}]+)\}",
-                "",
-                content,
-            )
-
-            # Escape problematic patterns that Pandoc might interpret as metadata
-            # Replace standalone --- with a safe alternative
-            content = re.sub(r"^---$", "___", content, flags=re.MULTILINE)
-
-            # Fix italic Nota patterns that might confuse Pandoc
-            # Replace *Nota * patterns with **Nota ** (bold instead of italic)
-            content = re.sub(r"\*Nota([^*]+)\*", r"**Nota\1**", content)
+    merged_md = course_export.build_course_markdown(course, lessons, page_breaks=False)
 
-            merged_md_parts.append(content)
-
-        merged_md_parts.append("\n\n")
-
-    merged_md = "".join(merged_md_parts)
-
-    # Generate EPUB with pdf_service
+    # Rendered once per distinct content, then served from the render cache
     safe_course_title = PDFService._sanitize_filename(course.title)
-    epub_path = await PDFService.convert_markdown_to_epub(
-        merged_md, current_user.id, course.title, safe_course_title
-    )
+    full_path = None
+    if settings.FULL_EPUB_MODE == "chapters":
+        # Only lessons whose chapter is not cached yet go through pandoc
+        full_path = await render_cache.get_or_render(
+            merged_md,
+            "epub",
+            current_user.id,
+            course.id,
+            variant="chapters",
+            build=lambda path: epub_builder.build_course_epub(course, lessons, path),
+        )
+        if not full_path:
+            logger.warning(f"Chapter EPUB of course {course_id} failed, using pandoc")
+    if not full_path:
+        full_path = await render_cache.get_or_render(
+            merged_md, "epub", current_user.id, course.id, label=safe_course_title
+        )
 
-    if not epub_path:
+    if not full_path:
         raise HTTPException(
             status_code=500,
             detail="Failed to generate merged EPUB. Check backend logs.",
         )
 
-    # Return file
-    full_path = PDFService.BASE_DIR / epub_path
-    if not full_path.exists():
-        raise HTTPException(status_code=404, detail="Generated EPUB file not found")
-
     return FileResponse(
         path=str(full_path),
         media_type="application/epub+zip",
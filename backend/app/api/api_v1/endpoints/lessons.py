@@ -1,14 +1,21 @@
 from typing import Any, Optional
+import asyncio
+import logging
 from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
 from app.api import deps
+from app.api.sse import sse_event, sse_response
 from app.core.db import get_db
 from app.models.base import Lesson, Course, User, LessonQuestion
 from app.schemas import lesson as lesson_schema
+from app.services import epub_builder, lesson_retrieval, lesson_service, render_cache
+from app.services.lesson_prefetch import lesson_prefetcher
 from app.services.llm_service import LLMService
-from app.services.pdf_service import PDFService
+from app.services.question_cache import question_cache
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -19,21 +26,12 @@ async def generate_pdf_background(
     user_id: int,
     course_title: str,
     lesson_title: str,
-    db_session_maker,
 ) -> None:
-    path = await PDFService.convert_markdown_to_pdf(
-        content, user_id, course_title, lesson_title
+    # Shared with the other renders of this lesson (prefetch, course PDF merge)
+    await lesson_service.render_pdf(
+        lesson_id, content, user_id, course_title, lesson_title
     )
 
-    # Update DB with path - we need a new session here usually if using async session in background
-    # However, depending on session maker provided or just using a new one
-    async with db_session_maker() as session:
-        result = await session.execute(select(Lesson).where(Lesson.id == lesson_id))
-        lesson = result.scalars().first()
-        if lesson:
-            lesson.pdf_path = path
-            await session.commit()
-
 
 @router.post("/generate", response_model=lesson_schema.LessonOut)
 async def generate_lesson(
@@ -46,7 +44,27 @@ async def generate_lesson(
     Generate or Retrieve a lesson.
     If it exists for this path, return it.
     If not, generate content via LLM, save, and trigger PDF gen in background.
+    Either way the following lessons may be prefetched (LESSON_PREFETCH_ENABLED).
     """
+    # Only the owner's opens count for (and start) prefetches
+    course_res = await db.execute(
+        select(Course).where(
+            Course.id == lesson_in.course_id, Course.user_id == current_user.id
+        )
+    )
+    course = course_res.scalars().first()
+    if not course:
+        raise HTTPException(status_code=404, detail="Course not found")
+
+    lesson_prefetcher.record_open(lesson_in.course_id, lesson_in.path_in_index)
+    background_tasks.add_task(
+        lesson_prefetcher.schedule,
+        lesson_in.course_id,
+        lesson_in.path_in_index,
+        current_user,
+        lesson_in.use_web_research,
+    )
+
     # Check if exists
     result = await db.execute(
         select(Lesson)
@@ -61,57 +79,160 @@ async def generate_lesson(
     if existing_lesson:
         return existing_lesson
 
-    # Get Course for context
-    course_res = await db.execute(
-        select(Course).where(
-            Course.id == lesson_in.course_id, Course.user_id == current_user.id
-        )
-    )
-    course = course_res.scalars().first()
-    if not course:
-        raise HTTPException(status_code=404, detail="Course not found")
-
-    # Generate Content
+    # Generate Content (joins an in-flight generation for the same path, if any)
     try:
         language = getattr(course, "language", "en")  # Default to 'en' if not set
-        content = await LLMService.generate_lesson_content(
+        new_lesson, created = await lesson_service.generate_lesson(
+            course.id,
             course.title,
-            lesson_in.title,
             course.index_json,
             language,
-            use_web_research=lesson_in.use_web_research,
+            lesson_in.title,
+            lesson_in.path_in_index,
             user=current_user,
+            use_web_research=lesson_in.use_web_research,
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"LLM Generation failed: {str(e)}")
 
-    # Save Lesson
-    new_lesson = Lesson(
-        course_id=lesson_in.course_id,
-        title=lesson_in.title,
-        path_in_index=lesson_in.path_in_index,
-        content_markdown=content,
-    )
-    db.add(new_lesson)
-    await db.commit()
-    await db.refresh(new_lesson)
-
-    # Trigger PDF Gen (Need a way to pass session maker or handle DB update in BG)
-    from app.core.db import AsyncSessionLocal
+    if not created:
+        return new_lesson
 
+    # Trigger PDF Gen
     background_tasks.add_task(
         generate_pdf_background,
         new_lesson.id,
-        content,
+        new_lesson.content_markdown,
         current_user.id,
         course.title,
         lesson_in.title,
-        AsyncSessionLocal,
     )
 
     return new_lesson
 
 
+@router.post("/generate/stream")
+async def generate_lesson_stream(
+    lesson_in: lesson_schema.LessonCreate,
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(deps.get_current_user),
+    db: AsyncSession = Depends(get_db),
+) -> Any:
+    """
+    Streaming variant of /generate using Server-Sent Events.
+    Emits `status` right away, `delta` events ({"content": ...}) as tokens
+    arrive, then a final `lesson` event with the saved lesson.
+    If the lesson already exists only the `lesson` event is sent.
+    Failures after the stream has started are reported as an `error` event.
+    """
+    # Only the owner's opens count for (and start) prefetches
+    course_res = await db.execute(
+        select(Course).where(
+            Course.id == lesson_in.course_id, Course.user_id == current_user.id
+        )
+    )
+    course = course_res.scalars().first()
+    if not course:
+        raise HTTPException(status_code=404, detail="Course not found")
+
+    lesson_prefetcher.record_open(lesson_in.course_id, lesson_in.path_in_index)
+    background_tasks.add_task(
+        lesson_prefetcher.schedule,
+        lesson_in.course_id,
+        lesson_in.path_in_index,
+        current_user,
+        lesson_in.use_web_research,
+    )
+
+    # Check if exists
+    result = await db.execute(
+        select(Lesson)
+        .join(Course)
+        .where(
+            Lesson.course_id == lesson_in.course_id,
+            Lesson.path_in_index == lesson_in.path_in_index,
+            Course.user_id == current_user.id,
+        )
+    )
+    existing_lesson = result.scalars().first()
+    if existing_lesson:
+        lesson_out = lesson_schema.LessonOut.model_validate(existing_lesson)
+
+        async def existing_events():
+            yield sse_event(lesson_out.model_dump(mode="json"), event="lesson")
+
+        return sse_response(existing_events(), background=background_tasks)
+
+    course_title = course.title
+    index_json = course.index_json
+    language = getattr(course, "language", "en")
+    user_id = current_user.id
+    flight_key = (lesson_in.course_id, lesson_in.path_in_index)
+
+    async def events():
+        yield sse_event({"status": "generating"}, event="status")
+
+        # Someone is already generating this lesson: wait for it instead
+        in_flight = lesson_service.lesson_flights.in_flight(flight_key)
+        if in_flight is not None:
+            await asyncio.wait([in_flight])
+            if not in_flight.cancelled():
+                if in_flight.exception():
+                    yield sse_event(
+                        {"detail": f"LLM Generation failed: {in_flight.exception()}"},
+                        event="error",
+                    )
+                    return
+                lesson = in_flight.result()[0]
+                lesson_out = lesson_schema.LessonOut.model_validate(lesson)
+                yield sse_event(lesson_out.model_dump(mode="json"), event="lesson")
+                return
+            # The other generation was abandoned, produce the lesson here
+
+        flight = lesson_service.lesson_flights.claim(flight_key)
+        parts = []
+        try:
+            async for delta in LLMService.stream_lesson_content(
+                course_title,
+                lesson_in.title,
+                index_json,
+                language,
+                use_web_research=lesson_in.use_web_research,
+                user=current_user,
+                lesson_path=lesson_in.path_in_index,
+            ):
+                parts.append(delta)
+                yield sse_event({"content": delta}, event="delta")
+
+            content = "".join(parts).strip()
+            new_lesson, created = await lesson_service.store_lesson(
+                lesson_in.course_id,
+                lesson_in.title,
+                lesson_in.path_in_index,
+                content,
+            )
+        except Exception as e:
+            flight.set_exception(e)
+            yield sse_event(
+                {"detail": f"LLM Generation failed: {str(e)}"}, event="error"
+            )
+            return
+        except BaseException:
+            # Client went away (cancellation / generator closed): release waiters
+            flight.cancel()
+            raise
+        flight.set_result((new_lesson, created))
+
+        if created:
+            # Detached: background tasks are skipped if the client disconnects
+            lesson_service.queue_lesson_pdf(new_lesson, user_id, course_title)
+
+        lesson_out = lesson_schema.LessonOut.model_validate(new_lesson)
+        yield sse_event(lesson_out.model_dump(mode="json"), event="lesson")
+
+    return sse_response(events(), background=background_tasks)
+
+
 @router.put("/{lesson_id}", response_model=lesson_schema.LessonOut)
 async def update_lesson(
     lesson_id: int,
@@ -197,6 +318,8 @@ async def regenerate_lesson(
             language,
             user_feedback,
             user=current_user,
+            use_cache=False,  # A regeneration must never return the old content
+            lesson_path=lesson.path_in_index,
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"LLM Generation failed: {str(e)}")
@@ -206,10 +329,12 @@ async def regenerate_lesson(
     lesson.pdf_path = None  # Reset PDF path since we need to regenerate it
     await db.commit()
     await db.refresh(lesson)
+    question_cache.invalidate(lesson.id)  # Answers were about the old content
+    lesson_retrieval.index_lesson(lesson.id, content)
+    epub_builder.prepare_chapter(content, lesson.path_in_index)
+    render_cache.evict_course(current_user.id, course.id)
 
     # Trigger PDF regeneration
-    from app.core.db import AsyncSessionLocal
-
     background_tasks.add_task(
         generate_pdf_background,
         lesson.id,
@@ -217,7 +342,6 @@ async def regenerate_lesson(
         current_user.id,
         course.title,
         lesson.title,
-        AsyncSessionLocal,
     )
 
     return lesson
@@ -232,6 +356,7 @@ async def ask_question(
 ) -> Any:
     """
     Ask a question about a lesson and get an LLM-generated answer.
+    A near-identical earlier question reuses its answer (QUESTION_CACHE_ENABLED).
     """
     # Get lesson and verify ownership
     result = await db.execute(
@@ -247,19 +372,26 @@ async def ask_question(
     course_res = await db.execute(select(Course).where(Course.id == lesson.course_id))
     course = course_res.scalars().first()
 
-    # Generate answer using LLM
-    try:
-        answer = await LLMService.answer_lesson_question(
-            lesson_title=lesson.title,
-            lesson_content=lesson.content_markdown,
-            question=question_in.question,
-            language=getattr(course, "language", "en"),
-            user=current_user,
-        )
-    except Exception as e:
-        raise HTTPException(
-            status_code=500, detail=f"Failed to generate answer: {str(e)}"
-        )
+    cached = question_cache.lookup(
+        lesson_id, lesson.content_markdown, question_in.question
+    )
+    if cached:
+        answer = cached[1]
+    else:
+        # Generate answer using LLM
+        try:
+            answer = await LLMService.answer_lesson_question(
+                lesson_title=lesson.title,
+                lesson_content=lesson.content_markdown,
+                question=question_in.question,
+                language=getattr(course, "language", "en"),
+                user=current_user,
+                lesson_id=lesson_id,
+            )
+        except Exception as e:
+            raise HTTPException(
+                status_code=500, detail=f"Failed to generate answer: {str(e)}"
+            )
 
     # Save question and answer to database
     question_obj = LessonQuestion(
@@ -271,7 +403,114 @@ async def ask_question(
     await db.commit()
     await db.refresh(question_obj)
 
-    return question_obj
+    if not cached:
+        question_cache.add(
+            lesson_id,
+            lesson.content_markdown,
+            question_obj.id,
+            question_in.question,
+            answer,
+        )
+    question_out = lesson_schema.QuestionOut.model_validate(question_obj)
+    question_out.cached = bool(cached)
+    return question_out
+
+
+@router.post("/{lesson_id}/ask/stream")
+async def ask_question_stream(
+    lesson_id: int,
+    question_in: lesson_schema.QuestionCreate,
+    current_user: User = Depends(deps.get_current_user),
+    db: AsyncSession = Depends(get_db),
+) -> Any:
+    """
+    Streaming variant of /ask using Server-Sent Events.
+    Emits `status` right away, `delta` events while the answer is generated
+    and a final `question` event once the answer has been saved. A cached
+    answer is sent as a single delta.
+    If the client disconnects the upstream completion is cancelled and
+    nothing is saved.
+    """
+    from app.core.db import AsyncSessionLocal
+
+    # Get lesson and verify ownership
+    result = await db.execute(
+        select(Lesson)
+        .join(Course)
+        .where(Lesson.id == lesson_id, Course.user_id == current_user.id)
+    )
+    lesson = result.scalars().first()
+    if not lesson:
+        raise HTTPException(status_code=404, detail="Lesson not found")
+
+    # Get course for language
+    course_res = await db.execute(select(Course).where(Course.id == lesson.course_id))
+    course = course_res.scalars().first()
+
+    lesson_title = lesson.title
+    lesson_content = lesson.content_markdown
+    language = getattr(course, "language", "en")
+
+    cached = question_cache.lookup(lesson_id, lesson_content, question_in.question)
+
+    async def events():
+        yield sse_event({"status": "answering"}, event="status")
+
+        parts = []
+        if cached:
+            parts.append(cached[1])
+            yield sse_event({"content": cached[1]}, event="delta")
+        answer_stream = LLMService.stream_lesson_answer(
+            lesson_title=lesson_title,
+            lesson_content=lesson_content,
+            question=question_in.question,
+            language=language,
+            user=current_user,
+            lesson_id=lesson_id,
+        )
+        try:
+            if not cached:
+                async for delta in answer_stream:
+                    parts.append(delta)
+                    yield sse_event({"content": delta}, event="delta")
+        except asyncio.CancelledError:
+            logger.info(
+                "Client disconnected, cancelled answer for lesson %s", lesson_id
+            )
+            raise
+        except Exception as e:
+            yield sse_event(
+                {"detail": f"Failed to generate answer: {str(e)}"}, event="error"
+            )
+            return
+        finally:
+            # Closes the upstream completion if we stopped early
+            await answer_stream.aclose()
+
+        # Save question and answer to database
+        async with AsyncSessionLocal() as session:
+            question_obj = LessonQuestion(
+                lesson_id=lesson_id,
+                question=question_in.question,
+                answer="".join(parts).strip(),
+            )
+            session.add(question_obj)
+            await session.commit()
+            await session.refresh(question_obj)
+
+        if not cached:
+            question_cache.add(
+                lesson_id,
+                lesson_content,
+                question_obj.id,
+                question_in.question,
+                question_obj.answer,
+            )
+        question_out = lesson_schema.QuestionOut.model_validate(question_obj)
+        question_out.cached = bool(cached)
+        yield sse_event(question_out.model_dump(mode="json"), event="question")
+
+    return sse_response(events())
 
 
 @router.get("/{lesson_id}/questions", response_model=list[lesson_schema.QuestionOut])
@@ -338,5 +577,6 @@ async def delete_question(
     # Delete the question
     await db.delete(question)
     await db.commit()
+    question_cache.remove(lesson_id, question_id)
 
     return {"message": "Question deleted successfully"}
@@ -0,0 +1,155 @@
+from datetime import datetime, timedelta
+from typing import Any
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy import case, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.api import deps
+from app.core.db import get_db
+from app.models.base import LLMUsage, User
+from app.services.course_context import context_stats
+from app.services.lesson_prefetch import lesson_prefetcher
+from app.services.lesson_retrieval import retrieval_stats
+from app.services.llm_limiter import limiter_snapshots
+from app.services.llm_routing import latency_tracker, routing_stats
+from app.services.llm_service import _pool_key, visible_providers
+from app.services.question_cache import question_cache
+from app.services.response_cache import llm_response_cache
+from app.services.usage_recorder import usage_recorder
+
+router = APIRouter()
+
+
+@router.get("/cache")
+async def get_llm_cache_stats(
+    current_user: User = Depends(deps.get_current_user),
+) -> Any:
+    """
+    Get LLM response cache statistics (hits/misses per tier, sizes).
+    """
+    return await llm_response_cache.stats()
+
+
+@router.get("/limits")
+async def get_llm_limits(
+    current_user: User = Depends(deps.get_current_user),
+) -> Any:
+    """
+    Get the adaptive concurrency limiters: current window, in-flight calls,
+    queue depth and remaining Retry-After pause per provider endpoint. Other
+    users' custom endpoints are listed without endpoint and key.
+    """
+    visible = {
+        _pool_key(p.api_key, p.base_url) for p in visible_providers(current_user)
+    }
+    return limiter_snapshots(visible)
+
+
+@router.get("/providers")
+async def get_llm_provider_stats(
+    current_user: User = Depends(deps.get_current_user),
+) -> Any:
+    """
+    Get provider routing counters (hedged requests, hedge wins, fallbacks)
+    and the rolling latency percentiles hedging decisions are based on.
+    Other users' custom endpoints are listed as "custom".
+    """
+    visible = {p.name for p in visible_providers(current_user)}
+    return {"routing": routing_stats, "latencies": latency_tracker.snapshot(visible)}
+
+
+@router.get("/context")
+async def get_llm_context_stats(
+    current_user: User = Depends(deps.get_current_user),
+) -> Any:
+    """
+    Get prompt tokens saved by sending compact course outlines instead of
+    the full index with lesson prompts, and retrieved chunks instead of the
+    whole lesson with Q&A prompts (estimates).
+    """
+    return {"lesson_outline": context_stats, "question_retrieval": retrieval_stats}
+
+
+@router.get("/prefetch")
+async def get_lesson_prefetch_stats(
+    current_user: User = Depends(deps.get_current_user),
+) -> Any:
+    """
+    Get lesson prefetch statistics: lessons generated ahead of time and how
+    many of them were actually opened (hit rate).
+    """
+    return lesson_prefetcher.stats()
+
+
+@router.get("/questions")
+async def get_question_cache_stats(
+    current_user: User = Depends(deps.get_current_user),
+) -> Any:
+    """
+    Get semantic question cache statistics (cached answers, hits, misses).
+    """
+    return question_cache.stats()
+
+
+def _count_if(condition):
+    return case((condition, 1), else_=0)
+
+
+def _usage_row(row) -> dict:
+    return {
+        "calls": row.calls,
+        "failed": row.failed or 0,
+        "cache_hits": row.cache_hits or 0,
+        "prompt_tokens": row.prompt_tokens or 0,
+        "completion_tokens": row.completion_tokens or 0,
+        "cached_tokens": row.cached_tokens or 0,
+        "avg_latency_ms": (
+            round(row.avg_latency_ms) if row.avg_latency_ms is not None else None
+        ),
+        "avg_ttft_ms": round(row.avg_ttft_ms) if row.avg_ttft_ms is not None else None,
+    }
+
+
+@router.get("/usage")
+async def get_llm_usage(
+    hours: int = Query(24, ge=1, le=24 * 90),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(deps.get_current_user),
+) -> Any:
+    """
+    Get the current user's LLM usage over the last `hours`: totals plus
+    tokens, latency and time to first token per model and per call site.
+    """
+    since = datetime.utcnow() - timedelta(hours=hours)
+    columns = [
+        func.count(LLMUsage.id).label("calls"),
+        func.sum(_count_if(LLMUsage.success.is_(False))).label("failed"),
+        func.sum(_count_if(LLMUsage.cache_hit.is_(True))).label("cache_hits"),
+        func.sum(LLMUsage.prompt_tokens).label("prompt_tokens"),
+        func.sum(LLMUsage.completion_tokens).label("completion_tokens"),
+        func.sum(LLMUsage.cached_tokens).label("cached_tokens"),
+        func.avg(LLMUsage.latency_ms).label("avg_latency_ms"),
+        func.avg(LLMUsage.ttft_ms).label("avg_ttft_ms"),
+    ]
+    filters = (LLMUsage.user_id == current_user.id, LLMUsage.created_at >= since)
+
+    totals = (await db.execute(select(*columns).where(*filters))).one()
+    by_model = await db.execute(
+        select(LLMUsage.model, *columns).where(*filters).group_by(LLMUsage.model)
+    )
+    by_call_site = await db.execute(
+        select(LLMUsage.call_site, *columns)
+        .where(*filters)
+        .group_by(LLMUsage.call_site)
+    )
+    return {
+        "hours": hours,
+        "totals": _usage_row(totals),
+        "by_model": {row.model: _usage_row(row) for row in by_model},
+        "by_call_site": {row.call_site: _usage_row(row) for row in by_call_site},
+        "recorder": {
+            "recorded": usage_recorder.recorded,
+            "dropped": usage_recorder.dropped,
+        },
+    }
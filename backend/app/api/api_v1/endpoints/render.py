@@ -0,0 +1,39 @@
+from typing import Any
+from fastapi import APIRouter, Depends
+
+from app.api import deps
+from app.models.base import User
+from app.services.epub_builder import epub_chapter_cache, epub_stats
+from app.services.pdf_merge import merge_stats
+from app.services.render_cache import render_cache_stats
+from app.services.render_pool import render_pool
+
+router = APIRouter()
+
+
+@router.get("/pool")
+async def get_render_pool_stats(
+    current_user: User = Depends(deps.get_current_user),
+) -> Any:
+    """
+    Get the render pool state: busy and queued pandoc renders, failures,
+    timeouts and render/queue times.
+    """
+    return render_pool.snapshot()
+
+
+@router.get("/cache")
+async def get_render_cache_stats(
+    current_user: User = Depends(deps.get_current_user),
+) -> Any:
+    """
+    Get full-course render cache statistics: downloads served from a cached
+    artifact, renders run and artifacts evicted, for merged PDFs the lesson
+    PDFs reused or re-rendered, and for EPUBs the lesson chapters reused or
+    converted.
+    """
+    return {
+        **render_cache_stats,
+        "merge": merge_stats,
+        "epub": {**epub_stats, "chapter_cache": await epub_chapter_cache.stats()},
+    }
@@ -3,7 +3,10 @@ from fastapi import APIRouter, Depends
 
 from app.api import deps
 from app.models.base import User
-from app.services.tavily_service import TavilyService
+from app.services.course_research import research_stats
+from app.services.response_cache import tavily_cache
+from app.services.tavily_ledger import ledger_snapshots
+from app.services.tavily_service import TavilyService, search_stats
 
 router = APIRouter()
 
@@ -19,3 +22,29 @@ async def get_tavily_credits(
     """
     tavily = TavilyService.for_user(current_user)
     return await tavily.get_credits_info()
+
+
+@router.get("/ledger")
+async def get_tavily_ledger(
+    current_user: User = Depends(deps.get_current_user),
+) -> Any:
+    """
+    Get the per-key credit ledgers: estimated remaining credits, circuit
+    breaker state and searches skipped because of it.
+    """
+    return ledger_snapshots()
+
+
+@router.get("/cache")
+async def get_tavily_cache_stats(
+    current_user: User = Depends(deps.get_current_user),
+) -> Any:
+    """
+    Get Tavily search cache statistics and the credits it saved, and the
+    course research passes (each replacing a search per lesson).
+    """
+    return {
+        **search_stats,
+        "cache": await tavily_cache.stats(),
+        "course_research": research_stats,
+    }
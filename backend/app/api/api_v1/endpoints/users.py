@@ -7,6 +7,7 @@ from app.core.db import get_db
 from app.core.security import encrypt_value, decrypt_value
 from app.models.base import User
 from app.schemas import user as user_schema
+from app.services.llm_service import invalidate_client
 
 router = APIRouter()
 
@@ -53,6 +54,13 @@ async def update_user_settings(
     Pass null/empty string to clear a setting (reverts to global default).
     API keys are encrypted before storage.
     """
+    # Drop the pooled LLM client built from the old credentials
+    if (
+        settings_in.custom_openai_api_key is not None
+        or settings_in.custom_openai_base_url is not None
+    ):
+        invalidate_client(current_user)
+
     if settings_in.custom_openai_api_key is not None:
         val = settings_in.custom_openai_api_key or None
         current_user.custom_openai_api_key = encrypt_value(val) if val else None
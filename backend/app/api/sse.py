@@ -0,0 +1,37 @@
+"""
+Helpers for Server-Sent Events (text/event-stream) responses.
+"""
+
+import json
+from typing import Any, AsyncIterator, Optional
+
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTasks
+
+# Disable proxy buffering (nginx) and caching so events reach the client immediately
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no",
+}
+
+
+def sse_event(data: Any, event: Optional[str] = None) -> str:
+    """Format a single SSE message with a JSON payload."""
+    message = ""
+    if event:
+        message += f"event: {event}\n"
+    message += f"data: {json.dumps(data, default=str)}\n\n"
+    return message
+
+
+def sse_response(
+    events: AsyncIterator[str], background: Optional[BackgroundTasks] = None
+) -> StreamingResponse:
+    """Wrap an async iterator of formatted events in a streaming response."""
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+        background=background,
+    )
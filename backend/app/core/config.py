@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Dict, List, Optional
 
 
 class Settings(BaseSettings):
@@ -16,10 +16,129 @@ class Settings(BaseSettings):
     DEFAULT_LANGUAGE: str = "en"  # en or it
     MAX_CONCURRENT_WORKERS: int = 3
 
+    # LLM HTTP client pool (one pooled client per api_key/base_url pair)
+    LLM_HTTP2: bool = True
+    LLM_MAX_CONNECTIONS: int = 100
+    LLM_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    LLM_KEEPALIVE_EXPIRY: float = 30.0  # Seconds an idle connection is kept open
+    LLM_CONNECT_TIMEOUT: float = 10.0
+    LLM_READ_TIMEOUT: float = 300.0
+    LLM_CLIENT_IDLE_TTL: int = 900  # Close clients unused for this many seconds
+
+    # Adaptive LLM concurrency, shared per provider endpoint + key.
+    # MAX_CONCURRENT_WORKERS is the starting window.
+    LLM_CONCURRENCY_MIN: int = 1
+    LLM_CONCURRENCY_MAX: int = 16
+    LLM_LATENCY_TARGET: float = 120.0  # Slower successful calls shrink the window
+    LLM_MAX_RETRIES: int = 3
+    LLM_THROTTLE_BACKOFF: float = 2.0  # Pause after a 429 without Retry-After
+
+    # Provider chains per call type, as JSON. LLM_PROVIDERS maps a name to
+    # {"base_url", "api_key", "model"}; LLM_PROVIDER_CHAINS maps a call site
+    # ("index", "lesson", "prefetch", "question" or "default") to provider
+    # names in order, "default" being the OPENAI_* endpoint.
+    LLM_PROVIDERS: Dict[str, Dict[str, str]] = {}
+    LLM_PROVIDER_CHAINS: Dict[str, List[str]] = {}
+    LLM_CUSTOM_ENDPOINT_FALLBACK: bool = False  # Fall back from users' own endpoints
+    # Hedging: after the primary's rolling percentile latency, ask the next one.
+    # A hedge pays for both calls: enable it together with a provider chain.
+    LLM_HEDGE_ENABLED: bool = False
+    LLM_HEDGE_PERCENTILE: float = 0.95
+    LLM_HEDGE_WINDOW: int = 200  # Latency samples kept per provider and call site
+    LLM_HEDGE_MIN_SAMPLES: int = 20  # No hedging before this many samples
+    LLM_HEDGE_MIN_DELAY: float = 2.0
+
+    # LLM usage telemetry, written to llm_usage in batches
+    LLM_USAGE_BATCH_SIZE: int = 50
+    LLM_USAGE_FLUSH_INTERVAL: float = 5.0
+    LLM_USAGE_MAX_PENDING: int = 10000
+    LLM_STREAM_USAGE: bool = True  # Ask for usage in streams (stream_options)
+
+    # Bulk lesson generation pipeline: workers per stage and queue size
+    # between stages. LLM calls are further bounded by the adaptive limiter,
+    # renders by the render pool.
+    PIPELINE_RESEARCH_WORKERS: int = 4
+    PIPELINE_LLM_WORKERS: int = 16
+    PIPELINE_RENDER_WORKERS: int = 2
+    PIPELINE_QUEUE_SIZE: int = 8
+
+    # Pandoc render pool, shared by every PDF/EPUB render in the process
+    RENDER_WORKERS: int = 2  # Concurrent pandoc processes
+    RENDER_QUEUE_SIZE: int = 32  # Waiting renders before submitters block
+    RENDER_TIMEOUT: int = 120  # Seconds per pandoc run
+    RENDER_CACHE_ENABLED: bool = True  # Reuse full-course PDFs/EPUBs by content hash
+    # Full-course PDF: "merge" the lesson PDFs behind a cover (pypdf), or
+    # "typeset" the whole course in one pandoc run
+    FULL_PDF_MODE: str = "merge"
+    # Full-course EPUB: assembled from per-lesson XHTML "chapters", cached by
+    # content hash when lessons are saved, or "pandoc" over the whole course
+    FULL_EPUB_MODE: str = "chapters"
+    EPUB_CHAPTER_CACHE_BACKENDS: str = "memory,database"
+    EPUB_CHAPTER_CACHE_TTL: int = 30 * 24 * 3600
+
+    # Offline lesson generation through the provider Batch API (mode="batch")
+    LLM_BATCH_COMPLETION_WINDOW: str = "24h"
+    LLM_BATCH_POLL_INTERVAL: float = 30.0
+    LLM_BATCH_MAX_WAIT: int = 26 * 3600  # Cancel the batch after this many seconds
+
+    # Speculative generation of the next lessons in index order (opt-in)
+    LESSON_PREFETCH_ENABLED: bool = False
+    LESSON_PREFETCH_COUNT: int = 1  # Lessons ahead of the one being read
+    LESSON_PREFETCH_PER_USER: int = 1  # Concurrent prefetches per user
+
+    # Q&A prompts get the lesson chunks relevant to the question (BM25)
+    LESSON_CHUNK_TOKENS: int = 300
+    LESSON_QA_CONTEXT_TOKENS: int = 1000
+    LESSON_QA_TOP_K: int = 4
+    LESSON_INDEX_CACHE_SIZE: int = 256  # Lessons whose chunk index is kept
+
+    # Course research mode: a few broad searches per course, retrieved per lesson
+    COURSE_RESEARCH_QUERIES: int = 5  # Topic overview + up to 4 modules
+    COURSE_RESEARCH_RESULTS_PER_QUERY: int = 5
+    COURSE_RESEARCH_MAX_DOC_CHARS: int = 20000  # Raw page content kept per source
+    COURSE_RESEARCH_CONTEXT_TOKENS: int = 1500
+    COURSE_RESEARCH_TOP_K: int = 6
+    COURSE_RESEARCH_INDEX_CACHE_SIZE: int = 32  # Courses whose index is kept
+
+    # Per-lesson semantic cache of Q&A answers (opt-in)
+    QUESTION_CACHE_ENABLED: bool = False
+    QUESTION_CACHE_THRESHOLD: float = 0.85  # Cosine similarity for a hit
+    QUESTION_CACHE_TTL: int = 7 * 24 * 3600
+    QUESTION_CACHE_MAX_PER_LESSON: int = 200
+
+    # Lesson prompts get an outline of the index around the lesson, not all of it
+    LLM_COMPACT_CONTEXT: bool = True
+    LLM_LESSON_CONTEXT_TOKENS: int = 800
+
+    # LLM response cache (opt-in). Tiers are looked up in order, fastest first.
+    LLM_CACHE_ENABLED: bool = False
+    LLM_CACHE_BACKENDS: str = "memory,database"
+    LLM_CACHE_TTL: int = 7 * 24 * 3600
+    CACHE_MEMORY_MAX_ENTRIES: int = 512
+    CACHE_DB_MAX_ENTRIES: int = 10000
+
     # Tavily Web Search
     TAVILY_API_KEY: Optional[str] = None
     TAVILY_ENABLED: bool = False
+    TAVILY_BASE_URL: str = "https://api.tavily.com"
+    TAVILY_TIMEOUT: float = 30.0
+    TAVILY_CONNECT_TIMEOUT: float = 5.0
+    TAVILY_MAX_RETRIES: int = 2  # For 429s, 5xx and connection errors
+    TAVILY_MAX_CONNECTIONS: int = 20
+
+    # Tavily search cache, shared by all users. Question searches may be
+    # about current events, so they expire much sooner.
+    TAVILY_CACHE_ENABLED: bool = True
+    TAVILY_CACHE_BACKENDS: str = "memory,database"
+    TAVILY_CACHE_TTL_COURSE: int = 7 * 24 * 3600
+    TAVILY_CACHE_TTL_LESSON: int = 7 * 24 * 3600
+    TAVILY_CACHE_TTL_QUESTION: int = 6 * 3600
+
+    # Tavily credit ledger and circuit breaker, per API key
     TAVILY_CREDIT_THRESHOLD: int = 10  # Stop using Tavily if credits below this
+    TAVILY_CREDIT_RECONCILE_INTERVAL: int = 300  # Seconds between /usage syncs
+    TAVILY_BREAKER_FAILURES: int = 3  # Consecutive failures that open the breaker
+    TAVILY_BREAKER_COOLDOWN: float = 60.0
 
     class Config:
         case_sensitive = True
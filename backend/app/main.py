@@ -1,10 +1,13 @@
 from fastapi import FastAPI
 from app.core.config import settings
 from fastapi.staticfiles import StaticFiles
+import logging
 import os
 
 from fastapi.middleware.cors import CORSMiddleware
 
+logger = logging.getLogger(__name__)
+
 app = FastAPI(
     title=settings.PROJECT_NAME, openapi_url=f"{settings.API_V1_STR}/openapi.json"
 )
@@ -35,6 +38,31 @@ async def startup():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
 
+    # create_all skips existing tables, so add indexes introduced later explicitly
+    from app.models.base import Lesson
+
+    for index in Lesson.__table__.indexes:
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(lambda c: index.create(c, checkfirst=True))
+        except Exception as e:
+            logger.warning(
+                "Could not create index %s (duplicate rows?): %s", index.name, e
+            )
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    from app.services.llm_service import close_clients
+    from app.services.render_pool import render_pool
+    from app.services.tavily_service import close_client as close_tavily_client
+    from app.services.usage_recorder import usage_recorder
+
+    await usage_recorder.stop()  # Flush pending usage records
+    await close_clients()
+    await close_tavily_client()
+    await render_pool.close()
+
 
 @app.get("/")
 def read_root():
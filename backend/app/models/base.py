@@ -1,4 +1,13 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, TIMESTAMP, Boolean
+from sqlalchemy import (
+    Column,
+    Integer,
+    String,
+    Text,
+    ForeignKey,
+    TIMESTAMP,
+    Boolean,
+    Index,
+)
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.core.db import Base
@@ -34,6 +43,10 @@ class Course(Base):
 
 class Lesson(Base):
     __tablename__ = "lessons"
+    # One lesson per index path, concurrent generations rely on this
+    __table_args__ = (
+        Index("uq_lessons_course_path", "course_id", "path_in_index", unique=True),
+    )
     id = Column(Integer, primary_key=True, index=True)
     course_id = Column(Integer, ForeignKey("courses.id"))
     title = Column(String)
@@ -60,3 +73,41 @@ class LessonQuestion(Base):
     created_at = Column(TIMESTAMP, server_default=func.now())
 
     lesson = relationship("Lesson", back_populates="questions")
+
+
+class CourseResearch(Base):
+    __tablename__ = "course_research"
+    id = Column(Integer, primary_key=True, index=True)
+    course_id = Column(Integer, ForeignKey("courses.id"), nullable=False, index=True)
+    query = Column(Text)  # Search that found this source
+    title = Column(String)
+    url = Column(String)
+    content = Column(Text)  # Raw page content (or the snippet if none)
+    created_at = Column(TIMESTAMP, server_default=func.now())
+
+
+class CacheEntry(Base):
+    __tablename__ = "cache_entries"
+    namespace = Column(String, primary_key=True)  # e.g. "llm"
+    key = Column(String, primary_key=True)  # Content hash
+    value = Column(Text, nullable=False)
+    expires_at = Column(TIMESTAMP, nullable=False, index=True)
+    created_at = Column(TIMESTAMP, server_default=func.now(), index=True)
+
+
+class LLMUsage(Base):
+    __tablename__ = "llm_usage"
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True, index=True)
+    call_site = Column(String, index=True)  # "index", "lesson", "question", ...
+    model = Column(String, index=True)
+    endpoint = Column(String)
+    prompt_tokens = Column(Integer, default=0)
+    completion_tokens = Column(Integer, default=0)
+    cached_tokens = Column(Integer, default=0)
+    latency_ms = Column(Integer)
+    ttft_ms = Column(Integer, nullable=True)  # Time to first token (streaming only)
+    streamed = Column(Boolean, default=False)
+    cache_hit = Column(Boolean, default=False)  # Served by the response cache
+    success = Column(Boolean, default=True)
+    created_at = Column(TIMESTAMP, server_default=func.now(), index=True)
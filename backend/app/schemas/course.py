@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Optional, Any
+from typing import List, Literal, Optional, Any
 from datetime import datetime
 
 
@@ -62,3 +62,9 @@ class CourseReorder(BaseModel):
 
 class GenerateAllLessonsRequest(BaseModel):
     use_web_research: Optional[bool] = False
+    # "batch" submits all missing lessons to the provider Batch API: cheaper,
+    # not rate limited, but results can take hours
+    mode: Literal["interactive", "batch"] = "interactive"
+    # With web research: "lesson" searches once per lesson, "course" runs a
+    # few broad searches once and retrieves each lesson's context locally
+    research_mode: Literal["lesson", "course"] = "lesson"
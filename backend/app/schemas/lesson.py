@@ -40,5 +40,6 @@ class QuestionOut(BaseModel):
     question: str
     answer: str
     created_at: datetime
+    cached: bool = False  # Answer reused from a similar earlier question
 
     model_config = {"from_attributes": True}
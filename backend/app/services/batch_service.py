@@ -0,0 +1,281 @@
+"""
+Batch Service
+Generates the missing lessons of a course through the provider Batch API:
+one JSONL request file is uploaded and submitted, the batch is polled in the
+background and the results are bulk-inserted into lessons. Much cheaper than
+interactive calls and not subject to rate limits, at the cost of latency
+(up to LLM_BATCH_COMPLETION_WINDOW).
+"""
+
+import asyncio
+import json
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+import openai
+from openai.types.chat import ChatCompletion
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.future import select
+
+from app.core.config import settings
+from app.core.db import AsyncSessionLocal
+from app.models.base import Lesson
+from app.services import epub_builder, lesson_retrieval, lesson_service
+from app.services.llm_service import LLMService, _get_client, _get_model, _record_usage
+
+logger = logging.getLogger(__name__)
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+FINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+class BatchUnavailable(Exception):
+    """The provider rejected the batch submission (e.g. no Batch API support)."""
+
+
+async def build_batch_file(
+    course_title: str,
+    index_json: str,
+    language: str,
+    lessons: List[dict],
+    user=None,
+    use_web_research: bool = False,
+    research_contexts: Optional[Dict[str, str]] = None,
+) -> Tuple[bytes, Dict[str, dict]]:
+    """
+    Build the JSONL request file for the given lessons ({"title", "path"}).
+    research_contexts (by lesson path) replace per-lesson web searches.
+    Returns (file content, lessons by custom_id).
+    """
+    semaphore = asyncio.Semaphore(settings.MAX_CONCURRENT_WORKERS)
+
+    async def build_prompt(lesson: dict) -> str:
+        async with semaphore:  # Web research runs per lesson
+            return await LLMService._build_lesson_prompt(
+                course_title,
+                lesson["title"],
+                index_json,
+                language,
+                use_web_research=use_web_research,
+                user=user,
+                lesson_path=lesson["path"],
+                research_context=(research_contexts or {}).get(lesson["path"]),
+            )
+
+    prompts = await asyncio.gather(*(build_prompt(lesson) for lesson in lessons))
+
+    model = _get_model(user)
+    lines = []
+    by_custom_id = {}
+    for i, (lesson, prompt) in enumerate(zip(lessons, prompts)):
+        custom_id = f"lesson-{i}"
+        by_custom_id[custom_id] = lesson
+        lines.append(
+            json.dumps(
+                {
+                    "custom_id": custom_id,
+                    "method": "POST",
+                    "url": BATCH_ENDPOINT,
+                    "body": {
+                        "model": model,
+                        "messages": [{"role": "user", "content": prompt}],
+                        "temperature": 0.7,
+                    },
+                }
+            )
+        )
+    return ("\n".join(lines) + "\n").encode("utf-8"), by_custom_id
+
+
+async def submit_batch(user, content: bytes, metadata: Dict[str, str]) -> str:
+    """Upload the request file and create the batch. Returns the batch id."""
+    client = _get_client(user)
+    try:
+        input_file = await client.files.create(
+            file=("lessons.jsonl", content, "application/jsonl"), purpose="batch"
+        )
+        batch = await client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window=settings.LLM_BATCH_COMPLETION_WINDOW,
+            metadata=metadata,
+        )
+    except (openai.APIStatusError, openai.APIConnectionError) as e:
+        raise BatchUnavailable(str(e)) from e
+    logger.info(f"Submitted LLM batch {batch.id}")
+    return batch.id
+
+
+async def wait_for_batch(user, batch_id: str, status: Optional[dict] = None):
+    """
+    Poll the batch until it reaches a final status, cancelling it after
+    LLM_BATCH_MAX_WAIT seconds. Progress is mirrored into `status`.
+    """
+    client = _get_client(user)
+    deadline = time.monotonic() + settings.LLM_BATCH_MAX_WAIT
+    cancel_requested = False
+    while True:
+        try:
+            batch = await client.batches.retrieve(batch_id)
+        except (openai.APIStatusError, openai.APIConnectionError) as e:
+            logger.warning(f"Polling LLM batch {batch_id} failed: {e}")
+        else:
+            if status is not None:
+                status["batch_status"] = batch.status
+                if batch.request_counts:
+                    status["batch_completed"] = batch.request_counts.completed
+                    status["batch_failed"] = batch.request_counts.failed
+            if batch.status in FINAL_STATUSES:
+                return batch
+            if time.monotonic() > deadline and not cancel_requested:
+                logger.warning(f"LLM batch {batch_id} timed out, cancelling")
+                cancel_requested = True
+                try:
+                    await client.batches.cancel(batch_id)
+                except (openai.APIStatusError, openai.APIConnectionError) as e:
+                    logger.warning(f"Cancelling LLM batch {batch_id} failed: {e}")
+        await asyncio.sleep(settings.LLM_BATCH_POLL_INTERVAL)
+
+
+async def fetch_results(
+    user, batch, by_custom_id: Dict[str, dict], submitted_at: float
+) -> Tuple[Dict[str, str], Dict[str, str]]:
+    """
+    Download and parse the batch output and error files.
+    Returns (content by lesson path, error by lesson path). Lessons missing
+    from both files (expired or cancelled batches) are reported as errors.
+    """
+    client = _get_client(user)
+    contents: Dict[str, str] = {}
+    errors: Dict[str, str] = {}
+
+    lines = []
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if file_id:
+            response = await client.files.content(file_id)
+            lines.extend(response.text.splitlines())
+
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            result = json.loads(line)
+        except ValueError:
+            logger.warning(f"Skipping malformed batch result line: {line[:200]}")
+            continue
+        lesson = by_custom_id.get(result.get("custom_id"))
+        if lesson is None:
+            continue
+
+        response = result.get("response") or {}
+        if result.get("error") or response.get("status_code") != 200:
+            error = result.get("error") or response.get("body", {}).get("error")
+            errors[lesson["path"]] = str(error or "Request failed")
+            continue
+        try:
+            completion = ChatCompletion.model_validate(response["body"])
+            content = completion.choices[0].message.content
+        except (KeyError, IndexError, ValueError) as e:
+            errors[lesson["path"]] = f"Invalid response: {e}"
+            continue
+        _record_usage(user, "lesson_batch", submitted_at, usage=completion.usage)
+        if content and content.strip():
+            contents[lesson["path"]] = content.strip()
+        else:
+            errors[lesson["path"]] = "Empty response"
+
+    for lesson in by_custom_id.values():
+        if lesson["path"] not in contents and lesson["path"] not in errors:
+            errors[lesson["path"]] = f"No result (batch {batch.status})"
+    return contents, errors
+
+
+async def insert_lessons(
+    course_id: int, lessons: List[dict], contents: Dict[str, str]
+) -> List[Lesson]:
+    """
+    Bulk-insert generated lessons, skipping paths that already have a row
+    (e.g. generated interactively while the batch was running).
+    Returns the newly created lessons.
+    """
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            select(Lesson.path_in_index).where(Lesson.course_id == course_id)
+        )
+        existing = set(result.scalars().all())
+        new_lessons = [
+            Lesson(
+                course_id=course_id,
+                title=lesson["title"],
+                path_in_index=lesson["path"],
+                content_markdown=contents[lesson["path"]],
+            )
+            for lesson in lessons
+            if lesson["path"] in contents and lesson["path"] not in existing
+        ]
+        session.add_all(new_lessons)
+        try:
+            await session.commit()
+        except IntegrityError:
+            # Lost a race with an interactive generation: fall back to row by row
+            await session.rollback()
+        else:
+            for lesson in new_lessons:
+                await session.refresh(lesson)
+                lesson_retrieval.index_lesson(lesson.id, lesson.content_markdown)
+                epub_builder.prepare_chapter(
+                    lesson.content_markdown, lesson.path_in_index
+                )
+            return new_lessons
+
+    created = []
+    for lesson in new_lessons:
+        stored, was_created = await lesson_service.store_lesson(
+            course_id, lesson.title, lesson.path_in_index, lesson.content_markdown
+        )
+        if was_created:
+            created.append(stored)
+    return created
+
+
+async def generate_lessons_batch(
+    course_id: int,
+    course_title: str,
+    index_json: str,
+    language: str,
+    lessons: List[dict],
+    user=None,
+    status: Optional[dict] = None,
+    use_web_research: bool = False,
+    research_contexts: Optional[Dict[str, str]] = None,
+) -> Tuple[List[Lesson], Dict[str, str]]:
+    """
+    Generate the given lessons through one provider batch.
+    Returns (created lessons, error by lesson path).
+    Raises BatchUnavailable if the provider does not accept the batch.
+    """
+    content, by_custom_id = await build_batch_file(
+        course_title,
+        index_json,
+        language,
+        lessons,
+        user,
+        use_web_research,
+        research_contexts,
+    )
+    submitted_at = time.monotonic()
+    batch_id = await submit_batch(
+        user, content, {"course_id": str(course_id), "kind": "lessons"}
+    )
+    if status is not None:
+        status["batch_id"] = batch_id
+
+    batch = await wait_for_batch(user, batch_id, status)
+    contents, errors = await fetch_results(user, batch, by_custom_id, submitted_at)
+    created = await insert_lessons(course_id, lessons, contents)
+    logger.info(
+        f"LLM batch {batch_id} ({batch.status}): {len(created)} lessons stored, "
+        f"{len(errors)} failed"
+    )
+    return created, errors
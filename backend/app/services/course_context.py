@@ -0,0 +1,174 @@
+"""
+Course Context
+Builds a compact, token-budgeted outline of the course index for lesson
+prompts: every module title, the lessons of the current module and the
+lessons right before and after the one being written. Sending this instead
+of the whole index_json keeps prompt size flat as courses grow.
+"""
+
+import json
+import logging
+from typing import Dict, List, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Running totals, exposed through GET /llm/context
+context_stats: Dict[str, int] = {
+    "builds": 0,
+    "full_tokens": 0,
+    "compact_tokens": 0,
+    "saved_tokens": 0,
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token), good enough for budgeting."""
+    return (len(text) + 3) // 4
+
+
+def _render_outline(
+    modules: List[dict],
+    module_idx: int,
+    lesson_idx: int,
+    prev_lesson: Optional[dict],
+    next_lesson: Optional[dict],
+    module_radius: int,
+    lesson_radius: int,
+) -> str:
+    lines = ["Course modules:"]
+    for i, module in enumerate(modules):
+        if abs(i - module_idx) > module_radius:
+            if abs(i - module_idx) == module_radius + 1:
+                lines.append("  ...")
+            continue
+        marker = "  <- current module" if i == module_idx else ""
+        lines.append(f"- {module.get('title', '')}{marker}")
+
+    current = modules[module_idx]
+    lessons = current.get("lessons", [])
+    lines.append("")
+    lines.append(f"Lessons in the current module ({current.get('title', '')}):")
+    for i, lesson in enumerate(lessons):
+        if abs(i - lesson_idx) > lesson_radius:
+            if abs(i - lesson_idx) == lesson_radius + 1:
+                lines.append("  ...")
+            continue
+        marker = "  <- this lesson" if i == lesson_idx else ""
+        lines.append(f"- {lesson.get('path', '')} {lesson.get('title', '')}{marker}")
+
+    if prev_lesson:
+        lines.append("")
+        lines.append(
+            f"Previous lesson: {prev_lesson.get('path', '')} {prev_lesson.get('title', '')}"
+        )
+    if next_lesson:
+        lines.append(
+            f"Next lesson: {next_lesson.get('path', '')} {next_lesson.get('title', '')}"
+        )
+    return "\n".join(lines)
+
+
+def _is_outline(modules) -> bool:
+    """A list of module objects whose "lessons" are lists of objects."""
+    return isinstance(modules, list) and all(
+        isinstance(module, dict)
+        and isinstance(module.get("lessons", []), list)
+        and all(isinstance(lesson, dict) for lesson in module.get("lessons", []))
+        for module in modules
+    )
+
+
+def build_lesson_context(
+    index_json: str,
+    lesson_path: str,
+    lesson_title: str = None,
+    budget: int = None,
+) -> str:
+    """
+    Return a compact outline of the course around the given lesson, shrunk
+    (far-away modules first, then far-away lessons) until it fits the token
+    budget. Falls back to the raw index if it can't be parsed or the lesson
+    isn't in it.
+    """
+    budget = budget or settings.LLM_LESSON_CONTEXT_TOKENS
+    try:
+        modules = json.loads(index_json)
+    except (TypeError, ValueError):
+        return index_json
+    if not _is_outline(modules):
+        return index_json
+
+    flat = []  # (module_idx, lesson_idx, lesson)
+    for m, module in enumerate(modules):
+        for l, lesson in enumerate(module.get("lessons", [])):
+            flat.append((m, l, lesson))
+
+    position = next(
+        (
+            i
+            for i, (_, _, lesson) in enumerate(flat)
+            if lesson.get("path") == lesson_path
+        ),
+        None,
+    )
+    if position is None and lesson_title:
+        position = next(
+            (
+                i
+                for i, (_, _, lesson) in enumerate(flat)
+                if lesson.get("title") == lesson_title
+            ),
+            None,
+        )
+    if position is None:
+        return index_json
+
+    module_idx, lesson_idx, _ = flat[position]
+    prev_lesson = flat[position - 1][2] if position > 0 else None
+    next_lesson = flat[position + 1][2] if position + 1 < len(flat) else None
+
+    module_radius = len(modules)
+    lesson_radius = len(modules[module_idx].get("lessons", []))
+    outline = _render_outline(
+        modules,
+        module_idx,
+        lesson_idx,
+        prev_lesson,
+        next_lesson,
+        module_radius,
+        lesson_radius,
+    )
+    while estimate_tokens(outline) > budget and (
+        module_radius > 1 or lesson_radius > 1
+    ):
+        if module_radius > 1:
+            module_radius = min(module_radius, len(modules)) // 2
+        else:
+            lesson_radius //= 2
+        outline = _render_outline(
+            modules,
+            module_idx,
+            lesson_idx,
+            prev_lesson,
+            next_lesson,
+            module_radius,
+            lesson_radius,
+        )
+
+    full_tokens = estimate_tokens(index_json)
+    compact_tokens = estimate_tokens(outline)
+    if compact_tokens >= full_tokens:
+        return index_json  # Tiny course, the raw index is already small
+    context_stats["builds"] += 1
+    context_stats["full_tokens"] += full_tokens
+    context_stats["compact_tokens"] += compact_tokens
+    context_stats["saved_tokens"] += max(0, full_tokens - compact_tokens)
+    logger.info(
+        "Course context for %s: %d tokens instead of %d",
+        lesson_path,
+        compact_tokens,
+        full_tokens,
+    )
+    return outline
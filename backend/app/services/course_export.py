@@ -0,0 +1,93 @@
+"""
+Course Export
+Builds the merged markdown of a whole course (title, description, table of
+contents, then every lesson) that the full-course PDF and EPUB are rendered
+from, and the cover that merged PDFs start with.
+"""
+
+import re
+from typing import List
+
+from app.models.base import Course, Lesson
+
+
+def natural_sort_key(path_in_index: str):
+    """
+    Sort helper for path_in_index like '1.1.1', '1.2.1', '10.1.1'
+    """
+    return [
+        int(text) if text.isdigit() else text.lower()
+        for text in re.split("([0-9]+)", path_in_index)
+    ]
+
+
+def sanitize_lesson_markdown(content: str) -> str:
+    """Rewrite lesson markdown that is known to trip Pandoc up."""
+    # Replace smart quotes with regular quotes
+    content = content.replace("\u2018", "'").replace("\u2019", "'")
+    content = content.replace("\u201c", '"').replace("\u201d", '"')
+    content = content.replace("\u2013", "-").replace("\u2014", "--")
+
+    # Remove Pandoc attributes and custom syntax
+    # Remove {.class}, {#id}, {key=value} patterns but preserve Jinja {{ }} syntax
+    # Only match single braces with Pandoc-specific prefixes: . # or key=value
+    content = re.sub(
+        r"\{(?:\.[a-zA-Z0-9_-]+|#[a-zA-Z0-9_-]+|[a-zA-Z_][a-zA-Z0-9_-]*=[^}]+)\}",
+        "",
+        content,
+    )
+
+    # Escape problematic patterns that Pandoc might interpret as metadata
+    # Replace standalone --- with a safe alternative
+    content = re.sub(r"^---$", "___", content, flags=re.MULTILINE)
+
+    # Fix italic Nota patterns that might confuse Pandoc
+    # Replace *Nota * patterns with **Nota ** (bold instead of italic)
+    content = re.sub(r"\*Nota([^*]+)\*", r"**Nota\1**", content)
+    return content
+
+
+def sorted_lessons(lessons: List[Lesson]) -> List[Lesson]:
+    return sorted(lessons, key=lambda l: natural_sort_key(l.path_in_index))
+
+
+def build_cover_markdown(
+    course: Course, lessons: List[Lesson], page_breaks: bool = True
+) -> str:
+    """Title page and table of contents of the course (lessons already sorted)."""
+    newpage = "\\newpage\n\n" if page_breaks else ""
+
+    merged_md_parts = [
+        f"# {course.title}\n\n",
+        f"**Course Description:** {course.description}\n\n",
+        newpage or "\n\n",
+        "# Table of Contents\n\n",
+    ]
+
+    # Add TOC
+    for lesson in lessons:
+        merged_md_parts.append(f"- {lesson.path_in_index}. {lesson.title}\n")
+
+    merged_md_parts.append(f"\n{newpage}" if page_breaks else "\n\n")
+    return "".join(merged_md_parts)
+
+
+def build_course_markdown(
+    course: Course, lessons: List[Lesson], page_breaks: bool = True
+) -> str:
+    """
+    Merge a course's lessons, in natural index order, into one markdown
+    document. page_breaks adds LaTeX \\newpage between sections (PDF only).
+    """
+    lessons = sorted_lessons(lessons)
+    newpage = "\\newpage\n\n" if page_breaks else ""
+    merged_md_parts = [build_cover_markdown(course, lessons, page_breaks)]
+
+    # Add all lesson contents
+    for lesson in lessons:
+        merged_md_parts.append(f"# {lesson.path_in_index}. {lesson.title}\n\n")
+        if lesson.content_markdown:
+            merged_md_parts.append(sanitize_lesson_markdown(lesson.content_markdown))
+        merged_md_parts.append(f"\n\n{newpage}")
+
+    return "".join(merged_md_parts)
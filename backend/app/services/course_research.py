@@ -0,0 +1,245 @@
+"""
+Course Research
+One web research pass per course instead of one Tavily search per lesson:
+a few broad searches (the topic, then its modules) with raw page content are
+run once, stored in course_research, chunked and BM25-indexed locally. Each
+lesson prompt then gets the chunks relevant to its title from that corpus,
+so a course costs O(1) searches however many lessons it has.
+"""
+
+import asyncio
+import json
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from sqlalchemy import delete
+from sqlalchemy.future import select
+
+from app.core.config import settings
+from app.core.db import AsyncSessionLocal
+from app.models.base import CourseResearch
+from app.services.lesson_retrieval import BM25Index, Chunk, chunk_markdown
+from app.services.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Research passes in flight, keyed by course_id
+research_flights = SingleFlight()
+
+# course_id -> index of its research corpus
+_indexes: "OrderedDict[int, BM25Index]" = OrderedDict()
+
+# Running totals, exposed through GET /tavily/cache
+research_stats: Dict[str, int] = {
+    "passes": 0,  # Research passes run
+    "searches": 0,  # Tavily searches they sent that returned results
+    "lesson_contexts": 0,  # Lessons served from a course corpus
+}
+
+OVERVIEW_QUERIES = {
+    "en": "{topic} comprehensive guide tutorial overview",
+    "it": "{topic} guida completa tutorial panoramica",
+    "es": "{topic} guía completa tutorial visión general",
+    "fr": "{topic} guide complet tutoriel aperçu",
+    "de": "{topic} umfassender Leitfaden Tutorial Überblick",
+}
+
+
+def research_queries(topic: str, index_json: str, language: str = "en") -> List[str]:
+    """
+    The broad searches of a course: an overview of the topic, then one per
+    module (evenly spaced when there are more modules than
+    COURSE_RESEARCH_QUERIES allows).
+    """
+    template = OVERVIEW_QUERIES.get(language, OVERVIEW_QUERIES["en"])
+    queries = [template.format(topic=topic)]
+    try:
+        modules = [m.get("title") for m in json.loads(index_json) if m.get("title")]
+    except (TypeError, ValueError, AttributeError):
+        modules = []
+
+    slots = max(0, settings.COURSE_RESEARCH_QUERIES - 1)
+    if len(modules) > slots:
+        step = len(modules) / slots if slots else 0
+        modules = [modules[int(i * step)] for i in range(slots)]
+    queries.extend(f"{topic}: {module}" for module in modules)
+    return queries
+
+
+def _build_index(rows: List[CourseResearch]) -> BM25Index:
+    chunks: List[Chunk] = []
+    for row in rows:
+        content = (row.content or "")[: settings.COURSE_RESEARCH_MAX_DOC_CHARS]
+        for chunk in chunk_markdown(content):
+            heading = row.title or row.url
+            if chunk.heading:
+                heading = f"{heading} > {chunk.heading}"
+            chunks.append(Chunk(len(chunks), heading, chunk.text, source=row.url))
+    return BM25Index(chunks)
+
+
+def _remember(course_id: int, index: BM25Index) -> None:
+    _indexes[course_id] = index
+    _indexes.move_to_end(course_id)
+    while len(_indexes) > settings.COURSE_RESEARCH_INDEX_CACHE_SIZE:
+        _indexes.popitem(last=False)
+
+
+async def _load_rows(course_id: int) -> List[CourseResearch]:
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            select(CourseResearch)
+            .where(CourseResearch.course_id == course_id)
+            .order_by(CourseResearch.id)
+        )
+        return list(result.scalars().all())
+
+
+async def get_research_index(course_id: int) -> Optional[BM25Index]:
+    """The course's research index, rebuilt from the stored corpus if needed."""
+    index = _indexes.get(course_id)
+    if index is not None:
+        _indexes.move_to_end(course_id)
+        return index
+    rows = await _load_rows(course_id)
+    if not rows:
+        return None
+    index = _build_index(rows)
+    _remember(course_id, index)
+    return index
+
+
+async def _run_research(
+    course_id: int, topic: str, index_json: str, language: str, user=None
+) -> bool:
+    from app.services.tavily_service import TavilyService
+
+    tavily = TavilyService.for_user(user)
+    if not tavily.enabled:
+        logger.info("Tavily disabled - no course research")
+        return False
+
+    queries = research_queries(topic, index_json, language)
+
+    searched = 0  # Not failed, skipped by the breaker or served from the cache
+
+    async def search(query: str) -> List[CourseResearch]:
+        nonlocal searched
+        try:
+            response = await tavily.search(
+                query=query,
+                call_type="course",
+                search_depth="advanced",
+                max_results=settings.COURSE_RESEARCH_RESULTS_PER_QUERY,
+                include_answer=False,
+                include_raw_content=True,
+            )
+        except Exception as e:
+            logger.warning(f"Course research search failed ({query}): {e}")
+            return []
+        if response.get("results") and not response.get("from_cache"):
+            searched += 1
+        return [
+            CourseResearch(
+                course_id=course_id,
+                query=query,
+                title=result.get("title"),
+                url=result.get("url"),
+                content=result.get("raw_content") or result.get("content") or "",
+            )
+            for result in response.get("results", [])
+        ]
+
+    found = await asyncio.gather(*(search(query) for query in queries))
+    research_stats["passes"] += 1
+    research_stats["searches"] += searched
+
+    rows, seen = [], set()
+    for row in (row for results in found for row in results):
+        if row.url in seen or not row.content.strip():
+            continue
+        seen.add(row.url)
+        rows.append(row)
+    if not rows:
+        return False
+
+    async with AsyncSessionLocal() as session:
+        session.add_all(rows)
+        await session.commit()
+    _remember(course_id, _build_index(rows))
+    logger.info(
+        f"Course research for {course_id}: {len(queries)} queries "
+        f"({searched} searched), "
+        f"{len(rows)} sources"
+    )
+    return True
+
+
+async def ensure_research(
+    course_id: int, topic: str, index_json: str, language: str = "en", user=None
+) -> bool:
+    """
+    Make sure the course has a research corpus, running the research pass
+    once (concurrent callers share it). Returns False if there is none, e.g.
+    Tavily is disabled or found nothing.
+    """
+    if await get_research_index(course_id) is not None:
+        return True
+    result, _ = await research_flights.run(
+        course_id,
+        lambda: _run_research(course_id, topic, index_json, language, user),
+    )
+    return result
+
+
+async def lesson_research_context(course_id: int, topic: str, lesson_title: str) -> str:
+    """
+    Web context for a lesson prompt: the corpus chunks most relevant to the
+    lesson, grouped by source, within COURSE_RESEARCH_CONTEXT_TOKENS.
+    Returns "" if nothing in the corpus matches.
+    """
+    index = await get_research_index(course_id)
+    if index is None:
+        return ""
+    budget = settings.COURSE_RESEARCH_CONTEXT_TOKENS
+    selected: List[Chunk] = []
+    used = 0
+    for _, chunk in index.search(
+        f"{lesson_title} {topic}", settings.COURSE_RESEARCH_TOP_K
+    ):
+        if used + chunk.tokens > budget:
+            continue
+        selected.append(chunk)
+        used += chunk.tokens
+    if not selected:
+        return ""
+    research_stats["lesson_contexts"] += 1
+
+    by_source: "OrderedDict[str, List[Chunk]]" = OrderedDict()
+    for chunk in selected:
+        by_source.setdefault(chunk.source, []).append(chunk)
+
+    # Same shape and citation rules as TavilyService.search_for_lesson_context
+    context = "\n\n--- WEB SOURCES (Optional - Use if relevant) ---\n"
+    context += "IMPORTANT: If you use information from these sources, you MUST:\n"
+    context += (
+        "1. Add a '## Sources & Further Reading' section at the END of the lesson\n"
+    )
+    context += "2. List each source with title and URL in markdown format\n"
+    context += "3. Only cite sources you actually used\n\n"
+    for i, (url, chunks) in enumerate(by_source.items(), 1):
+        chunks.sort(key=lambda chunk: chunk.position)
+        title = chunks[0].heading.split(" > ", 1)[0]
+        context += f"{i}. **{title}**\n"
+        context += f"   URL: {url}\n"
+        context += "   Content: " + "\n\n".join(c.text for c in chunks) + "\n\n"
+    return context
+
+
+async def delete_research(session, course_id: int) -> None:
+    """Delete a course's corpus (in the caller's transaction) and its index."""
+    await session.execute(
+        delete(CourseResearch).where(CourseResearch.course_id == course_id)
+    )
+    _indexes.pop(course_id, None)
@@ -0,0 +1,384 @@
+"""
+EPUB Builder
+Full-course EPUBs assembled from per-lesson chapters instead of one pandoc
+run over the whole course. A lesson's chapter is its markdown converted by
+pandoc's HTML writer and re-serialized as XHTML; it is cached by content
+hash (memory and database tiers) when the lesson is saved, so an export
+only converts lessons whose content changed. The title page, navigation
+document, package document and the chapters are then streamed into the
+EPUB zip.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import tempfile
+import uuid
+import zipfile
+from datetime import datetime, timezone
+from html import escape
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from app.core.config import settings
+from app.models.base import Course, Lesson
+from app.services import course_export
+from app.services.render_pool import (
+    RenderError,
+    RenderTimeout,
+    render_pool,
+    tool_version,
+)
+from app.services.response_cache import build_cache
+from app.services.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+CHAPTER_OPTIONS = ["-f", "markdown", "-t", "html5", "--wrap=none"]
+NAV_HEADING_LEVELS = 2  # Lesson headings listed under a chapter (toc-depth 3)
+
+VOID_ELEMENTS = {
+    "area",
+    "base",
+    "br",
+    "col",
+    "embed",
+    "hr",
+    "img",
+    "input",
+    "link",
+    "meta",
+    "source",
+    "track",
+    "wbr",
+}
+_XML_NAME = re.compile(r"^[A-Za-z_][\w.-]*(?::[\w.-]+)?$")
+_XML_INVALID = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+
+STYLESHEET = """body { font-family: serif; line-height: 1.4; }
+h1, h2, h3, h4 { font-family: sans-serif; }
+pre, code { font-family: monospace; font-size: 0.9em; }
+pre { white-space: pre-wrap; background: #f5f5f5; padding: 0.5em; }
+table { border-collapse: collapse; }
+th, td { border: 1px solid #999; padding: 0.2em 0.4em; }
+"""
+
+# Chapters by content hash: {"xhtml": ..., "headings": [[level, id, text]]}
+epub_chapter_cache = build_cache(
+    "epub", settings.EPUB_CHAPTER_CACHE_BACKENDS, settings.EPUB_CHAPTER_CACHE_TTL
+)
+
+# Chapter conversions in flight, keyed by content hash
+chapter_flights = SingleFlight()
+
+# Conversions started when lessons are saved (referenced until done)
+_prepare_tasks: Set[asyncio.Task] = set()
+
+# Running totals, exposed through GET /render/cache
+epub_stats: Dict[str, int] = {
+    "builds": 0,
+    "chapters_reused": 0,  # Chapters taken from the chapter cache
+    "chapters_converted": 0,  # ... converted by pandoc (new or changed lessons)
+    "failed": 0,
+}
+
+
+class _XHTMLWriter(HTMLParser):
+    """
+    Re-serializes an HTML fragment as well-formed XHTML (void elements
+    self-closed, every element closed, attributes quoted, only XML
+    entities) and collects the ids and text of its headings.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.out: List[str] = []
+        self.open: List[str] = []
+        self.headings: List[List] = []
+        self._heading: Optional[List] = None
+
+    @staticmethod
+    def _attrs(attrs: List[Tuple[str, Optional[str]]]) -> str:
+        unique = {}
+        for name, value in attrs:
+            if _XML_NAME.match(name) and name != "xmlns" and name not in unique:
+                unique[name] = name if value is None else value
+        return "".join(
+            f' {name}="{escape(_XML_INVALID.sub("", value))}"'
+            for name, value in unique.items()
+        )
+
+    def handle_starttag(self, tag, attrs):
+        if not _XML_NAME.match(tag):
+            return
+        if tag in VOID_ELEMENTS:
+            self.out.append(f"<{tag}{self._attrs(attrs)} />")
+            return
+        self.out.append(f"<{tag}{self._attrs(attrs)}>")
+        self.open.append(tag)
+        level = int(tag[1]) if re.fullmatch(r"h[1-6]", tag) else 0
+        heading_id = dict(attrs).get("id")
+        if 0 < level <= NAV_HEADING_LEVELS and heading_id and self._heading is None:
+            self._heading = [level, heading_id, ""]
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in VOID_ELEMENTS:
+            self.handle_starttag(tag, attrs)
+        elif _XML_NAME.match(tag):
+            self.out.append(f"<{tag}{self._attrs(attrs)}></{tag}>")
+
+    def handle_endtag(self, tag):
+        if tag not in self.open:
+            return  # Stray end tag
+        # Close whatever the fragment left open inside this element
+        while self.open:
+            closed = self.open.pop()
+            self.out.append(f"</{closed}>")
+            if closed == tag:
+                break
+        if self._heading is not None and tag == f"h{self._heading[0]}":
+            self._heading[2] = " ".join(self._heading[2].split())
+            self.headings.append(self._heading)
+            self._heading = None
+
+    def handle_data(self, data):
+        data = _XML_INVALID.sub("", data)
+        if self._heading is not None:
+            self._heading[2] += data
+        self.out.append(escape(data, quote=False))
+
+    def close(self):
+        super().close()
+        while self.open:
+            self.out.append(f"</{self.open.pop()}>")
+
+
+def to_xhtml(html: str) -> Dict:
+    """Chapter of an HTML fragment: {"xhtml": ..., "headings": [...]}."""
+    writer = _XHTMLWriter()
+    writer.feed(html)
+    writer.close()
+    return {"xhtml": "".join(writer.out), "headings": writer.headings}
+
+
+async def chapter_key(markdown: str) -> str:
+    payload = json.dumps(
+        [CHAPTER_OPTIONS, await tool_version("pandoc"), markdown], ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+async def _convert(key: str, markdown: str, label: str) -> Dict:
+    with tempfile.TemporaryDirectory(prefix="chapter-") as work:
+        md_file = Path(work) / "lesson.md"
+        with open(md_file, "w", encoding="utf-8") as f:
+            f.write(markdown)
+        html = await render_pool.run(
+            ["pandoc", str(md_file), *CHAPTER_OPTIONS], label=f"chapter:{label}"
+        )
+    chapter = to_xhtml(html)
+    epub_stats["chapters_converted"] += 1
+    await epub_chapter_cache.set(key, json.dumps(chapter, ensure_ascii=False))
+    return chapter
+
+
+async def get_chapter(content: str, label: str = "") -> Dict:
+    """
+    The chapter of a lesson's markdown, converted only if no chapter with
+    the same content hash is cached. Raises RenderError/RenderTimeout if
+    pandoc fails.
+    """
+    markdown = course_export.sanitize_lesson_markdown(content or "")
+    key = await chapter_key(markdown)
+    cached = await epub_chapter_cache.get(key)
+    if cached is not None:
+        epub_stats["chapters_reused"] += 1
+        return json.loads(cached)
+    chapter, _ = await chapter_flights.run(key, lambda: _convert(key, markdown, label))
+    return chapter
+
+
+async def _prepare(content: str, label: str) -> None:
+    try:
+        await get_chapter(content, label)
+    except (RenderError, RenderTimeout, OSError) as e:
+        logger.warning(f"EPUB chapter conversion failed for {label}: {e}")
+
+
+def prepare_chapter(content: str, label: str = "") -> None:
+    """Convert a saved lesson's chapter in the background, ready for export."""
+    if settings.FULL_EPUB_MODE != "chapters" or not content:
+        return
+    task = asyncio.create_task(_prepare(content, label))
+    _prepare_tasks.add(task)
+    task.add_done_callback(_prepare_tasks.discard)
+
+
+def _page(title: str, body: str, language: str, head: str = "") -> str:
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>\n<!DOCTYPE html>\n'
+        '<html xmlns="http://www.w3.org/1999/xhtml" '
+        'xmlns:epub="http://www.idpf.org/2007/ops" '
+        f'lang="{language}" xml:lang="{language}">\n'
+        f"<head>\n<title>{escape(title)}</title>\n{head}</head>\n"
+        f"<body>\n{body}\n</body>\n</html>\n"
+    )
+
+
+def _nav_list(entries: List[Tuple[int, str, str]]) -> str:
+    """Nested <ol> of (depth, href, label) entries, depth 0 at the top."""
+    parts: List[str] = []
+    depth = -1
+    for level, href, label in entries:
+        level = min(level, depth + 1)  # Never skip a nesting level
+        if level > depth:
+            parts.append("<ol>")
+        else:
+            parts.append("</li>")
+            parts.extend("</ol></li>" for _ in range(depth - level))
+        parts.append(f'<li><a href="{escape(href)}">{escape(label)}</a>')
+        depth = level
+    parts.extend("</li></ol>" for _ in range(depth + 1))
+    return "\n".join(parts)
+
+
+def _write_epub(
+    out_file: Path,
+    course: Dict,
+    chapters: List[Tuple[str, Dict]],
+) -> None:
+    title, language = course["title"], course["language"]
+    style = (
+        '<link rel="stylesheet" type="text/css" href="../styles/stylesheet.css" />\n'
+    )
+    files = [f"text/ch{i:03d}.xhtml" for i in range(1, len(chapters) + 1)]
+
+    toc = "\n".join(f"<li>{escape(heading)}</li>" for heading, _ in chapters)
+    title_page = _page(
+        title,
+        f"<h1>{escape(title)}</h1>\n"
+        f"<p><strong>Course Description:</strong> "
+        f"{escape(course['description'])}</p>\n"
+        f"<h1>Table of Contents</h1>\n<ul>\n{toc}\n</ul>",
+        language,
+        style,
+    )
+
+    entries = [(0, "text/title.xhtml", title)]
+    for path, (heading, chapter) in zip(files, chapters):
+        entries.append((0, path, heading))
+        entries.extend(
+            (level, f"{path}#{heading_id}", text)
+            for level, heading_id, text in chapter["headings"]
+        )
+    nav = _page(
+        title,
+        f'<nav epub:type="toc" id="toc">\n<h1>Table of Contents</h1>\n'
+        f"{_nav_list(entries)}\n</nav>",
+        language,
+    )
+
+    items = [
+        '<item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" '
+        'properties="nav" />',
+        '<item id="ncx" href="toc.ncx" media-type="application/x-dtbncx+xml" />',
+        '<item id="style" href="styles/stylesheet.css" media-type="text/css" />',
+        '<item id="title" href="text/title.xhtml" '
+        'media-type="application/xhtml+xml" />',
+    ] + [
+        f'<item id="ch{i:03d}" href="{path}" media-type="application/xhtml+xml" />'
+        for i, path in enumerate(files, 1)
+    ]
+    spine = ['<itemref idref="title" />'] + [
+        f'<itemref idref="ch{i:03d}" />' for i in range(1, len(files) + 1)
+    ]
+    modified = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    package = (
+        '<?xml version="1.0" encoding="utf-8"?>\n'
+        '<package xmlns="http://www.idpf.org/2007/opf" version="3.0" '
+        f'unique-identifier="id" xml:lang="{language}">\n'
+        '<metadata xmlns:dc="http://purl.org/dc/elements/1.1/">\n'
+        f'<dc:identifier id="id">{course["identifier"]}</dc:identifier>\n'
+        f"<dc:title>{escape(title)}</dc:title>\n"
+        f"<dc:language>{language}</dc:language>\n"
+        f"<dc:description>{escape(course['description'])}</dc:description>\n"
+        f'<meta property="dcterms:modified">{modified}</meta>\n'
+        "</metadata>\n"
+        f"<manifest>\n{chr(10).join(items)}\n</manifest>\n"
+        f'<spine toc="ncx">\n{chr(10).join(spine)}\n</spine>\n'
+        "</package>\n"
+    )
+    # EPUB 2 readers navigate with the NCX
+    nav_points = "\n".join(
+        f'<navPoint id="np{i}" playOrder="{i}"><navLabel><text>{escape(label)}'
+        f'</text></navLabel><content src="{escape(href)}" /></navPoint>'
+        for i, (_, href, label) in enumerate(
+            (entry for entry in entries if entry[0] == 0), 1
+        )
+    )
+    ncx = (
+        '<?xml version="1.0" encoding="utf-8"?>\n'
+        '<ncx xmlns="http://www.daisy.org/z3986/2005/ncx/" version="2005-1">\n'
+        f'<head><meta name="dtb:uid" content="{course["identifier"]}" /></head>\n'
+        f"<docTitle><text>{escape(title)}</text></docTitle>\n"
+        f"<navMap>\n{nav_points}\n</navMap>\n</ncx>\n"
+    )
+    container = (
+        '<?xml version="1.0" encoding="utf-8"?>\n'
+        '<container version="1.0" '
+        'xmlns="urn:oasis:names:tc:opendocument:xmlns:container">\n'
+        '<rootfiles><rootfile full-path="EPUB/content.opf" '
+        'media-type="application/oebps-package+xml" /></rootfiles>\n'
+        "</container>\n"
+    )
+
+    with zipfile.ZipFile(out_file, "w", zipfile.ZIP_DEFLATED) as epub:
+        # The mimetype must come first and uncompressed
+        epub.writestr("mimetype", "application/epub+zip", zipfile.ZIP_STORED)
+        epub.writestr("META-INF/container.xml", container)
+        epub.writestr("EPUB/content.opf", package)
+        epub.writestr("EPUB/nav.xhtml", nav)
+        epub.writestr("EPUB/toc.ncx", ncx)
+        epub.writestr("EPUB/styles/stylesheet.css", STYLESHEET)
+        epub.writestr("EPUB/text/title.xhtml", title_page)
+        for path, (heading, chapter) in zip(files, chapters):
+            body = (
+                f"<section>\n<h1>{escape(heading)}</h1>\n{chapter['xhtml']}\n</section>"
+            )
+            epub.writestr(f"EPUB/{path}", _page(heading, body, language, style))
+
+
+async def build_course_epub(
+    course: Course, lessons: List[Lesson], out_file: Path
+) -> bool:
+    """Write the course EPUB to out_file from the cached lesson chapters."""
+    lessons = course_export.sorted_lessons(lessons)
+    label = course.title
+    try:
+        chapters = await asyncio.gather(
+            *(
+                get_chapter(lesson.content_markdown, f"{label} {lesson.path_in_index}")
+                for lesson in lessons
+            )
+        )
+        identifier = uuid.uuid5(uuid.NAMESPACE_URL, f"ceppa:course:{course.id}")
+        meta = {
+            "title": course.title or "",
+            "description": course.description or "",
+            "language": escape(course.language or "en"),
+            "identifier": f"urn:uuid:{identifier}",
+        }
+        headings = [f"{lesson.path_in_index}. {lesson.title}" for lesson in lessons]
+        # Zipping is CPU bound, keep it off the event loop
+        await asyncio.to_thread(
+            _write_epub, out_file, meta, list(zip(headings, chapters))
+        )
+    except (RenderError, RenderTimeout, OSError) as e:
+        logger.warning(f"Assembling the EPUB of course {course.id} failed: {e}")
+        epub_stats["failed"] += 1
+        return False
+    epub_stats["builds"] += 1
+    return True
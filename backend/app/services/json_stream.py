@@ -0,0 +1,76 @@
+"""
+Incremental JSON array parser
+Feeds on text chunks of a JSON array as they arrive (e.g. LLM deltas) and
+returns each top-level object (or nested array) as soon as it is complete.
+Scalar elements are skipped. Anything before the opening "[" (such as a
+```json fence) is ignored.
+"""
+
+import json
+from typing import Any, List
+
+
+class JSONArrayStreamParser:
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0  # Next character to scan
+        self._started = False  # Seen the opening "["
+        self._depth = 0  # Nesting depth inside the top-level array
+        self._in_string = False
+        self._escape = False
+        self._element_start = None
+        self.finished = False  # Seen the closing "]"
+        self.items: List[Any] = []
+
+    def feed(self, chunk: str) -> List[Any]:
+        """
+        Add a chunk and return the elements completed by it.
+        Raises ValueError if a completed element is not valid JSON.
+        """
+        if self.finished:
+            return []
+        self._buffer += chunk
+        completed = []
+        buffer = self._buffer
+        i = self._pos
+        while i < len(buffer):
+            char = buffer[i]
+            if not self._started:
+                if char == "[":
+                    self._started = True
+                i += 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                if self._depth == 0:
+                    self._element_start = i
+                self._depth += 1
+            elif char in "}]":
+                if self._depth == 0:  # The top-level array closed
+                    self.finished = True
+                    i += 1
+                    break
+                self._depth -= 1
+                if self._depth == 0:
+                    completed.append(json.loads(buffer[self._element_start : i + 1]))
+                    self._element_start = None
+
+            if self._depth == 0 and not self._in_string and self._element_start is None:
+                # Between elements: drop everything scanned so far
+                buffer = buffer[i + 1 :]
+                i = -1
+            i += 1
+
+        self._buffer = buffer
+        self._pos = i
+        self.items.extend(completed)
+        return completed
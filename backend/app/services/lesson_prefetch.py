@@ -0,0 +1,247 @@
+"""
+Lesson Prefetcher
+When a lesson is opened, the next LESSON_PREFETCH_COUNT lessons in index
+order that don't exist yet are generated in the background, so the learner
+usually finds the next lesson ready. Prefetches use the low-priority lane of
+the LLM limiter, run at most LESSON_PREFETCH_PER_USER at a time per user and
+can be cancelled, LLM call included unless a learner waits for the same
+lesson. Hits (prefetched lessons that were later opened) are
+counted to show whether prefetching pays off.
+"""
+
+import asyncio
+import json
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.future import select
+
+from app.core.config import settings
+from app.core.db import AsyncSessionLocal
+from app.models.base import Course, Lesson
+from app.services import lesson_service
+from app.services.llm_limiter import PriorityTicket, priority_ticket
+
+logger = logging.getLogger(__name__)
+
+
+def next_lessons(index_json: str, path_in_index: str, count: int) -> List[dict]:
+    """The `count` lessons ({"title", "path"}) following path_in_index."""
+    try:
+        modules = json.loads(index_json)
+    except (TypeError, ValueError):
+        return []
+    flat = [
+        lesson
+        for module in modules
+        for lesson in module.get("lessons", [])
+        if lesson.get("path")
+    ]
+    for i, lesson in enumerate(flat):
+        if lesson["path"] == path_in_index:
+            return flat[i + 1 : i + 1 + count]
+    return []
+
+
+class _PrefetchJob:
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self.task: Optional[asyncio.Task] = None
+        self.started = False  # Past the per-user cap, generating
+        self.opened = False  # The learner opened the lesson meanwhile
+        self.ticket = PriorityTicket()  # Promoted when the learner opens it
+
+
+class LessonPrefetcher:
+    def __init__(self, count: int, per_user: int, max_tracked: int = 10000):
+        self.count = count
+        self.per_user = per_user
+        self.max_tracked = max_tracked
+        self._jobs: Dict[Tuple[int, str], _PrefetchJob] = {}
+        self._user_slots: Dict[int, asyncio.Semaphore] = {}
+        # Prefetched lessons not opened yet (bounded, oldest dropped first)
+        self._prefetched: "OrderedDict[Tuple[int, str], None]" = OrderedDict()
+        self.scheduled = 0
+        self.generated = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.hits = 0
+
+    def _user_slot(self, user_id: int) -> asyncio.Semaphore:
+        slot = self._user_slots.get(user_id)
+        if slot is None:
+            slot = self._user_slots[user_id] = asyncio.Semaphore(self.per_user)
+        return slot
+
+    async def schedule(
+        self,
+        course_id: int,
+        path_in_index: str,
+        user,
+        use_web_research: bool = False,
+    ) -> int:
+        """
+        Queue generation of the lessons following path_in_index that don't
+        exist yet. Returns the number of prefetches started.
+        """
+        if not settings.LESSON_PREFETCH_ENABLED or user is None:
+            return 0
+
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                select(Course).where(Course.id == course_id, Course.user_id == user.id)
+            )
+            course = result.scalars().first()
+            if not course:
+                return 0
+            candidates = next_lessons(course.index_json, path_in_index, self.count)
+            if not candidates:
+                return 0
+            result = await session.execute(
+                select(Lesson.path_in_index).where(
+                    Lesson.course_id == course_id,
+                    Lesson.path_in_index.in_([c["path"] for c in candidates]),
+                )
+            )
+            existing = set(result.scalars().all())
+
+        started = 0
+        for lesson in candidates:
+            key = (course_id, lesson["path"])
+            if lesson["path"] in existing or key in self._jobs:
+                continue
+            if lesson_service.lesson_flights.in_flight(key) is not None:
+                continue  # Already being generated by someone else
+            job = _PrefetchJob(user.id)
+            self._jobs[key] = job
+            job.task = asyncio.create_task(
+                self._run(
+                    key,
+                    job,
+                    course.title,
+                    course.index_json,
+                    getattr(course, "language", "en"),
+                    lesson["title"],
+                    user,
+                    use_web_research,
+                )
+            )
+            self.scheduled += 1
+            started += 1
+        return started
+
+    async def _run(
+        self,
+        key: Tuple[int, str],
+        job: _PrefetchJob,
+        course_title: str,
+        index_json: str,
+        language: str,
+        title: str,
+        user,
+        use_web_research: bool,
+    ) -> None:
+        course_id, path_in_index = key
+        priority_ticket.set(job.ticket)  # This task's context only
+        try:
+            async with self._user_slot(job.user_id):
+                job.started = True
+                lesson, created = await lesson_service.generate_lesson(
+                    course_id,
+                    course_title,
+                    index_json,
+                    language,
+                    title,
+                    path_in_index,
+                    user=user,
+                    use_web_research=use_web_research,
+                    low_priority=True,
+                )
+            if created:
+                self.generated += 1
+                if not job.opened:
+                    self._remember(key)
+                logger.info(f"Prefetched lesson {path_in_index} of course {course_id}")
+                await lesson_service.render_lesson_pdf(
+                    lesson, job.user_id, course_title
+                )
+        except Exception as e:
+            self.failed += 1
+            logger.warning(f"Prefetch of lesson {path_in_index} failed: {e}")
+        finally:
+            if self._jobs.get(key) is job:
+                del self._jobs[key]
+
+    def _remember(self, key: Tuple[int, str]) -> None:
+        self._prefetched[key] = None
+        while len(self._prefetched) > self.max_tracked:
+            self._prefetched.popitem(last=False)
+
+    def record_open(self, course_id: int, path_in_index: str) -> bool:
+        """
+        Called when a learner opens a lesson. Counts a hit if it was
+        prefetched (or is being prefetched right now). A prefetch still
+        waiting for its per-user slot is cancelled so the request generates
+        the lesson at normal priority instead; one already generating moves
+        to the normal lane of the limiter, since the request joins it.
+        """
+        key = (course_id, path_in_index)
+        if key in self._prefetched:
+            del self._prefetched[key]
+            self.hits += 1
+            return True
+        job = self._jobs.get(key)
+        if job is None:
+            return False
+        if not job.started:
+            job.task.cancel()
+            del self._jobs[key]
+            self.cancelled += 1
+            return False
+        job.ticket.promote()
+        job.opened = True
+        self.hits += 1
+        return True
+
+    def cancel(self, user_id: int, course_id: Optional[int] = None) -> int:
+        """
+        Cancel the user's running prefetches (optionally for one course),
+        with their LLM call unless someone else waits for the same lesson.
+        """
+        cancelled = 0
+        for key, job in list(self._jobs.items()):
+            if job.user_id == user_id and course_id in (None, key[0]):
+                if job.started:
+                    # The generation runs in its own task (single flight)
+                    lesson_service.lesson_flights.cancel_unshared(key)
+                job.task.cancel()
+                del self._jobs[key]
+                cancelled += 1
+        self.cancelled += cancelled
+        return cancelled
+
+    def forget_course(self, course_id: int) -> None:
+        """Drop hit tracking for a deleted course."""
+        for key in [k for k in self._prefetched if k[0] == course_id]:
+            del self._prefetched[key]
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": settings.LESSON_PREFETCH_ENABLED,
+            "in_flight": len(self._jobs),
+            "scheduled": self.scheduled,
+            "generated": self.generated,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "hits": self.hits,
+            "hit_rate": (
+                round(self.hits / self.generated, 3) if self.generated else None
+            ),
+        }
+
+
+lesson_prefetcher = LessonPrefetcher(
+    count=settings.LESSON_PREFETCH_COUNT,
+    per_user=settings.LESSON_PREFETCH_PER_USER,
+)
@@ -0,0 +1,262 @@
+"""
+Lesson Retrieval
+Splits lesson markdown into heading-aware chunks and indexes them with BM25,
+so Q&A prompts get the parts of the lesson relevant to the question (within
+a token budget) instead of its first few thousand characters. Indexes are
+built when a lesson is saved, kept in a bounded in-memory LRU keyed by lesson
+id and rebuilt whenever the content hash changes.
+"""
+
+import hashlib
+import logging
+import math
+import re
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.services.course_context import estimate_tokens
+from app.services.question_cache import STOPWORDS, normalize_question, stem_word
+
+logger = logging.getLogger(__name__)
+
+HEADING_RE = re.compile(r"^(#{1,6})\s+(.*)$")
+
+# Running totals, exposed through GET /llm/context
+retrieval_stats: Dict[str, int] = {
+    "builds": 0,
+    "full_tokens": 0,
+    "context_tokens": 0,
+    "saved_tokens": 0,
+}
+
+
+class Chunk:
+    __slots__ = ("position", "heading", "text", "tokens", "source")
+
+    def __init__(self, position: int, heading: str, text: str, source: str = None):
+        self.position = position
+        self.heading = heading  # "Title > Section > Subsection"
+        self.text = text
+        self.tokens = estimate_tokens(text)
+        self.source = source  # e.g. the URL of a web page
+
+
+def _split_blocks(text: str) -> List[str]:
+    """Split a section into paragraphs, never inside a fenced code block."""
+    blocks, current, in_code = [], [], False
+    for line in text.split("\n"):
+        if line.strip().startswith("```"):
+            in_code = not in_code
+        if not line.strip() and not in_code:
+            if current:
+                blocks.append("\n".join(current))
+                current = []
+            continue
+        current.append(line)
+    if current:
+        blocks.append("\n".join(current))
+    return blocks
+
+
+def _split_long_block(block: str, max_tokens: int) -> List[str]:
+    """
+    Split a paragraph over max_tokens into word windows (web pages often
+    have no blank lines). Code blocks are kept whole.
+    """
+    if estimate_tokens(block) <= max_tokens or block.lstrip().startswith("```"):
+        return [block]
+    words = block.split()
+    per_window = max(1, max_tokens * 2 // 3)  # ~1.5 tokens per word
+    return [
+        " ".join(words[i : i + per_window]) for i in range(0, len(words), per_window)
+    ]
+
+
+def chunk_markdown(content: str, max_tokens: int = None) -> List[Chunk]:
+    """
+    Split markdown at headings, then split sections larger than max_tokens
+    at paragraph boundaries. Each chunk remembers its heading path.
+    """
+    max_tokens = max_tokens or settings.LESSON_CHUNK_TOKENS
+    sections: List[Tuple[str, List[str]]] = []
+    path: List[Tuple[int, str]] = []
+    lines: List[str] = []
+    in_code = False
+
+    def flush() -> None:
+        # Sections with nothing but their heading add no information
+        if any(line.strip() and not HEADING_RE.match(line) for line in lines):
+            sections.append((" > ".join(title for _, title in path), list(lines)))
+        lines.clear()
+
+    for line in (content or "").split("\n"):
+        if line.strip().startswith("```"):
+            in_code = not in_code
+        match = None if in_code else HEADING_RE.match(line)
+        if match:
+            flush()
+            level = len(match.group(1))
+            path = [(l, t) for l, t in path if l < level] + [
+                (level, match.group(2).strip())
+            ]
+        lines.append(line)
+    flush()
+
+    chunks: List[Chunk] = []
+    for heading, section_lines in sections:
+        text = "\n".join(section_lines).strip()
+        if estimate_tokens(text) <= max_tokens:
+            chunks.append(Chunk(len(chunks), heading, text))
+            continue
+        current: List[str] = []
+        blocks = [
+            piece
+            for block in _split_blocks(text)
+            for piece in _split_long_block(block, max_tokens)
+        ]
+        for block in blocks:
+            candidate = "\n\n".join(current + [block])
+            heading_only = len(current) == 1 and HEADING_RE.match(current[0])
+            if current and not heading_only and estimate_tokens(candidate) > max_tokens:
+                chunks.append(Chunk(len(chunks), heading, "\n\n".join(current)))
+                current = []
+            current.append(block)
+        if current:
+            chunks.append(Chunk(len(chunks), heading, "\n\n".join(current)))
+    return chunks
+
+
+def tokenize(text: str) -> List[str]:
+    return [
+        stem_word(word)
+        for word in normalize_question(text).split()
+        if word not in STOPWORDS and len(word) > 1
+    ]
+
+
+class BM25Index:
+    def __init__(self, chunks: List[Chunk], k1: float = 1.5, b: float = 0.75):
+        self.chunks = chunks
+        self.k1 = k1
+        self.b = b
+        # Headings are indexed with the text so "## Closures" matches
+        self.term_freqs = [
+            Counter(tokenize(f"{chunk.heading}\n{chunk.text}")) for chunk in chunks
+        ]
+        self.lengths = [sum(tf.values()) for tf in self.term_freqs]
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if chunks else 0.0
+        doc_freqs: Counter = Counter()
+        for tf in self.term_freqs:
+            doc_freqs.update(tf.keys())
+        n = len(chunks)
+        self.idf = {
+            term: math.log(1 + (n - df + 0.5) / (df + 0.5))
+            for term, df in doc_freqs.items()
+        }
+
+    def search(self, query: str, top_k: int) -> List[Tuple[float, Chunk]]:
+        terms = tokenize(query)
+        scored = []
+        for chunk, tf, length in zip(self.chunks, self.term_freqs, self.lengths):
+            score = 0.0
+            for term in terms:
+                freq = tf.get(term)
+                if not freq:
+                    continue
+                norm = 1 - self.b + self.b * length / (self.avg_length or 1)
+                score += self.idf[term] * freq * (self.k1 + 1) / (freq + self.k1 * norm)
+            if score > 0:
+                scored.append((score, chunk))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return scored[:top_k]
+
+
+# lesson id -> (content hash, index)
+_indexes: "OrderedDict[int, Tuple[str, BM25Index]]" = OrderedDict()
+
+
+def _content_hash(content: str) -> str:
+    return hashlib.sha256((content or "").encode("utf-8")).hexdigest()
+
+
+def index_lesson(lesson_id: int, content: str) -> BM25Index:
+    """(Re)build the chunk index of a lesson. Call whenever its content changes."""
+    index = BM25Index(chunk_markdown(content))
+    _indexes[lesson_id] = (_content_hash(content), index)
+    _indexes.move_to_end(lesson_id)
+    while len(_indexes) > settings.LESSON_INDEX_CACHE_SIZE:
+        _indexes.popitem(last=False)
+    return index
+
+
+def get_lesson_index(lesson_id: int, content: str) -> BM25Index:
+    """The lesson's index, rebuilt if missing or built from older content."""
+    cached = _indexes.get(lesson_id)
+    if cached is not None and cached[0] == _content_hash(content):
+        _indexes.move_to_end(lesson_id)
+        return cached[1]
+    return index_lesson(lesson_id, content)
+
+
+def forget_lesson(lesson_id: int) -> None:
+    _indexes.pop(lesson_id, None)
+
+
+def build_question_context(
+    lesson_id: Optional[int],
+    content: str,
+    question: str,
+    budget: int = None,
+    top_k: int = None,
+) -> str:
+    """
+    Lesson context for a question: the whole lesson if it fits the token
+    budget, otherwise the top-k BM25 chunks (in lesson order, with their
+    headings) that fit. Falls back to the start of the lesson when nothing
+    matches.
+    """
+    budget = budget or settings.LESSON_QA_CONTEXT_TOKENS
+    top_k = top_k or settings.LESSON_QA_TOP_K
+    content = content or ""
+    full_tokens = estimate_tokens(content)
+    if full_tokens <= budget:
+        return content
+
+    if lesson_id is None:
+        index = BM25Index(chunk_markdown(content))
+    else:
+        index = get_lesson_index(lesson_id, content)
+
+    selected: List[Chunk] = []
+    used = 0
+    for _, chunk in index.search(question, top_k):
+        if used + chunk.tokens > budget:
+            continue
+        selected.append(chunk)
+        used += chunk.tokens
+    if not selected:
+        for chunk in index.chunks:  # Nothing matched: lesson opening
+            if used + chunk.tokens > budget:
+                break
+            selected.append(chunk)
+            used += chunk.tokens
+    if not selected:
+        return content[: budget * 4]
+
+    selected.sort(key=lambda chunk: chunk.position)
+    parts = []
+    for chunk in selected:
+        first_line = chunk.text.split("\n", 1)[0]
+        if chunk.heading and not HEADING_RE.match(first_line):
+            parts.append(f"[{chunk.heading}]\n{chunk.text}")
+        else:
+            parts.append(chunk.text)
+    context = "\n\n[...]\n\n".join(parts)
+
+    context_tokens = estimate_tokens(context)
+    retrieval_stats["builds"] += 1
+    retrieval_stats["full_tokens"] += full_tokens
+    retrieval_stats["context_tokens"] += context_tokens
+    retrieval_stats["saved_tokens"] += max(0, full_tokens - context_tokens)
+    return context
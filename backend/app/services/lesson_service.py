@@ -0,0 +1,183 @@
+"""
+Lesson Service
+Creates lessons for the API endpoints and background jobs. Concurrent requests
+for the same (course_id, path_in_index) share a single LLM generation, and the
+unique index on lessons guarantees a single row per path. Concurrent PDF
+renders of the same lesson content share a single pandoc run.
+"""
+
+import asyncio
+import hashlib
+import logging
+from typing import Optional, Set, Tuple
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.future import select
+
+from app.core.db import AsyncSessionLocal
+from app.models.base import Lesson
+from app.services import epub_builder, lesson_retrieval
+from app.services.llm_service import LLMService
+from app.services.pdf_service import PDFService
+from app.services.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# In-flight lesson generations keyed by (course_id, path_in_index)
+lesson_flights = SingleFlight()
+
+# In-flight lesson PDF renders keyed by (lesson_id, content digest)
+pdf_flights = SingleFlight()
+
+# Detached lesson PDF renders (referenced until done)
+_pdf_tasks: Set[asyncio.Task] = set()
+
+
+class _FollowUp:
+    """Hands the follow-up work of a stored lesson (its PDF) to one caller."""
+
+    def __init__(self):
+        self.claimed = False
+
+    def claim(self) -> bool:
+        if self.claimed:
+            return False
+        self.claimed = True
+        return True
+
+
+async def get_lesson_by_path(course_id: int, path_in_index: str) -> Optional[Lesson]:
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            select(Lesson).where(
+                Lesson.course_id == course_id, Lesson.path_in_index == path_in_index
+            )
+        )
+        return result.scalars().first()
+
+
+async def store_lesson(
+    course_id: int, title: str, path_in_index: str, content: str
+) -> Tuple[Lesson, bool]:
+    """
+    Insert a lesson. If a row for the same path already exists (another worker
+    won the race) that row is returned instead.
+    Returns (lesson, created).
+    """
+    async with AsyncSessionLocal() as session:
+        lesson = Lesson(
+            course_id=course_id,
+            title=title,
+            path_in_index=path_in_index,
+            content_markdown=content,
+        )
+        session.add(lesson)
+        try:
+            await session.commit()
+        except IntegrityError:
+            await session.rollback()
+        else:
+            await session.refresh(lesson)
+            lesson_retrieval.index_lesson(lesson.id, content)
+            epub_builder.prepare_chapter(content, path_in_index)
+            return lesson, True
+
+    existing = await get_lesson_by_path(course_id, path_in_index)
+    if existing is None:
+        raise RuntimeError(f"Could not store lesson {path_in_index}")
+    return existing, False
+
+
+async def generate_lesson(
+    course_id: int,
+    course_title: str,
+    index_json: str,
+    language: str,
+    title: str,
+    path_in_index: str,
+    user=None,
+    use_web_research: bool = False,
+    low_priority: bool = False,
+    research_context: str = None,
+) -> Tuple[Lesson, bool]:
+    """
+    Generate and store a lesson, or wait for the generation already running
+    for the same path.
+    Returns (lesson, created) where created is True for a single caller
+    still waiting when the generation inserted the row, so follow-up work
+    (PDF) is queued once. If every caller gave up meanwhile, the PDF is
+    queued here instead.
+    """
+    key = (course_id, path_in_index)
+
+    async def produce() -> Tuple[Lesson, bool, _FollowUp]:
+        content = await LLMService.generate_lesson_content(
+            course_title,
+            title,
+            index_json,
+            language,
+            use_web_research=use_web_research,
+            user=user,
+            lesson_path=path_in_index,
+            low_priority=low_priority,
+            research_context=research_context,
+        )
+        lesson, created = await store_lesson(course_id, title, path_in_index, content)
+        follow_up = _FollowUp()
+        if created and not lesson_flights.waiting(key) and follow_up.claim():
+            # Every caller was cancelled (client gone): nobody would render it
+            queue_lesson_pdf(lesson, getattr(user, "id", None), course_title)
+        return lesson, created, follow_up
+
+    (lesson, created, follow_up), _ = await lesson_flights.run(key, produce)
+    return lesson, created and follow_up.claim()
+
+
+def queue_lesson_pdf(lesson: Lesson, user_id: Optional[int], course_title: str):
+    """Render the lesson PDF in the background, independent of any request."""
+    if user_id is None:
+        return
+
+    async def render() -> None:
+        try:
+            await render_lesson_pdf(lesson, user_id, course_title)
+        except Exception as e:
+            logger.warning(f"PDF render of lesson {lesson.id} failed: {e}")
+
+    task = asyncio.create_task(render())
+    _pdf_tasks.add(task)
+    task.add_done_callback(_pdf_tasks.discard)
+
+
+async def render_pdf(
+    lesson_id: int, content: str, user_id: int, course_title: str, lesson_title: str
+) -> Optional[str]:
+    """
+    Render a lesson PDF, store its path on the lesson row and return it.
+    Callers rendering the same lesson content wait for the same render.
+    """
+
+    async def produce() -> Optional[str]:
+        pdf_path = await PDFService.convert_markdown_to_pdf(
+            content, user_id, course_title, lesson_title
+        )
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(select(Lesson).where(Lesson.id == lesson_id))
+            stored = result.scalars().first()
+            if stored:
+                stored.pdf_path = pdf_path
+                await session.commit()
+        return pdf_path
+
+    digest = hashlib.sha256((content or "").encode("utf-8")).hexdigest()
+    pdf_path, _ = await pdf_flights.run((lesson_id, digest), produce)
+    return pdf_path
+
+
+async def render_lesson_pdf(
+    lesson: Lesson, user_id: int, course_title: str
+) -> Optional[str]:
+    """Render the lesson PDF, store its path on the lesson row and return it."""
+    return await render_pdf(
+        lesson.id, lesson.content_markdown, user_id, course_title, lesson.title
+    )
@@ -0,0 +1,301 @@
+"""
+Adaptive LLM concurrency limiter
+One process-wide limiter per provider endpoint + API key. The concurrency
+window grows additively while calls succeed within the latency target and
+shrinks multiplicatively on slow calls, 429s and 5xx responses (AIMD).
+A Retry-After from the provider pauses the whole limiter.
+Low-priority callers (prefetching) only get a slot when nobody else is
+waiting, and never more than half of the window. A low-priority caller
+running with a PriorityTicket can be promoted to the normal lane while it
+waits (e.g. the learner opened the lesson being prefetched).
+"""
+
+import asyncio
+import time
+from collections import deque
+from contextvars import ContextVar
+from email.utils import parsedate_to_datetime
+from typing import Deque, Dict, List, Optional, Set, Tuple
+
+from app.core.config import settings
+
+# Outcomes reported when a slot is released
+OK = "ok"
+THROTTLED = "throttled"  # 429
+ERROR = "error"  # 5xx, timeouts, connection errors
+IGNORED = "ignored"  # client errors, cancellations: no signal about capacity
+
+
+class LimiterSlot:
+    """A held unit of concurrency. Release it exactly once (further calls are no-ops)."""
+
+    def __init__(self, limiter: "AdaptiveLimiter"):
+        self.limiter = limiter
+        self.started = time.monotonic()
+        self.first_token_at: Optional[float] = None
+        self.released = False
+
+    def mark_first_token(self) -> None:
+        if self.first_token_at is None:
+            self.first_token_at = time.monotonic()
+
+    def release(self, outcome: str = OK, retry_after: Optional[float] = None) -> None:
+        if self.released:
+            return
+        self.released = True
+        # For streams the time to first token is the latency signal
+        end = self.first_token_at or time.monotonic()
+        self.limiter._release(end - self.started, outcome, retry_after)
+
+
+class PriorityTicket:
+    """
+    Set as priority_ticket in a low-priority caller's context; promote()
+    moves its waiting acquire to the normal lane, and its later acquires
+    use the normal lane too.
+    """
+
+    def __init__(self):
+        self.promoted = False
+        self._queued: Optional[Tuple["AdaptiveLimiter", asyncio.Future]] = None
+
+    def promote(self) -> bool:
+        """Returns True if an acquire was waiting in the low-priority lane."""
+        self.promoted = True
+        if self._queued is None:
+            return False
+        limiter, waiter = self._queued
+        return limiter._promote(waiter)
+
+
+priority_ticket: ContextVar[Optional[PriorityTicket]] = ContextVar(
+    "priority_ticket", default=None
+)
+
+
+class AdaptiveLimiter:
+    def __init__(
+        self,
+        endpoint: str,
+        key_fingerprint: str,
+        initial: float,
+        min_window: float,
+        max_window: float,
+        latency_target: float,
+    ):
+        self.endpoint = endpoint
+        self.key_fingerprint = key_fingerprint
+        self.min_window = min_window
+        self.max_window = max_window
+        self.latency_target = latency_target
+        self.window = max(min_window, min(max_window, initial))
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._low_waiters: Deque[asyncio.Future] = deque()
+        self._wake_handle: Optional[asyncio.TimerHandle] = None
+        # Counters for monitoring
+        self.successes = 0
+        self.throttled = 0
+        self.errors = 0
+        self.latency_ewma: Optional[float] = None
+
+    @property
+    def capacity(self) -> int:
+        return max(1, int(self.window))
+
+    @property
+    def low_capacity(self) -> int:
+        return max(1, self.capacity // 2)
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(1 for w in self._waiters if not w.done())
+
+    @property
+    def low_queue_depth(self) -> int:
+        return sum(1 for w in self._low_waiters if not w.done())
+
+    def _can_start(self, low_priority: bool = False) -> bool:
+        limit = self.low_capacity if low_priority else self.capacity
+        return self.in_flight < limit and time.monotonic() >= self.blocked_until
+
+    async def acquire(self, low_priority: bool = False) -> LimiterSlot:
+        """
+        Wait for a free slot (FIFO per priority). Slots are handed over
+        directly on release, normal priority first.
+        """
+        ticket = priority_ticket.get() if low_priority else None
+        if ticket is not None and ticket.promoted:
+            low_priority = False
+            ticket = None
+        if (
+            not self._waiters
+            and not (low_priority and self._low_waiters)
+            and self._can_start(low_priority)
+        ):
+            self.in_flight += 1
+            return LimiterSlot(self)
+
+        waiters = self._low_waiters if low_priority else self._waiters
+        waiter = asyncio.get_running_loop().create_future()
+        waiters.append(waiter)
+        if ticket is not None:
+            ticket._queued = (self, waiter)
+        self._schedule_wake()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # We were handed a slot but got cancelled before using it
+                self.in_flight -= 1
+                self._wake()
+            raise
+        finally:
+            if ticket is not None:
+                ticket._queued = None
+            # A promoted waiter has moved to the normal lane
+            for lane in (self._waiters, self._low_waiters):
+                try:
+                    lane.remove(waiter)
+                except ValueError:
+                    pass
+        return LimiterSlot(self)
+
+    def _promote(self, waiter: asyncio.Future) -> bool:
+        if waiter.done() or waiter not in self._low_waiters:
+            return False
+        self._low_waiters.remove(waiter)
+        self._waiters.append(waiter)
+        self._wake()
+        return True
+
+    def _release(
+        self, latency: float, outcome: str, retry_after: Optional[float]
+    ) -> None:
+        self.in_flight -= 1
+
+        if outcome == OK:
+            self.successes += 1
+            self.latency_ewma = (
+                latency
+                if self.latency_ewma is None
+                else 0.8 * self.latency_ewma + 0.2 * latency
+            )
+            if latency > self.latency_target:
+                self.window = max(self.min_window, self.window * 0.9)
+            else:
+                self.window = min(self.max_window, self.window + 1 / self.window)
+        elif outcome == THROTTLED:
+            self.throttled += 1
+            self.window = max(self.min_window, self.window * 0.5)
+            pause = (
+                retry_after
+                if retry_after is not None
+                else settings.LLM_THROTTLE_BACKOFF
+            )
+            self.blocked_until = max(self.blocked_until, time.monotonic() + pause)
+        elif outcome == ERROR:
+            self.errors += 1
+            self.window = max(self.min_window, self.window * 0.75)
+
+        self._wake()
+
+    def _wake(self) -> None:
+        """Hand free slots to queued waiters, or schedule a wake-up after a pause."""
+        while self._waiters and self._can_start():
+            waiter = self._waiters.popleft()
+            if waiter.done():
+                continue
+            self.in_flight += 1
+            waiter.set_result(None)
+        while not self._waiters and self._low_waiters and self._can_start(True):
+            waiter = self._low_waiters.popleft()
+            if waiter.done():
+                continue
+            self.in_flight += 1
+            waiter.set_result(None)
+        self._schedule_wake()
+
+    def _schedule_wake(self) -> None:
+        delay = self.blocked_until - time.monotonic()
+        if delay <= 0 or not (self._waiters or self._low_waiters):
+            return
+        if self._wake_handle is not None and not self._wake_handle.cancelled():
+            self._wake_handle.cancel()
+        self._wake_handle = asyncio.get_running_loop().call_later(delay, self._wake)
+
+    def snapshot(self) -> Dict:
+        return {
+            "endpoint": self.endpoint,
+            "key": self.key_fingerprint,
+            "window": round(self.window, 2),
+            "capacity": self.capacity,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "low_priority_queue_depth": self.low_queue_depth,
+            "paused_for": round(max(0.0, self.blocked_until - time.monotonic()), 2),
+            "successes": self.successes,
+            "throttled": self.throttled,
+            "errors": self.errors,
+            "latency_ewma": (
+                round(self.latency_ewma, 3) if self.latency_ewma is not None else None
+            ),
+        }
+
+
+_limiters: Dict[Tuple[str, str], AdaptiveLimiter] = {}
+
+
+def get_limiter(key_digest: str, endpoint: str) -> AdaptiveLimiter:
+    """Return the shared limiter for an (api key digest, endpoint) pair."""
+    key = (key_digest, endpoint)
+    limiter = _limiters.get(key)
+    if limiter is None:
+        limiter = AdaptiveLimiter(
+            endpoint=endpoint,
+            key_fingerprint=key_digest[:8],
+            initial=settings.MAX_CONCURRENT_WORKERS,
+            min_window=settings.LLM_CONCURRENCY_MIN,
+            max_window=settings.LLM_CONCURRENCY_MAX,
+            latency_target=settings.LLM_LATENCY_TARGET,
+        )
+        _limiters[key] = limiter
+    return limiter
+
+
+def limiter_snapshots(visible: Optional[Set[Tuple[str, str]]] = None) -> List[Dict]:
+    """
+    Every limiter's state. With visible, the endpoint and key fingerprint of
+    limiters whose (api key digest, endpoint) is not in it are left out.
+    """
+    snapshots = []
+    for key, limiter in _limiters.items():
+        snapshot = limiter.snapshot()
+        if visible is not None and key not in visible:
+            snapshot["endpoint"] = snapshot["key"] = None
+        snapshots.append(snapshot)
+    return snapshots
+
+
+def parse_retry_after(headers) -> Optional[float]:
+    """Seconds to wait according to Retry-After / retry-after-ms headers, if any."""
+    if headers is None:
+        return None
+    retry_ms = headers.get("retry-after-ms")
+    if retry_ms:
+        try:
+            return float(retry_ms) / 1000
+        except ValueError:
+            pass
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
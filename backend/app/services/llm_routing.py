@@ -0,0 +1,157 @@
+"""
+LLM Provider Routing
+Ordered provider chains per call type ("index", "lesson", "question", ...).
+The first provider of a chain is the primary; when it has not answered (or,
+for streams, sent its first token) within its rolling latency percentile a
+hedged request goes to the next one and whichever answers first wins. Hard
+failures fall through the chain in order.
+
+Providers are configured with LLM_PROVIDERS / LLM_PROVIDER_CHAINS; "default"
+is always the global OPENAI_* endpoint (or the user's custom one).
+"""
+
+import logging
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Set, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROVIDER = "default"
+
+
+class Provider:
+    """One OpenAI-compatible endpoint, key and model a call can be sent to."""
+
+    __slots__ = ("name", "api_key", "base_url", "model")
+
+    def __init__(self, name: str, api_key: str, base_url: str, model: str):
+        self.name = name
+        self.api_key = api_key
+        self.base_url = base_url
+        self.model = model
+
+    def __repr__(self) -> str:
+        return f"Provider({self.name!r}, {self.base_url!r}, {self.model!r})"
+
+
+def configured_provider(name: str) -> Optional[Provider]:
+    """A provider from LLM_PROVIDERS, or None if it is not configured."""
+    config = settings.LLM_PROVIDERS.get(name)
+    if not config:
+        return None
+    return Provider(
+        name,
+        config.get("api_key") or settings.OPENAI_API_KEY,
+        config.get("base_url") or settings.OPENAI_BASE_URL,
+        config.get("model") or settings.LLM_MODEL,
+    )
+
+
+def provider_chain(
+    call_site: str, primary: Provider, custom_endpoint: bool = False
+) -> List[Provider]:
+    """
+    Providers to try for a call type, in order. primary stands in for
+    "default". A user's custom endpoint always comes first and is only
+    followed by the server's providers with LLM_CUSTOM_ENDPOINT_FALLBACK.
+    """
+    chains = settings.LLM_PROVIDER_CHAINS
+    names = chains.get(call_site) or chains.get(DEFAULT_PROVIDER) or []
+    if custom_endpoint:
+        if not settings.LLM_CUSTOM_ENDPOINT_FALLBACK:
+            return [primary]
+        names = [name for name in names if name != DEFAULT_PROVIDER]
+
+    chain = [primary] if custom_endpoint or not names else []
+    for name in names:
+        if name == DEFAULT_PROVIDER:
+            chain.append(primary)
+            continue
+        provider = configured_provider(name)
+        if provider is None:
+            logger.warning("Unknown LLM provider %r in chain for %s", name, call_site)
+            continue
+        chain.append(provider)
+    return chain or [primary]
+
+
+class LatencyTracker:
+    """
+    Rolling window of latencies per (provider, call site, streamed): time to
+    first token for streams, full response time otherwise.
+    """
+
+    def __init__(self, window: int):
+        self.window = window
+        self._samples: Dict[Tuple[str, str, bool], Deque[float]] = {}
+
+    def add(self, provider: str, call_site: str, streamed: bool, latency: float):
+        key = (provider, call_site, streamed)
+        samples = self._samples.get(key)
+        if samples is None:
+            samples = self._samples[key] = deque(maxlen=self.window)
+        samples.append(latency)
+
+    def percentile(
+        self, provider: str, call_site: str, streamed: bool, q: float
+    ) -> Optional[float]:
+        samples = self._samples.get((provider, call_site, streamed))
+        if not samples or len(samples) < settings.LLM_HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def snapshot(self, visible: Optional[Set[str]] = None) -> List[Dict]:
+        """Rows per provider; names not in visible are shown as "custom"."""
+        rows = []
+        for (provider, call_site, streamed), samples in self._samples.items():
+            ordered = sorted(samples)
+            if visible is not None and provider not in visible:
+                provider = "custom"  # Another user's endpoint
+            rows.append(
+                {
+                    "provider": provider,
+                    "call_site": call_site,
+                    "streamed": streamed,
+                    "samples": len(ordered),
+                    "p50": round(ordered[len(ordered) // 2], 3),
+                    "p95": round(
+                        ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))], 3
+                    ),
+                }
+            )
+        return rows
+
+
+latency_tracker = LatencyTracker(settings.LLM_HEDGE_WINDOW)
+
+# Running totals, exposed through GET /llm/providers
+routing_stats: Dict[str, int] = {
+    "calls": 0,
+    "hedged": 0,  # Hedged requests sent
+    "hedge_wins": 0,  # ... that answered before the primary
+    "fallbacks": 0,  # Providers tried after a hard failure
+    "failed": 0,  # Calls where every provider failed
+}
+
+
+def hedge_delay(provider: Provider, call_site: str, streamed: bool) -> Optional[float]:
+    """
+    Seconds to wait for a provider before sending a hedged request, or None
+    (no hedging) until LLM_HEDGE_MIN_SAMPLES latencies were observed.
+    """
+    observed = latency_tracker.percentile(
+        provider.name, call_site, streamed, settings.LLM_HEDGE_PERCENTILE
+    )
+    if observed is None:
+        return None
+    return max(settings.LLM_HEDGE_MIN_DELAY, observed)
+
+
+def record_latency(
+    provider: Provider, call_site: str, streamed: bool, started: float
+) -> None:
+    latency_tracker.add(provider.name, call_site, streamed, time.monotonic() - started)
@@ -1,12 +1,38 @@
+import asyncio
+import hashlib
 import json
 import os
-import sys
+import time
 import logging
+from functools import lru_cache
+import openai
 from openai import AsyncOpenAI
 import httpx
 from app.core.config import settings
 from app.core.security import decrypt_value
-from typing import Optional
+from app.services.course_context import build_lesson_context
+from app.services.lesson_retrieval import build_question_context
+from app.services.llm_limiter import (
+    ERROR,
+    IGNORED,
+    OK,
+    THROTTLED,
+    LimiterSlot,
+    get_limiter,
+    parse_retry_after,
+)
+from app.services.llm_routing import (
+    DEFAULT_PROVIDER,
+    Provider,
+    configured_provider,
+    hedge_delay,
+    provider_chain,
+    record_latency,
+    routing_stats,
+)
+from app.services.response_cache import llm_cache_key, llm_response_cache
+from app.services.usage_recorder import usage_recorder
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
@@ -27,24 +53,7 @@ for _var in _CRED_VARS:
 os.environ["NO_GCE_CHECK"] = "true"
 os.environ["GOOGLE_GENAI_USE_VERTEXAI"] = "false"
 
-logger.warning("=== LLM SERVICE MODULE LOADED ===")
-logger.warning("ENV VARS AFTER CLEANUP:")
-for _var in _CRED_VARS + (
-    "NO_GCE_CHECK",
-    "GOOGLE_GENAI_USE_VERTEXAI",
-    "DATABASE_URL",
-    "LLM_MODEL",
-    "DEFAULT_LANGUAGE",
-):
-    val = os.environ.get(_var, "<NOT SET>")
-    if val not in ("<NOT SET>", "true", "false") and len(val) > 8:
-        val = val[:4] + "***" + val[-4:]
-    logger.warning(f"  {_var}={val}")
-
-logger.warning(
-    "GOOGLE-AUTH MODULES IN sys.modules: %s",
-    [k for k in sys.modules if "google" in k.lower()],
-)
+logger.debug("LLM credential env vars cleared: %s", ", ".join(_CRED_VARS))
 
 
 def _mask(s: str) -> str:
@@ -53,44 +62,127 @@ def _mask(s: str) -> str:
     return s[:4] + "***" + s[-4:]
 
 
-def _get_client(user=None) -> AsyncOpenAI:
-    logger.warning("=== _get_client called ===")
+class _PooledClient:
+    """A cached AsyncOpenAI client and the last time it was handed out."""
+
+    __slots__ = ("client", "last_used")
+
+    def __init__(self, client: AsyncOpenAI, last_used: float):
+        self.client = client
+        self.last_used = last_used
+
+
+# Pooled clients keyed by (sha256(api_key), base_url). Each client owns its own
+# httpx pool, so connections (and TLS sessions) are reused across calls.
+_client_pool: Dict[Tuple[str, str], _PooledClient] = {}
+
 
-    # Log env state at call time (may differ from module load time)
-    for _var in _CRED_VARS:
-        logger.warning("  env[%s]=%s", _var, os.environ.get(_var, "<NOT SET>"))
+@lru_cache(maxsize=256)
+def _decrypt_key(encrypted: str) -> str:
+    return decrypt_value(encrypted)
 
+
+def _resolve_credentials(user=None) -> Tuple[str, str]:
+    """Return (api_key, base_url) for the user, falling back to global settings."""
     if user and getattr(user, "custom_openai_api_key", None):
-        encrypted = user.custom_openai_api_key
-        api_key = decrypt_value(encrypted)
+        api_key = _decrypt_key(user.custom_openai_api_key)
         base_url = (
             getattr(user, "custom_openai_base_url", None) or settings.OPENAI_BASE_URL
         )
+        return api_key, base_url
+    return settings.OPENAI_API_KEY, settings.OPENAI_BASE_URL
 
-        logger.warning("  source=USER_CUSTOM")
-        logger.warning("  encrypted_stored=%s", _mask(encrypted))
-        logger.warning("  decrypted_key=%s", _mask(api_key))
-        logger.warning("  decrypted_is_same_as_encrypted=%s", api_key == encrypted)
-        logger.warning("  base_url=%s", base_url)
-        logger.warning("  settings.OPENAI_API_KEY=%s", _mask(settings.OPENAI_API_KEY))
-        logger.warning("  settings.OPENAI_BASE_URL=%s", settings.OPENAI_BASE_URL)
-    else:
-        api_key = settings.OPENAI_API_KEY
-        base_url = settings.OPENAI_BASE_URL
-        logger.warning("  source=GLOBAL_SETTINGS")
-        logger.warning("  api_key=%s", _mask(api_key))
-        logger.warning("  base_url=%s", base_url)
-        logger.warning("  user=%s", user)
-        if user:
-            logger.warning(
-                "  user.custom_openai_api_key=%s",
-                getattr(user, "custom_openai_api_key", "<attr missing>"),
-            )
 
-    client = AsyncOpenAI(api_key=api_key, base_url=base_url)
-    logger.warning("  client._api_key=%s", _mask(str(client.api_key)))
-    logger.warning("  client.base_url=%s", client.base_url)
-    return client
+def _pool_key(api_key: str, base_url: str) -> Tuple[str, str]:
+    digest = hashlib.sha256((api_key or "").encode()).hexdigest()
+    return digest, (base_url or "").rstrip("/")
+
+
+def _build_http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        http2=settings.LLM_HTTP2,
+        limits=httpx.Limits(
+            max_connections=settings.LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.LLM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(
+            settings.LLM_READ_TIMEOUT, connect=settings.LLM_CONNECT_TIMEOUT
+        ),
+    )
+
+
+def _close_later(client: AsyncOpenAI) -> None:
+    """Close a client without blocking the caller (needs a running loop)."""
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    loop.create_task(client.close())
+
+
+def _evict_idle_clients(now: float) -> None:
+    ttl = settings.LLM_CLIENT_IDLE_TTL
+    expired = [k for k, e in _client_pool.items() if now - e.last_used > ttl]
+    for key in expired:
+        entry = _client_pool.pop(key)
+        logger.info("Evicting idle LLM client for %s", key[1])
+        _close_later(entry.client)
+
+
+def _get_client(user=None) -> AsyncOpenAI:
+    return _client_for(*_resolve_credentials(user))
+
+
+def _client_for(api_key: str, base_url: str) -> AsyncOpenAI:
+    key = _pool_key(api_key, base_url)
+    now = time.monotonic()
+    _evict_idle_clients(now)
+
+    entry = _client_pool.get(key)
+    if entry is None:
+        # Retries are done by _create_completion so the limiter sees every 429
+        client = AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            http_client=_build_http_client(),
+            max_retries=0,
+        )
+        entry = _PooledClient(client, now)
+        _client_pool[key] = entry
+        logger.info(
+            "Created pooled LLM client: base_url=%s api_key=%s (pool size %d)",
+            base_url,
+            _mask(api_key),
+            len(_client_pool),
+        )
+    entry.last_used = now
+    return entry.client
+
+
+def invalidate_client(user) -> None:
+    """
+    Drop the pooled client for the user's custom credentials.
+    Call this before the user's stored key/base URL change.
+    The shared client built from global settings is never dropped here.
+    """
+    if not user or not getattr(user, "custom_openai_api_key", None):
+        return
+    key = _pool_key(*_resolve_credentials(user))
+    if key == _pool_key(settings.OPENAI_API_KEY, settings.OPENAI_BASE_URL):
+        return
+    entry = _client_pool.pop(key, None)
+    if entry is not None:
+        logger.info("Invalidated pooled LLM client for user %s", user.id)
+        _close_later(entry.client)
+
+
+async def close_clients() -> None:
+    """Close every pooled client (used on application shutdown)."""
+    entries = list(_client_pool.values())
+    _client_pool.clear()
+    for entry in entries:
+        await entry.client.close()
 
 
 def _get_model(user=None) -> str:
@@ -100,6 +192,435 @@ def _get_model(user=None) -> str:
     return settings.LLM_MODEL
 
 
+def _primary_provider(user=None) -> Provider:
+    """The user's custom endpoint, or the global one ("default")."""
+    api_key, base_url = _resolve_credentials(user)
+    custom = bool(user and getattr(user, "custom_openai_api_key", None))
+    name = f"custom:{base_url}" if custom else DEFAULT_PROVIDER
+    return Provider(name, api_key, base_url, _get_model(user))
+
+
+def visible_providers(user) -> List[Provider]:
+    """
+    Providers whose endpoint a user may see in monitoring: their own and the
+    server's, never another user's custom endpoint.
+    """
+    providers = [
+        _primary_provider(user),
+        Provider(
+            DEFAULT_PROVIDER,
+            settings.OPENAI_API_KEY,
+            settings.OPENAI_BASE_URL,
+            settings.LLM_MODEL,
+        ),
+    ]
+    for name in settings.LLM_PROVIDERS:
+        provider = configured_provider(name)
+        if provider is not None:
+            providers.append(provider)
+    return providers
+
+
+def _get_providers(user, call_site: str) -> List[Provider]:
+    custom = bool(user and getattr(user, "custom_openai_api_key", None))
+    return provider_chain(call_site, _primary_provider(user), custom_endpoint=custom)
+
+
+def _classify_error(e: Exception) -> Tuple[str, Optional[float]]:
+    """Map an OpenAI SDK exception to a limiter outcome and Retry-After seconds."""
+    if isinstance(e, openai.APIStatusError):
+        retry_after = parse_retry_after(e.response.headers)
+        if e.status_code == 429:
+            return THROTTLED, retry_after
+        if e.status_code >= 500:
+            return ERROR, retry_after
+        return IGNORED, None
+    if isinstance(e, openai.APIConnectionError):  # Includes timeouts
+        return ERROR, None
+    return IGNORED, None
+
+
+class _PrimedStream:
+    """A chat completion stream whose first chunk has already been received."""
+
+    def __init__(self, stream, first):
+        self.stream = stream
+        self.first = first
+
+    async def __aiter__(self):
+        if self.first is not None:
+            yield self.first
+        async for chunk in self.stream:
+            yield chunk
+
+    async def close(self) -> None:
+        await self.stream.close()
+
+
+async def _call_provider(
+    provider: Provider,
+    prompt: str,
+    temperature: float,
+    stream: bool,
+    low_priority: bool,
+    acquired: Optional[asyncio.Future] = None,
+) -> Tuple[Any, LimiterSlot]:
+    """
+    Call chat.completions.create on one provider through its adaptive limiter,
+    retrying 429s, 5xx and connection errors up to LLM_MAX_RETRIES times.
+    Streams are returned once their first chunk arrived. acquired gets the
+    time the first limiter slot was obtained (the end of local queueing).
+    """
+    limiter = get_limiter(*_pool_key(provider.api_key, provider.base_url))
+    client = _client_for(provider.api_key, provider.base_url)
+    max_retries = settings.LLM_MAX_RETRIES
+    for attempt in range(max_retries + 1):
+        slot = await limiter.acquire(low_priority)
+        if acquired is not None and not acquired.done():
+            acquired.set_result(slot.started)
+        response = None
+        try:
+            response = await client.chat.completions.create(
+                model=provider.model,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=temperature,
+                stream=stream,
+                **(
+                    {"stream_options": {"include_usage": True}}
+                    if stream and settings.LLM_STREAM_USAGE
+                    else {}
+                ),
+            )
+            if stream:
+                try:
+                    first = await response.__anext__()
+                except StopAsyncIteration:
+                    first = None
+                slot.mark_first_token()
+                response = _PrimedStream(response, first)
+        except Exception as e:
+            if stream and response is not None:
+                await response.close()
+            outcome, retry_after = _classify_error(e)
+            slot.release(outcome, retry_after)
+            if outcome == IGNORED or attempt == max_retries:
+                raise
+            logger.warning(
+                "LLM call to %s failed (%s), retry %d/%d",
+                provider.name,
+                e,
+                attempt + 1,
+                max_retries,
+            )
+            # After a 429 the limiter itself pauses every caller
+            if outcome == ERROR:
+                await asyncio.sleep(
+                    retry_after if retry_after is not None else min(2**attempt, 10)
+                )
+            continue
+        except BaseException:
+            if stream and response is not None:
+                await asyncio.shield(response.close())
+            slot.release(IGNORED)
+            raise
+
+        if not stream:
+            slot.release(OK)
+        return response, slot
+
+
+async def _discard(task: asyncio.Task) -> None:
+    """Cancel a losing call; close its stream if it already had one."""
+    if not task.done():
+        task.cancel()
+    try:
+        response, slot = await task
+    except BaseException:
+        return
+    if isinstance(response, _PrimedStream):
+        await response.close()
+        slot.release(IGNORED)
+
+
+async def _create_completion(
+    user,
+    prompt: str,
+    temperature: float,
+    stream: bool = False,
+    low_priority: bool = False,
+    call_site: str = "other",
+) -> Tuple[Any, LimiterSlot, Provider]:
+    """
+    Run a chat completion on the provider chain of call_site. When the
+    current provider has not answered (streams: sent a first token) within
+    its hedge delay, the next provider is asked too and the first answer
+    wins, the other call is cancelled. Hard failures fall back in order.
+    low_priority calls (prefetching) yield to every other caller.
+    Returns (response, slot, provider). For streams the slot is still held
+    and must be released by the caller when the stream ends.
+    """
+    providers = _get_providers(user, call_site)
+    hedging = settings.LLM_HEDGE_ENABLED and not low_priority
+    routing_stats["calls"] += 1
+    # task -> (provider, future of the time it got a limiter slot, is a
+    # hedged request). Time queued in the local limiter is not the
+    # provider's latency: hedge delays and latency samples start at the slot.
+    pending: Dict[asyncio.Task, Tuple[Provider, asyncio.Future, bool]] = {}
+    next_index = 0
+    last_error: Optional[BaseException] = None
+
+    def launch(hedge: bool = False) -> None:
+        nonlocal next_index
+        provider = providers[next_index]
+        next_index += 1
+        acquired = asyncio.get_running_loop().create_future()
+        task = asyncio.create_task(
+            _call_provider(
+                provider, prompt, temperature, stream, low_priority, acquired
+            )
+        )
+        pending[task] = (provider, acquired, hedge)
+
+    def record(provider: Provider, acquired: asyncio.Future) -> None:
+        if acquired.done():
+            record_latency(provider, call_site, stream, acquired.result())
+
+    launch()
+    try:
+        while pending:
+            timeout = None
+            waits = set(pending)
+            if hedging and len(pending) == 1 and next_index < len(providers):
+                _, acquired, _ = next(iter(pending.values()))
+                if acquired.done():
+                    delay = hedge_delay(providers[next_index - 1], call_site, stream)
+                    if delay is not None:
+                        timeout = max(0.0, acquired.result() + delay - time.monotonic())
+                else:
+                    waits.add(acquired)  # Start the hedge timer once it has a slot
+            done, _ = await asyncio.wait(
+                waits, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+            )
+            done = {task for task in done if task in pending}
+            if not done:
+                if timeout is None:
+                    continue  # The call got its slot
+                logger.info(
+                    "No answer from %s after %.1fs, hedging to %s",
+                    providers[next_index - 1].name,
+                    time.monotonic() - acquired.result(),
+                    providers[next_index].name,
+                )
+                routing_stats["hedged"] += 1
+                launch(hedge=True)
+                continue
+
+            winner = None
+            for task in done:
+                provider, acquired, hedge = pending.pop(task)
+                if task.exception() is not None:
+                    last_error = task.exception()
+                    logger.warning(
+                        "LLM provider %s failed: %s", provider.name, last_error
+                    )
+                elif winner is None:
+                    response, slot = task.result()
+                    winner = (response, slot, provider)
+                    record(provider, acquired)
+                    if hedge:
+                        routing_stats["hedge_wins"] += 1
+                else:
+                    await _discard(task)
+            if winner is not None:
+                for loser_provider, loser_acquired, _ in pending.values():
+                    # A lower bound of the loser's latency keeps its p95 honest
+                    record(loser_provider, loser_acquired)
+                return winner
+            # A failed provider is replaced right away, even while a
+            # hedged call is still running
+            if len(pending) < 2 and next_index < len(providers):
+                routing_stats["fallbacks"] += 1
+                logger.info(
+                    "Falling back to LLM provider %s", providers[next_index].name
+                )
+                launch()
+    finally:
+        for task in list(pending):
+            await _discard(task)
+
+    routing_stats["failed"] += 1
+    raise last_error
+
+
+def _record_usage(
+    user,
+    call_site: str,
+    started: float,
+    usage=None,
+    first_token_at: Optional[float] = None,
+    streamed: bool = False,
+    cache_hit: bool = False,
+    success: bool = True,
+    provider: Optional[Provider] = None,
+) -> None:
+    """
+    Queue an llm_usage row for this call (written in batches, never blocks).
+    provider is the one that answered, the user's primary one by default.
+    """
+    details = getattr(usage, "prompt_tokens_details", None)
+    provider = provider or _primary_provider(user)
+    usage_recorder.record(
+        user_id=getattr(user, "id", None),
+        call_site=call_site,
+        model=provider.model,
+        endpoint=provider.base_url or "default",
+        prompt_tokens=getattr(usage, "prompt_tokens", None) or 0,
+        completion_tokens=getattr(usage, "completion_tokens", None) or 0,
+        cached_tokens=getattr(details, "cached_tokens", None) or 0,
+        latency_ms=int((time.monotonic() - started) * 1000),
+        ttft_ms=(
+            int((first_token_at - started) * 1000)
+            if first_token_at is not None
+            else None
+        ),
+        streamed=streamed,
+        cache_hit=cache_hit,
+        success=success,
+    )
+
+
+def _cache_key(provider: Provider, prompt: str, temperature: float, language: str):
+    """
+    Response cache key. Answers are cached under the provider that gave them
+    and looked up under the first provider of the call site's chain.
+    """
+    return llm_cache_key(
+        provider.name, provider.base_url, provider.model, prompt, temperature, language
+    )
+
+
+async def _complete(
+    user,
+    prompt: str,
+    temperature: float = 0.7,
+    language: str = None,
+    use_cache: bool = False,
+    call_site: str = "other",
+    low_priority: bool = False,
+) -> str:
+    """
+    Run a chat completion and return the raw message content.
+    With use_cache (and LLM_CACHE_ENABLED) identical requests are served from
+    the response cache. Every call is recorded in llm_usage under call_site.
+    """
+    started = time.monotonic()
+    use_cache = use_cache and settings.LLM_CACHE_ENABLED
+    if use_cache:
+        first = _get_providers(user, call_site)[0]
+        cache_key = _cache_key(first, prompt, temperature, language)
+        cached = await llm_response_cache.get(cache_key)
+        if cached is not None:
+            logger.info("LLM response cache hit (%s)", cache_key[:12])
+            _record_usage(user, call_site, started, cache_hit=True, provider=first)
+            return cached
+
+    try:
+        response, _, provider = await _create_completion(
+            user, prompt, temperature, low_priority=low_priority, call_site=call_site
+        )
+    except Exception:
+        _record_usage(user, call_site, started, success=False)
+        raise
+    content = response.choices[0].message.content
+    _record_usage(user, call_site, started, usage=response.usage, provider=provider)
+
+    if use_cache and content:
+        await llm_response_cache.set(
+            _cache_key(provider, prompt, temperature, language), content
+        )
+    return content
+
+
+async def _stream_completion(
+    user,
+    prompt: str,
+    temperature: float = 0.7,
+    language: str = None,
+    use_cache: bool = False,
+    call_site: str = "other",
+) -> AsyncIterator[str]:
+    """
+    Run a streaming chat completion and yield the non-empty content deltas.
+    The upstream response is closed when the consumer stops iterating
+    (including on cancellation), so abandoned streams stop generating tokens.
+    A cached response is yielded as a single delta; a fully received stream
+    is written back to the cache.
+    """
+    started = time.monotonic()
+    use_cache = use_cache and settings.LLM_CACHE_ENABLED
+    if use_cache:
+        first = _get_providers(user, call_site)[0]
+        cache_key = _cache_key(first, prompt, temperature, language)
+        cached = await llm_response_cache.get(cache_key)
+        if cached is not None:
+            logger.info("LLM response cache hit (%s)", cache_key[:12])
+            _record_usage(
+                user,
+                call_site,
+                started,
+                streamed=True,
+                cache_hit=True,
+                provider=first,
+            )
+            yield cached
+            return
+
+    try:
+        stream, slot, provider = await _create_completion(
+            user, prompt, temperature, stream=True, call_site=call_site
+        )
+    except Exception:
+        _record_usage(user, call_site, started, streamed=True, success=False)
+        raise
+    parts = []
+    outcome = IGNORED
+    usage = None
+    try:
+        async for chunk in stream:
+            slot.mark_first_token()
+            if getattr(chunk, "usage", None) is not None:
+                usage = chunk.usage  # Sent on the last chunk with include_usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                yield delta
+        outcome = OK
+    except Exception:
+        outcome = ERROR
+        raise
+    finally:
+        await stream.close()
+        slot.release(outcome)
+        # Abandoned streams (IGNORED) are recorded as unsuccessful too
+        _record_usage(
+            user,
+            call_site,
+            started,
+            usage=usage,
+            first_token_at=slot.first_token_at,
+            streamed=True,
+            success=outcome == OK,
+            provider=provider,
+        )
+
+    if use_cache and parts:
+        await llm_response_cache.set(
+            _cache_key(provider, prompt, temperature, language), "".join(parts)
+        )
+
+
 class LLMService:
     @staticmethod
     def _get_language_instruction(language: str) -> str:
@@ -120,7 +641,7 @@ class LLMService:
         return f"Respond in {lang_name}."
 
     @staticmethod
-    async def generate_course_index(
+    async def _build_course_index_prompt(
         topic: str,
         instructions: str = None,
         language: str = "en",
@@ -174,14 +695,11 @@ class LLMService:
         Provide ONLY the JSON output. Do not include markdown formatting (like ```json), just the raw JSON.
         Make the course deep and comprehensive.
         """
+        return prompt
 
-        response = await _get_client(user).chat.completions.create(
-            model=_get_model(user),
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.7,
-        )
-
-        content = response.choices[0].message.content.strip()
+    @staticmethod
+    def _clean_course_index(content: str) -> str:
+        content = content.strip()
         # Simple cleanup if the LLM wraps in code blocks despite instructions
         if content.startswith("```json"):
             content = content[7:]
@@ -193,7 +711,55 @@ class LLMService:
         return content.strip()
 
     @staticmethod
-    async def generate_lesson_content(
+    async def generate_course_index(
+        topic: str,
+        instructions: str = None,
+        language: str = "en",
+        use_web_research: bool = False,
+        user=None,
+        use_cache: bool = True,
+    ) -> str:
+        prompt = await LLMService._build_course_index_prompt(
+            topic, instructions, language, use_web_research, user
+        )
+        content = await _complete(
+            user,
+            prompt,
+            temperature=0.7,
+            language=language,
+            use_cache=use_cache,
+            call_site="index",
+        )
+        return LLMService._clean_course_index(content)
+
+    @staticmethod
+    async def stream_course_index(
+        topic: str,
+        instructions: str = None,
+        language: str = "en",
+        use_web_research: bool = False,
+        user=None,
+        use_cache: bool = True,
+    ) -> AsyncIterator[str]:
+        """
+        Same as generate_course_index, but yields the raw content deltas as
+        the model produces them. Clean the joined text with _clean_course_index.
+        """
+        prompt = await LLMService._build_course_index_prompt(
+            topic, instructions, language, use_web_research, user
+        )
+        async for delta in _stream_completion(
+            user,
+            prompt,
+            temperature=0.7,
+            language=language,
+            use_cache=use_cache,
+            call_site="index",
+        ):
+            yield delta
+
+    @staticmethod
+    async def _build_lesson_prompt(
         topic: str,
         lesson_title: str,
         context_index: str,
@@ -201,18 +767,32 @@ class LLMService:
         feedback: str = None,
         use_web_research: bool = False,
         user=None,
+        lesson_path: str = None,
+        research_context: str = None,
     ) -> str:
+        """
+        research_context is web context already retrieved for this lesson
+        (course research mode); when given, no per-lesson search is run.
+        """
         lang_instruction = LLMService._get_language_instruction(language).replace(
             "Respond", "Write the lesson"
         )
 
+        # Send an outline around this lesson rather than the whole index
+        if lesson_path and settings.LLM_COMPACT_CONTEXT:
+            context_index = build_lesson_context(
+                context_index, lesson_path, lesson_title
+            )
+
         feedback_instruction = ""
         if feedback:
             feedback_instruction = f"\n\nIMPORTANT: The user provided this feedback about the previous version:\n{feedback}\nPlease address these concerns and improve the lesson accordingly."
 
         # Get web context only if requested
         web_context = ""
-        if use_web_research:
+        if research_context is not None:
+            web_context = research_context
+        elif use_web_research:
             from app.services.tavily_service import TavilyService
 
             tavily = TavilyService.for_user(user)
@@ -251,33 +831,102 @@ class LLMService:
         Do not use LaTeX math delimiters like \\(. Use standard markdown.
         Make it engaging and clear.{feedback_instruction}
         """
+        return prompt
+
+    @staticmethod
+    async def generate_lesson_content(
+        topic: str,
+        lesson_title: str,
+        context_index: str,
+        language: str = "en",
+        feedback: str = None,
+        use_web_research: bool = False,
+        user=None,
+        use_cache: bool = True,
+        lesson_path: str = None,
+        low_priority: bool = False,
+        research_context: str = None,
+    ) -> str:
+        """
+        Generate the markdown for one lesson.
+        Pass use_cache=False to force a fresh generation (e.g. regenerations).
+        With lesson_path the index is reduced to a token-budgeted outline.
+        low_priority is used for speculative (prefetch) generations.
+        """
+        prompt = await LLMService._build_lesson_prompt(
+            topic,
+            lesson_title,
+            context_index,
+            language,
+            feedback,
+            use_web_research=use_web_research,
+            user=user,
+            lesson_path=lesson_path,
+            research_context=research_context,
+        )
 
-        response = await _get_client(user).chat.completions.create(
-            model=_get_model(user),
-            messages=[{"role": "user", "content": prompt}],
+        content = await _complete(
+            user,
+            prompt,
             temperature=0.7,
+            language=language,
+            use_cache=use_cache,
+            call_site="prefetch" if low_priority else "lesson",
+            low_priority=low_priority,
         )
+        return content.strip()
 
-        return response.choices[0].message.content.strip()
+    @staticmethod
+    async def stream_lesson_content(
+        topic: str,
+        lesson_title: str,
+        context_index: str,
+        language: str = "en",
+        feedback: str = None,
+        use_web_research: bool = False,
+        user=None,
+        use_cache: bool = True,
+        lesson_path: str = None,
+    ) -> AsyncIterator[str]:
+        """
+        Same as generate_lesson_content, but yields content deltas as the
+        model produces them. The caller is responsible for joining them.
+        """
+        prompt = await LLMService._build_lesson_prompt(
+            topic,
+            lesson_title,
+            context_index,
+            language,
+            feedback,
+            use_web_research=use_web_research,
+            user=user,
+            lesson_path=lesson_path,
+        )
+
+        async for delta in _stream_completion(
+            user,
+            prompt,
+            temperature=0.7,
+            language=language,
+            use_cache=use_cache,
+            call_site="lesson",
+        ):
+            yield delta
 
     @staticmethod
-    async def answer_lesson_question(
+    async def _build_question_prompt(
         lesson_title: str,
         lesson_content: str,
         question: str,
         language: str = "en",
         user=None,
+        lesson_id: int = None,
     ) -> str:
-        """
-        Answer a user question about a specific lesson using lesson context.
-        Uses Tavily to get current information if relevant.
-        """
         lang_instruction = LLMService._get_language_instruction(language)
 
-        # Limit context to avoid token limits (keep first 4000 chars)
-        truncated_content = (
-            lesson_content[:4000] if len(lesson_content) > 4000 else lesson_content
-        )
+        # Only the parts of the lesson relevant to the question (BM25 over
+        # heading-aware chunks), within LESSON_QA_CONTEXT_TOKENS
+        truncated_content = build_question_context(lesson_id, lesson_content, question)
 
         # ALWAYS try to get web context for questions (good for current events)
         web_context = ""
@@ -314,11 +963,48 @@ class LLMService:
         - Only cite sources you actually used in your answer
         - If no web sources were used, don't add the Fonti section
         """
+        return prompt
 
-        response = await _get_client(user).chat.completions.create(
-            model=_get_model(user),
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.7,
+    @staticmethod
+    async def answer_lesson_question(
+        lesson_title: str,
+        lesson_content: str,
+        question: str,
+        language: str = "en",
+        user=None,
+        lesson_id: int = None,
+    ) -> str:
+        """
+        Answer a user question about a specific lesson using lesson context.
+        Uses Tavily to get current information if relevant.
+        With lesson_id the lesson's cached chunk index is used for retrieval.
+        """
+        prompt = await LLMService._build_question_prompt(
+            lesson_title, lesson_content, question, language, user, lesson_id
+        )
+
+        content = await _complete(user, prompt, temperature=0.7, call_site="question")
+        return content.strip()
+
+    @staticmethod
+    async def stream_lesson_answer(
+        lesson_title: str,
+        lesson_content: str,
+        question: str,
+        language: str = "en",
+        user=None,
+        lesson_id: int = None,
+    ) -> AsyncIterator[str]:
+        """
+        Streaming variant of answer_lesson_question, yields answer deltas.
+        Closing the iterator (or cancelling its consumer) aborts the upstream
+        completion.
+        """
+        prompt = await LLMService._build_question_prompt(
+            lesson_title, lesson_content, question, language, user, lesson_id
         )
 
-        return response.choices[0].message.content.strip()
+        async for delta in _stream_completion(
+            user, prompt, temperature=0.7, call_site="question"
+        ):
+            yield delta
@@ -0,0 +1,108 @@
+"""
+PDF Merge
+Full-course PDFs assembled from the lesson PDFs instead of typesetting the
+whole course again: only a short cover (title, description, table of
+contents) goes through LaTeX, then pypdf appends every lesson PDF with a
+bookmark per lesson (the lesson's own outline nested under it). Lessons
+whose PDF is missing or stale are re-rendered first; a PDF is stale when
+the markdown saved next to it is not the lesson's current content.
+"""
+
+import asyncio
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from app.models.base import Course, Lesson
+from app.services import course_export, lesson_service
+from app.services.pdf_service import PDFService
+
+logger = logging.getLogger(__name__)
+
+# Running totals, exposed through GET /render/cache
+merge_stats: Dict[str, int] = {
+    "merges": 0,
+    "lessons_reused": 0,  # Lesson PDFs appended as they were
+    "lessons_rendered": 0,  # ... re-rendered first (missing or stale)
+    "failed": 0,
+}
+
+
+def fresh_lesson_pdf(lesson: Lesson) -> Optional[Path]:
+    """The lesson's PDF if it exists and was rendered from its current content."""
+    if not lesson.pdf_path:
+        return None
+    pdf_file = PDFService.BASE_DIR / lesson.pdf_path
+    md_file = pdf_file.with_suffix(".md")
+    try:
+        if md_file.stat().st_mtime > pdf_file.stat().st_mtime:
+            return None  # Saved for a render that has not finished (or failed)
+        with open(md_file, encoding="utf-8") as f:
+            if f.read() != (lesson.content_markdown or ""):
+                return None
+    except OSError:
+        return None
+    return pdf_file
+
+
+async def _lesson_pdf(lesson: Lesson, user_id: int, course_title: str):
+    pdf_file = fresh_lesson_pdf(lesson)
+    if pdf_file is not None:
+        merge_stats["lessons_reused"] += 1
+        return pdf_file
+    merge_stats["lessons_rendered"] += 1
+    pdf_path = await lesson_service.render_lesson_pdf(lesson, user_id, course_title)
+    return PDFService.BASE_DIR / pdf_path if pdf_path else None
+
+
+def _merge(cover: Path, parts: List[Tuple[str, Path]], title: str, out: Path):
+    from pypdf import PdfWriter
+
+    writer = PdfWriter()
+    writer.append(str(cover), import_outline=False)
+    for bookmark, pdf_file in parts:
+        writer.append(str(pdf_file), outline_item=bookmark)
+    writer.add_metadata({"/Title": title})
+    with open(out, "wb") as f:
+        writer.write(f)
+    writer.close()
+
+
+async def build_merged_pdf(
+    course: Course, lessons: List[Lesson], user_id: int, out_file: Path
+) -> bool:
+    """Write the course PDF to out_file from the cover and the lesson PDFs."""
+    lessons = course_export.sorted_lessons(lessons)
+    pdf_files = await asyncio.gather(
+        *(_lesson_pdf(lesson, user_id, course.title) for lesson in lessons)
+    )
+    missing = [l.path_in_index for l, f in zip(lessons, pdf_files) if f is None]
+    if missing:
+        logger.warning(f"Cannot merge course {course.id}, no PDF for {missing}")
+        merge_stats["failed"] += 1
+        return False
+
+    cover_md = out_file.with_suffix(".cover.md")
+    cover_pdf = cover_md.with_suffix(".pdf")
+    with open(cover_md, "w", encoding="utf-8") as f:
+        f.write(course_export.build_cover_markdown(course, lessons))
+    try:
+        label = f"{PDFService._sanitize_filename(course.title)} cover"
+        if not await PDFService.render_pdf(cover_md, cover_pdf, label, toc=False):
+            merge_stats["failed"] += 1
+            return False
+        parts = [
+            (f"{lesson.path_in_index}. {lesson.title}", pdf_file)
+            for lesson, pdf_file in zip(lessons, pdf_files)
+        ]
+        # pypdf is pure Python, keep it off the event loop
+        await asyncio.to_thread(_merge, cover_pdf, parts, course.title, out_file)
+    except Exception as e:
+        logger.warning(f"Merging the PDFs of course {course.id} failed: {e}")
+        merge_stats["failed"] += 1
+        return False
+    finally:
+        cover_md.unlink(missing_ok=True)
+        cover_pdf.unlink(missing_ok=True)
+    merge_stats["merges"] += 1
+    return True
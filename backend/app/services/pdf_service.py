@@ -1,12 +1,18 @@
 import os
-import subprocess
 import shutil
 from pathlib import Path
 
+from app.services.render_pool import RenderError, RenderTimeout, render_pool
+
 
 class PDFService:
     BASE_DIR = Path("/app/user_files")  # Mapped volume
 
+    # Try xelatex first, then fallback to pdflatex if it fails
+    PDF_ENGINES = ["xelatex", "pdflatex"]
+    PDF_OPTIONS = ["-V", "geometry:margin=1in", "--toc"]
+    EPUB_OPTIONS = ["--toc", "--toc-depth=3"]
+
     @staticmethod
     def ensure_base_dir():
         """Ensure base directory exists with correct permissions"""
@@ -39,6 +45,61 @@ class PDFService:
             pass
         return path
 
+    @staticmethod
+    async def render_pdf(
+        md_file: Path, pdf_file: Path, label: str, toc: bool = True
+    ) -> bool:
+        """Render a markdown file to PDF, trying each engine in turn."""
+        options = PDFService.PDF_OPTIONS
+        if not toc:
+            options = [option for option in options if option != "--toc"]
+        for engine in PDFService.PDF_ENGINES:
+            try:
+                await render_pool.run(
+                    [
+                        "pandoc",
+                        str(md_file),
+                        "-o",
+                        str(pdf_file),
+                        f"--pdf-engine={engine}",
+                        *options,
+                    ],
+                    label=f"pdf:{engine}:{label}",
+                )
+                return True
+            except RenderTimeout:
+                print(f"Pandoc timeout with {engine} for: {label}")
+            except RenderError as e:
+                error_msg = (
+                    f"Pandoc Error with {engine} (exit {e.returncode}): {e.stderr}"
+                )
+                print(error_msg)
+            # Otherwise, try next engine
+        return False
+
+    @staticmethod
+    async def render_epub(md_file: Path, epub_file: Path, label: str) -> bool:
+        """Render a markdown file to EPUB."""
+        try:
+            await render_pool.run(
+                [
+                    "pandoc",
+                    str(md_file),
+                    "-o",
+                    str(epub_file),
+                    *PDFService.EPUB_OPTIONS,
+                ],
+                label=f"epub:{label}",
+            )
+        except RenderTimeout:
+            print(f"Pandoc EPUB timeout for: {label}")
+            return False
+        except RenderError as e:
+            error_msg = f"Pandoc EPUB Error (exit {e.returncode}): {e.stderr}"
+            print(error_msg)
+            return False
+        return True
+
     @staticmethod
     async def convert_markdown_to_pdf(
         content_md: str, user_id: int, course_title: str, lesson_title: str
@@ -56,45 +117,7 @@ class PDFService:
         with open(md_file, "w", encoding="utf-8") as f:
             f.write(content_md)
 
-        # Run Pandoc
-        # Try xelatex first, then fallback to pdflatex if it fails
-        pdf_engines = ["xelatex", "pdflatex"]
-
-        for engine in pdf_engines:
-            try:
-                result = subprocess.run(
-                    [
-                        "pandoc",
-                        str(md_file),
-                        "-o",
-                        str(pdf_file),
-                        f"--pdf-engine={engine}",
-                        "-V",
-                        "geometry:margin=1in",
-                        "--toc",
-                    ],
-                    check=True,
-                    capture_output=True,
-                    text=True,
-                    timeout=120,  # 2 minute timeout
-                )
-                # If successful, break out of loop
-                break
-            except subprocess.CalledProcessError as e:
-                error_msg = (
-                    f"Pandoc Error with {engine} (exit {e.returncode}): {e.stderr}"
-                )
-                print(error_msg)
-                # If this was the last engine, return None
-                if engine == pdf_engines[-1]:
-                    return None
-                # Otherwise, try next engine
-                continue
-            except subprocess.TimeoutExpired:
-                print(f"Pandoc timeout with {engine} for lesson: {lesson_title}")
-                if engine == pdf_engines[-1]:
-                    return None
-                continue
+        if not await PDFService.render_pdf(md_file, pdf_file, lesson_title):
             return None
 
         # Return relative path for DB/Serving
@@ -119,28 +142,7 @@ class PDFService:
         with open(md_file, "w", encoding="utf-8") as f:
             f.write(content_md)
 
-        # Run Pandoc to generate EPUB
-        try:
-            result = subprocess.run(
-                [
-                    "pandoc",
-                    str(md_file),
-                    "-o",
-                    str(epub_file),
-                    "--toc",
-                    "--toc-depth=3",
-                ],
-                check=True,
-                capture_output=True,
-                text=True,
-                timeout=120,  # 2 minute timeout
-            )
-        except subprocess.CalledProcessError as e:
-            error_msg = f"Pandoc EPUB Error (exit {e.returncode}): {e.stderr}"
-            print(error_msg)
-            return None
-        except subprocess.TimeoutExpired:
-            print(f"Pandoc EPUB timeout for: {lesson_title}")
+        if not await PDFService.render_epub(md_file, epub_file, lesson_title):
             return None
 
         # Return relative path for DB/Serving
@@ -0,0 +1,126 @@
+"""
+Staged pipeline
+Runs items through a sequence of async stages, each with its own worker
+count, connected by bounded queues: a slow stage fills its input queue and
+backpressure stops the earlier stages from running ahead, while every stage
+keeps its own concurrency (e.g. web research, LLM calls and PDF rendering
+of a bulk generation overlap instead of sharing one slot per lesson).
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()  # End-of-input marker, one per worker
+
+# handler(item) -> item for the next stage, or None when the item is finished
+Handler = Callable[[Any], Awaitable[Any]]
+# on_error(item, stage name, exception)
+ErrorHandler = Callable[[Any, str, BaseException], None]
+
+
+class Stage:
+    def __init__(self, name: str, handler: Handler, workers: int):
+        self.name = name
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.queue: Optional[asyncio.Queue] = None
+        self.started_at: Optional[float] = None
+        self.busy = 0.0  # Seconds spent in the handler, all workers
+        # Live counters, suitable for a JSON status
+        self.stats: Dict[str, Any] = {
+            "workers": self.workers,
+            "active": 0,
+            "queued": 0,
+            "done": 0,
+            "failed": 0,
+            "per_minute": None,
+            "avg_seconds": None,
+        }
+
+    def _update(self) -> None:
+        self.stats["queued"] = self.queue.qsize() if self.queue else 0
+        finished = self.stats["done"] + self.stats["failed"]
+        if self.started_at is not None and finished:
+            elapsed = max(time.monotonic() - self.started_at, 1e-6)
+            self.stats["per_minute"] = round(finished * 60 / elapsed, 2)
+            self.stats["avg_seconds"] = round(self.busy / finished, 2)
+
+
+class Pipeline:
+    def __init__(
+        self,
+        stages: List[Stage],
+        queue_size: int,
+        on_error: Optional[ErrorHandler] = None,
+    ):
+        self.stages = stages
+        self.queue_size = queue_size
+        self.on_error = on_error
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Per-stage stats, keyed by stage name (the dicts stay live)."""
+        return {stage.name: stage.stats for stage in self.stages}
+
+    async def run(self, items: Iterable[Any]) -> None:
+        """Push every item through all stages; returns when all are finished."""
+        for stage in self.stages:
+            stage.queue = asyncio.Queue(maxsize=max(1, self.queue_size))
+
+        async def feed() -> None:
+            first = self.stages[0]
+            for item in items:
+                await first.queue.put(item)
+                first._update()
+            for _ in range(first.workers):
+                await first.queue.put(_DONE)
+
+        async def work(index: int) -> None:
+            stage = self.stages[index]
+            following = self.stages[index + 1] if index + 1 < len(self.stages) else None
+            while True:
+                item = await stage.queue.get()
+                if item is _DONE:
+                    return
+                if stage.started_at is None:
+                    stage.started_at = time.monotonic()
+                stage.stats["active"] += 1
+                stage._update()
+                started = time.monotonic()
+                try:
+                    result = await stage.handler(item)
+                except Exception as e:
+                    result = None
+                    stage.stats["failed"] += 1
+                    logger.warning(f"Pipeline stage {stage.name} failed: {e}")
+                    if self.on_error is not None:
+                        self.on_error(item, stage.name, e)
+                else:
+                    stage.stats["done"] += 1
+                finally:
+                    stage.busy += time.monotonic() - started
+                    stage.stats["active"] -= 1
+                    stage._update()
+                if result is not None and following is not None:
+                    await following.queue.put(result)  # Blocks while it is full
+                    following._update()
+
+        async def run_stage(index: int) -> None:
+            stage = self.stages[index]
+            await asyncio.gather(*(work(index) for _ in range(stage.workers)))
+            if index + 1 < len(self.stages):
+                following = self.stages[index + 1]
+                for _ in range(following.workers):
+                    await following.queue.put(_DONE)
+
+        tasks = [asyncio.ensure_future(feed())] + [
+            asyncio.ensure_future(run_stage(i)) for i in range(len(self.stages))
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
@@ -0,0 +1,223 @@
+"""
+Question Cache
+Per-lesson semantic cache for lesson Q&A. Questions are normalized and turned
+into hashed n-gram vectors (no model, no extra dependency); a new question
+whose cosine similarity with an already answered one is above
+QUESTION_CACHE_THRESHOLD gets that answer instead of a Tavily search and an
+LLM call, provided both mention the same numbers ("exercise 2", "line 14").
+Entries are tied to the lesson content they were answered against,
+so regenerating a lesson drops them.
+"""
+
+import hashlib
+import math
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, FrozenSet, Optional, Tuple
+
+from app.core.config import settings
+
+DIMENSIONS = 2**18
+
+# Words that carry little meaning in a question; down-weighted, not dropped
+STOPWORDS = {
+    # en
+    "a", "an", "the", "is", "are", "was", "what", "whats", "how", "why", "when",
+    "which", "who", "do", "does", "did", "can", "could", "you", "i", "me", "my",
+    "of", "in", "on", "to", "for", "and", "or", "it", "this", "that", "with",
+    "please", "explain", "mean", "means",
+    # it
+    "che", "cosa", "cos", "come", "perche", "quando", "quale", "chi", "e", "un",
+    "uno", "una", "il", "lo", "la", "i", "gli", "le", "di", "del", "della", "da",
+    "in", "per", "con", "mi", "puoi", "spiegare", "spiegami", "significa",
+}  # fmt: skip
+
+
+def normalize_question(text: str) -> str:
+    """Lowercase, strip accents and punctuation, collapse whitespace."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+
+def _bucket(feature: str) -> int:
+    digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % DIMENSIONS
+
+
+def stem_word(word: str) -> str:
+    """Crude plural folding, enough to match "closures" with "closure"."""
+    if len(word) > 4 and word.endswith("es") and word[-3] in "sxz":
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def question_numbers(text: str) -> FrozenSet[str]:
+    """
+    Tokens with a digit ("exercise 2", "line 14", "python3"): questions only
+    share an answer if these match exactly.
+    """
+    return frozenset(
+        w for w in normalize_question(text).split() if any(c.isdigit() for c in w)
+    )
+
+
+def embed_question(text: str) -> Dict[int, float]:
+    """
+    Sparse, L2-normalized hashed vector of word unigrams, bigrams of content
+    words and character trigrams of the normalized question. Numbers and
+    single letters (variables) are content words.
+    """
+    words = normalize_question(text).split()
+    stopwords = [w for w in words if w in STOPWORDS]
+    content = [stem_word(w) for w in words if w not in STOPWORDS]
+    features: Dict[int, float] = {}
+
+    def add(feature: str, weight: float) -> None:
+        index = _bucket(feature)
+        features[index] = features.get(index, 0.0) + weight
+
+    for word in stopwords:
+        add("w:" + word, 0.1)
+    for i, word in enumerate(content):
+        add("w:" + word, 1.0)
+        if i + 1 < len(content):
+            add("b:" + word + " " + content[i + 1], 0.5)
+        padded = f"#{word}#"
+        for j in range(len(padded) - 2):
+            add("c:" + padded[j : j + 3], 0.25)
+    # Order of the variables: "x faster than y" is not "y faster than x"
+    symbols = [w for w in content if len(w) == 1]
+    if len(symbols) > 1:
+        add("o:" + " ".join(symbols), 1.0)
+
+    norm = math.sqrt(sum(v * v for v in features.values()))
+    if norm == 0:
+        return {}
+    return {k: v / norm for k, v in features.items()}
+
+
+def cosine(a: Dict[int, float], b: Dict[int, float]) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(v * b.get(k, 0.0) for k, v in a.items())
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256((content or "").encode("utf-8")).hexdigest()
+
+
+class _Entry:
+    __slots__ = (
+        "question_id",
+        "vector",
+        "numbers",
+        "answer",
+        "content_hash",
+        "created_at",
+    )
+
+    def __init__(self, question_id, question, answer, content_hash):
+        self.question_id = question_id
+        self.vector = embed_question(question)
+        self.numbers = question_numbers(question)
+        self.answer = answer
+        self.content_hash = content_hash
+        self.created_at = time.time()
+
+
+class QuestionCache:
+    def __init__(self, threshold: float, ttl: int, max_per_lesson: int):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_per_lesson = max_per_lesson
+        self._lessons: Dict[int, "OrderedDict[int, _Entry]"] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(
+        self, lesson_id: int, lesson_content: str, question: str
+    ) -> Optional[Tuple[int, str, float]]:
+        """
+        Return (question_id, answer, similarity) of the most similar cached
+        question for this lesson, if above the threshold.
+        """
+        if not settings.QUESTION_CACHE_ENABLED:
+            return None
+        entries = self._lessons.get(lesson_id)
+        if not entries:
+            self.misses += 1
+            return None
+
+        current_hash = content_hash(lesson_content)
+        now = time.time()
+        vector = embed_question(question)
+        numbers = question_numbers(question)
+        best: Optional[_Entry] = None
+        best_score = 0.0
+        for question_id, entry in list(entries.items()):
+            if entry.content_hash != current_hash or now - entry.created_at > self.ttl:
+                del entries[question_id]
+                continue
+            if entry.numbers != numbers:
+                continue  # About another exercise, line, version...
+            score = cosine(vector, entry.vector)
+            if score > best_score:
+                best, best_score = entry, score
+
+        if best is None or best_score < self.threshold:
+            self.misses += 1
+            return None
+        entries.move_to_end(best.question_id)  # Keep popular answers longest
+        self.hits += 1
+        return best.question_id, best.answer, best_score
+
+    def add(
+        self,
+        lesson_id: int,
+        lesson_content: str,
+        question_id: int,
+        question: str,
+        answer: str,
+    ) -> None:
+        """Remember an answer generated for this lesson."""
+        if not settings.QUESTION_CACHE_ENABLED or not answer:
+            return
+        entries = self._lessons.setdefault(lesson_id, OrderedDict())
+        entries[question_id] = _Entry(
+            question_id, question, answer, content_hash(lesson_content)
+        )
+        while len(entries) > self.max_per_lesson:
+            entries.popitem(last=False)
+
+    def remove(self, lesson_id: int, question_id: int) -> None:
+        entries = self._lessons.get(lesson_id)
+        if entries:
+            entries.pop(question_id, None)
+
+    def invalidate(self, lesson_id: int) -> None:
+        """Drop every cached answer for a lesson (regenerated or deleted)."""
+        self._lessons.pop(lesson_id, None)
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": settings.QUESTION_CACHE_ENABLED,
+            "lessons": len(self._lessons),
+            "entries": sum(len(e) for e in self._lessons.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+        }
+
+
+question_cache = QuestionCache(
+    threshold=settings.QUESTION_CACHE_THRESHOLD,
+    ttl=settings.QUESTION_CACHE_TTL,
+    max_per_lesson=settings.QUESTION_CACHE_MAX_PER_LESSON,
+)
@@ -0,0 +1,139 @@
+"""
+Render Cache
+Full-course PDF/EPUB renders are content addressed: the key hashes the
+merged markdown, the output format, the pandoc options and the versions of
+pandoc and the LaTeX engines. Artifacts are kept per course under
+<user>/_renders/<course_id>/<key>.<ext>; a download whose key already has
+an artifact is served without running pandoc. Rendering a new version of a
+course replaces the previous artifact of that format, and regenerating a
+lesson, renaming or deleting the course evicts them all.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from app.core.config import settings
+from app.services.pdf_service import PDFService
+from app.services.render_pool import tool_version
+from app.services.singleflight import SingleFlight
+
+CACHE_DIR = "_renders"
+
+# Renders in flight, keyed by course directory and content hash
+render_flights = SingleFlight()
+
+# Running totals, exposed through GET /render/cache
+render_cache_stats: Dict[str, int] = {
+    "hits": 0,
+    "misses": 0,  # Renders run (concurrent identical downloads share one)
+    "failed": 0,
+    "evicted": 0,  # Artifacts deleted
+}
+
+
+async def _toolchain(fmt: str) -> List[str]:
+    """Options and tool versions the output of a format depends on."""
+    if fmt == "pdf":
+        tools = ["pandoc", *PDFService.PDF_ENGINES]
+        options = ["--pdf-engine", *PDFService.PDF_ENGINES, *PDFService.PDF_OPTIONS]
+    else:
+        tools = ["pandoc"]
+        options = list(PDFService.EPUB_OPTIONS)
+    return options + [await tool_version(tool) for tool in tools]
+
+
+async def render_key(markdown: str, fmt: str, variant: str = "") -> str:
+    payload = json.dumps(
+        [fmt, variant, await _toolchain(fmt), markdown], ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def course_cache_dir(user_id: int, course_id: int) -> Path:
+    return PDFService.BASE_DIR / str(user_id) / CACHE_DIR / str(course_id)
+
+
+def _remove_stale(directory: Path, fmt: str, keep: Path) -> None:
+    for path in directory.glob(f"*.{fmt}"):
+        if path != keep and ".partial." not in path.name:
+            path.unlink(missing_ok=True)
+            render_cache_stats["evicted"] += 1
+
+
+async def _pandoc(markdown: str, fmt: str, out_file: Path, label: str) -> bool:
+    md_file = out_file.with_name(out_file.name.split(".", 1)[0] + ".md")
+    with open(md_file, "w", encoding="utf-8") as f:
+        f.write(markdown)
+    try:
+        render = PDFService.render_pdf if fmt == "pdf" else PDFService.render_epub
+        return await render(md_file, out_file, label)
+    finally:
+        md_file.unlink(missing_ok=True)
+
+
+async def _render(
+    directory: Path, key: str, fmt: str, build: Callable[[Path], Awaitable[bool]]
+) -> Optional[Path]:
+    render_cache_stats["misses"] += 1
+    directory.mkdir(parents=True, exist_ok=True)
+    partial = directory / f"{key}.partial.{fmt}"  # Never served half written
+    artifact = directory / f"{key}.{fmt}"
+    try:
+        if not await build(partial) or not partial.exists():
+            render_cache_stats["failed"] += 1
+            return None
+        os.replace(partial, artifact)
+    finally:
+        partial.unlink(missing_ok=True)
+    _remove_stale(directory, fmt, artifact)
+    return artifact
+
+
+async def get_or_render(
+    markdown: str,
+    fmt: str,
+    user_id: int,
+    course_id: int,
+    label: str = "",
+    variant: str = "",
+    build: Optional[Callable[[Path], Awaitable[bool]]] = None,
+) -> Optional[Path]:
+    """
+    Path of the rendered artifact ("pdf" or "epub") for the markdown,
+    rendering it only if no artifact with the same content hash exists.
+    build(path) replaces the pandoc render of the markdown, e.g. to merge
+    lesson PDFs; variant then tells its artifacts apart. Returns None if
+    the render failed.
+    """
+    key = await render_key(markdown, fmt, variant)
+    directory = course_cache_dir(user_id, course_id)
+    artifact = directory / f"{key}.{fmt}"
+    if settings.RENDER_CACHE_ENABLED and artifact.exists():
+        render_cache_stats["hits"] += 1
+        return artifact
+
+    result, _ = await render_flights.run(
+        (str(directory), key),
+        lambda: _render(
+            directory,
+            key,
+            fmt,
+            build or (lambda path: _pandoc(markdown, fmt, path, label)),
+        ),
+    )
+    return result
+
+
+def evict_course(user_id: int, course_id: int) -> None:
+    """Delete every cached render of a course (its content has changed)."""
+    directory = course_cache_dir(user_id, course_id)
+    if not directory.exists():
+        return
+    render_cache_stats["evicted"] += sum(
+        1 for path in directory.iterdir() if not path.name.endswith(".md")
+    )
+    shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,204 @@
+"""
+Render Pool
+Pandoc/LaTeX renders run as asyncio subprocesses on a fixed number of
+workers (RENDER_WORKERS), so a render never blocks the event loop and only
+so many run at once however many lessons are generated in parallel.
+Submissions wait in a bounded queue (RENDER_QUEUE_SIZE); when it is full,
+submitting blocks until a worker frees a slot (backpressure).
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Sequence
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class RenderError(Exception):
+    """The render command exited with a non-zero status."""
+
+    def __init__(self, returncode: int, stderr: str):
+        super().__init__(f"exit {returncode}: {stderr}")
+        self.returncode = returncode
+        self.stderr = stderr
+
+
+class RenderTimeout(Exception):
+    """The render command ran longer than its timeout and was killed."""
+
+
+class RenderPool:
+    def __init__(self, workers: int, queue_size: int):
+        self.workers = max(1, workers)
+        self.queue_size = max(1, queue_size)
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self.active = 0
+        self._durations: Deque[float] = deque(maxlen=200)
+        self._waits: Deque[float] = deque(maxlen=200)
+        # Counters for monitoring
+        self.renders = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.cancelled = 0  # Dropped or killed, the caller went away
+
+    def _start(self) -> None:
+        # Workers are started lazily, on the running event loop
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.queue_size)
+            self._tasks = [
+                asyncio.create_task(self._worker()) for _ in range(self.workers)
+            ]
+
+    async def run(
+        self,
+        args: Sequence[str],
+        timeout: Optional[float] = None,
+        label: str = "",
+    ) -> str:
+        """
+        Run a render command on the pool and return its stdout. Raises
+        RenderError on a non-zero exit and RenderTimeout after `timeout`
+        seconds of running (time spent queued does not count).
+        """
+        self._start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(
+            (
+                list(args),
+                timeout or settings.RENDER_TIMEOUT,
+                label,
+                time.monotonic(),
+                future,
+            )
+        )
+        return await future
+
+    async def _worker(self) -> None:
+        while True:
+            args, timeout, label, queued_at, future = await self._queue.get()
+            if future.done():
+                self.cancelled += 1
+                continue
+            self.active += 1
+            started = time.monotonic()
+            self._waits.append(started - queued_at)
+            render = asyncio.ensure_future(self._exec(args, timeout))
+            try:
+                # The caller cancelling its future stops the render too
+                await asyncio.wait(
+                    [render, future], return_when=asyncio.FIRST_COMPLETED
+                )
+                if not render.done():
+                    render.cancel()  # Kills the process
+                    await asyncio.wait([render])
+                    self.cancelled += 1
+                    continue
+                stdout = render.result()
+            except asyncio.CancelledError:
+                render.cancel()  # Pool shutdown
+                raise
+            except Exception as e:
+                if isinstance(e, RenderTimeout):
+                    self.timeouts += 1
+                else:
+                    self.failed += 1
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                self.renders += 1
+                if not future.done():
+                    future.set_result(stdout)
+            finally:
+                self.active -= 1
+                elapsed = time.monotonic() - started
+                self._durations.append(elapsed)
+                logger.info(
+                    f"Render {label or args[0]} took {elapsed:.2f}s "
+                    f"(queued {started - queued_at:.2f}s)"
+                )
+
+    @staticmethod
+    async def _exec(args: List[str], timeout: float) -> str:
+        process = await asyncio.create_subprocess_exec(
+            *args,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            raise RenderTimeout(f"{args[0]} timed out after {timeout}s")
+        except BaseException:
+            # Caller cancelled or shutdown: do not leave the process running
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+            raise
+        if process.returncode != 0:
+            raise RenderError(
+                process.returncode, stderr.decode("utf-8", errors="replace")
+            )
+        return stdout.decode("utf-8", errors="replace")
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+
+    def snapshot(self) -> Dict:
+        durations = sorted(self._durations)
+        waits = self._waits
+        return {
+            "workers": self.workers,
+            "active": self.active,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "queue_size": self.queue_size,
+            "renders": self.renders,
+            "failed": self.failed,
+            "timeouts": self.timeouts,
+            "cancelled": self.cancelled,
+            "avg_seconds": (
+                round(sum(durations) / len(durations), 3) if durations else None
+            ),
+            "p95_seconds": (
+                round(durations[min(len(durations) - 1, int(0.95 * len(durations)))], 3)
+                if durations
+                else None
+            ),
+            "avg_wait_seconds": round(sum(waits) / len(waits), 3) if waits else None,
+        }
+
+
+render_pool = RenderPool(settings.RENDER_WORKERS, settings.RENDER_QUEUE_SIZE)
+
+# tool -> first line of `tool --version`
+_tool_versions: Dict[str, str] = {}
+
+
+async def tool_version(tool: str) -> str:
+    """First line of `tool --version`, probed once per process."""
+    version = _tool_versions.get(tool)
+    if version is None:
+        try:
+            process = await asyncio.create_subprocess_exec(
+                tool,
+                "--version",
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.DEVNULL,
+            )
+            stdout, _ = await asyncio.wait_for(process.communicate(), 10)
+            version = stdout.decode("utf-8", errors="replace").partition("\n")[0]
+        except (OSError, asyncio.TimeoutError) as e:
+            logger.warning(f"Could not get the {tool} version: {e}")
+            version = "unknown"
+        _tool_versions[tool] = version
+    return version
@@ -0,0 +1,326 @@
+"""
+Response Cache
+Tiered key/value cache (in-memory LRU + database) with TTL and size-based eviction.
+Cache failures never propagate: a broken tier is logged and treated as a miss.
+"""
+
+import hashlib
+import json
+import logging
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, func
+from sqlalchemy.future import select
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class CacheBackend(ABC):
+    """Interface for a cache tier. Values are strings, TTLs are in seconds."""
+
+    name = "base"
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[str]: ...
+
+    @abstractmethod
+    async def set(self, key: str, value: str, ttl: int) -> None: ...
+
+    @abstractmethod
+    async def delete(self, key: str) -> None: ...
+
+    @abstractmethod
+    async def size(self) -> int: ...
+
+
+class MemoryCacheBackend(CacheBackend):
+    """Process-local LRU with per-entry expiry."""
+
+    name = "memory"
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+
+    async def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at <= time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: str, ttl: int) -> None:
+        self._entries[key] = (value, time.time() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def delete(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+    async def size(self) -> int:
+        return len(self._entries)
+
+
+class DatabaseCacheBackend(CacheBackend):
+    """
+    Persistent tier stored in the cache_entries table, shared by all workers.
+    Expired rows and the oldest rows beyond max_entries are pruned every
+    `prune_every` writes.
+    """
+
+    name = "database"
+
+    def __init__(self, namespace: str, max_entries: int, prune_every: int = 100):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.prune_every = prune_every
+        self._writes = 0
+
+    async def get(self, key: str) -> Optional[str]:
+        from app.core.db import AsyncSessionLocal
+        from app.models.base import CacheEntry
+
+        async with AsyncSessionLocal() as session:
+            entry = await session.get(CacheEntry, (self.namespace, key))
+            if entry is None:
+                return None
+            if entry.expires_at <= datetime.utcnow():
+                await session.delete(entry)
+                await session.commit()
+                return None
+            return entry.value
+
+    async def set(self, key: str, value: str, ttl: int) -> None:
+        from app.core.db import AsyncSessionLocal
+        from app.models.base import CacheEntry
+
+        now = datetime.utcnow()
+        async with AsyncSessionLocal() as session:
+            await session.merge(
+                CacheEntry(
+                    namespace=self.namespace,
+                    key=key,
+                    value=value,
+                    expires_at=now + timedelta(seconds=ttl),
+                    created_at=now,
+                )
+            )
+            await session.commit()
+
+        self._writes += 1
+        if self._writes % self.prune_every == 0:
+            await self.prune()
+
+    async def delete(self, key: str) -> None:
+        from app.core.db import AsyncSessionLocal
+        from app.models.base import CacheEntry
+
+        async with AsyncSessionLocal() as session:
+            await session.execute(
+                delete(CacheEntry).where(
+                    CacheEntry.namespace == self.namespace, CacheEntry.key == key
+                )
+            )
+            await session.commit()
+
+    async def size(self) -> int:
+        from app.core.db import AsyncSessionLocal
+        from app.models.base import CacheEntry
+
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                select(func.count())
+                .select_from(CacheEntry)
+                .where(CacheEntry.namespace == self.namespace)
+            )
+            return result.scalar()
+
+    async def prune(self) -> None:
+        """Delete expired rows, then the least recently written rows over the cap."""
+        from app.core.db import AsyncSessionLocal
+        from app.models.base import CacheEntry
+
+        async with AsyncSessionLocal() as session:
+            await session.execute(
+                delete(CacheEntry).where(
+                    CacheEntry.namespace == self.namespace,
+                    CacheEntry.expires_at <= datetime.utcnow(),
+                )
+            )
+            overflow = (
+                select(CacheEntry.key)
+                .where(CacheEntry.namespace == self.namespace)
+                .order_by(CacheEntry.created_at.desc())
+                .offset(self.max_entries)
+            )
+            await session.execute(
+                delete(CacheEntry).where(
+                    CacheEntry.namespace == self.namespace,
+                    CacheEntry.key.in_(overflow.scalar_subquery()),
+                )
+            )
+            await session.commit()
+
+
+class ResponseCache:
+    """
+    Looks keys up tier by tier (fastest first) and back-fills faster tiers on
+    a hit in a slower one. Keeps hit/miss counters per tier.
+    """
+
+    def __init__(self, namespace: str, backends: List[CacheBackend], ttl: int):
+        self.namespace = namespace
+        self.backends = backends
+        self.ttl = ttl
+        self.hits: Dict[str, int] = {b.name: 0 for b in backends}
+        self.misses = 0
+        self.writes = 0
+        self.errors = 0
+
+    async def get(self, key: str, ttl: Optional[int] = None) -> Optional[str]:
+        """Return the cached value or None. `ttl` applies to back-filled tiers."""
+        for i, backend in enumerate(self.backends):
+            try:
+                value = await backend.get(key)
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"Cache tier {backend.name} get failed: {e}")
+                continue
+            if value is not None:
+                self.hits[backend.name] += 1
+                for faster in self.backends[:i]:
+                    await self._safe_set(faster, key, value, ttl or self.ttl)
+                return value
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: str, ttl: Optional[int] = None) -> None:
+        self.writes += 1
+        for backend in self.backends:
+            await self._safe_set(backend, key, value, ttl or self.ttl)
+
+    async def delete(self, key: str) -> None:
+        for backend in self.backends:
+            try:
+                await backend.delete(key)
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"Cache tier {backend.name} delete failed: {e}")
+
+    async def _safe_set(
+        self, backend: CacheBackend, key: str, value: str, ttl: int
+    ) -> None:
+        try:
+            await backend.set(key, value, ttl)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Cache tier {backend.name} set failed: {e}")
+
+    async def stats(self) -> Dict:
+        hits = sum(self.hits.values())
+        lookups = hits + self.misses
+        tiers = []
+        for backend in self.backends:
+            try:
+                size = await backend.size()
+            except Exception:
+                size = None
+            tiers.append(
+                {"name": backend.name, "hits": self.hits[backend.name], "size": size}
+            )
+        return {
+            "namespace": self.namespace,
+            "hits": hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "writes": self.writes,
+            "errors": self.errors,
+            "tiers": tiers,
+        }
+
+
+# Available tiers, by name, as used in the *_CACHE_BACKENDS settings
+CACHE_BACKENDS: Dict[str, Callable[[str], CacheBackend]] = {
+    "memory": lambda namespace: MemoryCacheBackend(
+        max_entries=settings.CACHE_MEMORY_MAX_ENTRIES
+    ),
+    "database": lambda namespace: DatabaseCacheBackend(
+        namespace, max_entries=settings.CACHE_DB_MAX_ENTRIES
+    ),
+}
+
+
+def build_cache(namespace: str, backend_names: str, ttl: int) -> ResponseCache:
+    """Build a cache from a comma separated list of tier names, fastest first."""
+    backends = []
+    for name in backend_names.split(","):
+        name = name.strip()
+        if not name:
+            continue
+        if name not in CACHE_BACKENDS:
+            raise ValueError(f"Unknown cache backend: {name}")
+        backends.append(CACHE_BACKENDS[name](namespace))
+    return ResponseCache(namespace, backends, ttl)
+
+
+def tavily_cache_key(query: str, **params) -> str:
+    """
+    Content address of a Tavily search. The query is normalized (case,
+    accents, punctuation, whitespace) so trivially different queries share
+    an entry; every other search parameter is part of the key.
+    """
+    from app.services.question_cache import normalize_question
+
+    payload = json.dumps(
+        [normalize_question(query), sorted(params.items())],
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def llm_cache_key(
+    provider: str,
+    base_url: str,
+    model: str,
+    prompt: str,
+    temperature: float,
+    language: str,
+) -> str:
+    """
+    Content address of an LLM request to one provider endpoint; whitespace
+    in the prompt is normalized.
+    """
+    normalized_prompt = " ".join(prompt.split())
+    payload = json.dumps(
+        [
+            provider,
+            (base_url or "").rstrip("/"),
+            model,
+            normalized_prompt,
+            round(temperature, 3),
+            language or "",
+        ],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+llm_response_cache = build_cache(
+    "llm", settings.LLM_CACHE_BACKENDS, settings.LLM_CACHE_TTL
+)
+
+tavily_cache = build_cache(
+    "tavily", settings.TAVILY_CACHE_BACKENDS, settings.TAVILY_CACHE_TTL_LESSON
+)
@@ -0,0 +1,91 @@
+"""
+Single-flight registry
+Concurrent callers asking for the same key share one in-flight computation
+instead of each starting their own.
+"""
+
+import asyncio
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Dict, Hashable, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._waiters: Dict[asyncio.Future, int] = {}  # Callers awaiting each
+
+    def in_flight(self, key: Hashable) -> Optional[asyncio.Future]:
+        """Return the pending future for key, if any."""
+        return self._inflight.get(key)
+
+    async def run(
+        self, key: Hashable, factory: Callable[[], Awaitable[T]]
+    ) -> Tuple[T, bool]:
+        """
+        Await the result for key, starting factory() only if nothing is in flight.
+        Returns (result, leader) where leader is True for the caller that started
+        the work. The work runs as its own task, so a cancelled caller does not
+        cancel it for the others.
+        """
+        future = self._inflight.get(key)
+        while future is not None:
+            with self._waiting(future):
+                await asyncio.wait([future])
+            if not future.cancelled():
+                return future.result(), False
+            # The leader gave up without a result, try again (possibly leading)
+            self._release(key, future)
+            future = self._inflight.get(key)
+
+        future = asyncio.ensure_future(factory())
+        self._register(key, future)
+        with self._waiting(future):
+            return await asyncio.shield(future), True
+
+    def waiting(self, key: Hashable) -> int:
+        """Number of run() callers currently awaiting the flight for key."""
+        future = self._inflight.get(key)
+        return self._waiters.get(future, 0) if future is not None else 0
+
+    def cancel_unshared(self, key: Hashable) -> bool:
+        """
+        Cancel the work run() started for key if at most one caller (the one
+        giving up) awaits it. Work others still wait for, and futures from
+        claim(), are left alone. Returns True if the work was cancelled.
+        """
+        future = self._inflight.get(key)
+        if not isinstance(future, asyncio.Task) or self._waiters.get(future, 0) > 1:
+            return False
+        return future.cancel()
+
+    @contextmanager
+    def _waiting(self, future: asyncio.Future):
+        self._waiters[future] = self._waiters.get(future, 0) + 1
+        try:
+            yield
+        finally:
+            self._waiters[future] -= 1
+            if not self._waiters[future]:
+                del self._waiters[future]
+
+    def claim(self, key: Hashable) -> asyncio.Future:
+        """
+        Register a future the caller resolves itself (e.g. while streaming).
+        The caller must set a result or exception (or cancel it) when done.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._register(key, future)
+        return future
+
+    def _register(self, key: Hashable, future: asyncio.Future) -> None:
+        self._inflight[key] = future
+        future.add_done_callback(lambda f: self._release(key, f))
+
+    def _release(self, key: Hashable, future: asyncio.Future) -> None:
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+        # Mark the exception as retrieved, followers (if any) still receive it
+        if not future.cancelled():
+            future.exception()
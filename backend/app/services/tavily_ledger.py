@@ -0,0 +1,133 @@
+"""
+Tavily credit ledger and circuit breaker
+One ledger per Tavily API key. Credits are decremented locally for every
+search sent (by search depth) and reconciled against GET /usage every
+TAVILY_CREDIT_RECONCILE_INTERVAL seconds. The breaker opens when remaining
+credits fall below TAVILY_CREDIT_THRESHOLD, when Tavily reports the quota
+exhausted, or after TAVILY_BREAKER_FAILURES consecutive failures (5xx,
+timeouts and transport errors; other 4xx do not count); while it is open
+searches are skipped without a round trip.
+"""
+
+import hashlib
+import time
+from typing import Dict, List, Optional
+
+from app.core.config import settings
+
+# Quota exhausted: plan limit (432), pay-as-you-go limit (433)
+QUOTA_STATUS_CODES = (432, 433)
+
+
+class CreditLedger:
+    def __init__(self, key_fingerprint: str):
+        self.key_fingerprint = key_fingerprint
+        self.limit: Optional[int] = None
+        self.remaining: Optional[int] = None  # None until the first reconcile
+        self.reconciled_at = 0.0  # time.monotonic() of the last /usage sync
+        self.failures = 0  # Consecutive failed searches
+        self.open_until = 0.0
+        self.open_reason: Optional[str] = None
+        # Counters for monitoring
+        self.charged = 0
+        self.short_circuited = 0
+
+    def reconcile_due(self) -> bool:
+        interval = settings.TAVILY_CREDIT_RECONCILE_INTERVAL
+        return (
+            not self.reconciled_at or time.monotonic() - self.reconciled_at > interval
+        )
+
+    def reconcile(self, usage: int, limit: int) -> None:
+        """Replace the local estimate with the provider's numbers."""
+        self.limit = limit
+        self.remaining = limit - usage
+        self.reconciled_at = time.monotonic()
+        if self.open_reason == "quota exhausted" and not self.credits_low():
+            self.open_until = 0.0  # Quota was topped up
+
+    def skip_reconcile(self) -> None:
+        """/usage failed: keep the estimate, try again after the interval."""
+        self.reconciled_at = time.monotonic()
+
+    def charge(self, credits: int) -> None:
+        self.charged += credits
+        if self.remaining is not None:
+            self.remaining -= credits
+
+    def credits_low(self) -> bool:
+        return (
+            self.remaining is not None
+            and self.remaining < settings.TAVILY_CREDIT_THRESHOLD
+        )
+
+    def is_open(self) -> bool:
+        return time.monotonic() < self.open_until
+
+    def allow(self) -> bool:
+        """Whether a search may be sent now (counts the ones that may not)."""
+        if self.is_open() or self.credits_low():
+            self.short_circuited += 1
+            return False
+        return True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.open_reason = None
+
+    def record_failure(self, status_code: Optional[int] = None) -> None:
+        """status_code is None for timeouts and transport errors."""
+        if status_code in QUOTA_STATUS_CODES:
+            # No point retrying before the next reconcile
+            self.remaining = 0
+            self._open("quota exhausted", settings.TAVILY_CREDIT_RECONCILE_INTERVAL)
+            return
+        if status_code is not None and status_code < 500:
+            return  # Client errors (bad query, invalid key, 429) are not outages
+        self.failures += 1
+        if self.failures >= settings.TAVILY_BREAKER_FAILURES:
+            # After the cooldown searches are let through again, but until
+            # one succeeds a single failure reopens the breaker
+            self._open(
+                f"{self.failures} consecutive failures",
+                settings.TAVILY_BREAKER_COOLDOWN,
+            )
+
+    def _open(self, reason: str, seconds: float) -> None:
+        self.open_until = time.monotonic() + seconds
+        self.open_reason = reason
+
+    def snapshot(self) -> Dict:
+        return {
+            "key": self.key_fingerprint,
+            "limit": self.limit,
+            "remaining": self.remaining,
+            "credits_low": self.credits_low(),
+            "breaker_open": self.is_open(),
+            "open_reason": self.open_reason if self.is_open() else None,
+            "open_for": round(max(0.0, self.open_until - time.monotonic()), 1),
+            "consecutive_failures": self.failures,
+            "charged": self.charged,
+            "short_circuited": self.short_circuited,
+            "reconciled_ago": (
+                round(time.monotonic() - self.reconciled_at, 1)
+                if self.reconciled_at
+                else None
+            ),
+        }
+
+
+_ledgers: Dict[str, CreditLedger] = {}
+
+
+def get_ledger(api_key: str) -> CreditLedger:
+    """Return the shared ledger for a Tavily API key."""
+    digest = hashlib.sha256((api_key or "").encode()).hexdigest()
+    ledger = _ledgers.get(digest)
+    if ledger is None:
+        ledger = _ledgers[digest] = CreditLedger(digest[:8])
+    return ledger
+
+
+def ledger_snapshots() -> List[Dict]:
+    return [ledger.snapshot() for ledger in _ledgers.values()]
@@ -1,15 +1,138 @@
 """
 Tavily Web Search Service
 Provides web research capabilities with graceful error handling.
+Calls the Tavily REST API on a shared, pooled httpx.AsyncClient so searches
+never block the event loop; 429s, 5xx and connection errors are retried.
+Search results are cached (see TAVILY_CACHE_*) with a TTL per call type.
+Searches that miss the cache go through the key's credit ledger and circuit
+breaker (tavily_ledger), which skips them outright when credits are low or
+Tavily keeps failing.
 """
 
+import asyncio
+import json
 import logging
-from typing import Optional, Dict, Any
-from tavily import TavilyClient
+from typing import Optional, Dict, Any, Tuple
+import httpx
 from app.core.config import settings
+from app.services.llm_limiter import parse_retry_after
+from app.services.response_cache import tavily_cache, tavily_cache_key
+from app.services.singleflight import SingleFlight
+from app.services.tavily_ledger import CreditLedger, get_ledger
 
 logger = logging.getLogger(__name__)
 
+# One pooled client for every Tavily key, created on first use
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+# /usage reconciliations in flight, keyed by API key fingerprint
+_reconcile_flights = SingleFlight()
+
+# Credits charged per search, by search_depth
+SEARCH_CREDITS = {"basic": 1, "advanced": 2}
+
+# Running totals, exposed through GET /tavily/cache
+search_stats: Dict[str, int] = {
+    "searches": 0,  # Sent to Tavily
+    "cached_searches": 0,  # Served by the cache
+    "credits_spent": 0,
+    "credits_saved": 0,
+}
+
+
+def _cache_ttl(call_type: str) -> int:
+    return {
+        "course": settings.TAVILY_CACHE_TTL_COURSE,
+        "question": settings.TAVILY_CACHE_TTL_QUESTION,
+    }.get(call_type, settings.TAVILY_CACHE_TTL_LESSON)
+
+
+class TavilyError(Exception):
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class TavilyUnavailable(TavilyError):
+    """The search was skipped: credits are low or the circuit breaker is open."""
+
+
+def _parse_usage(data: Dict[str, Any]) -> Tuple[int, int]:
+    """(usage, limit) from a /usage response."""
+    # Expected structure: {"key": {"usage": X, "limit": Y}, "account": {...}}
+    key_info = data.get("key", {})
+    usage = key_info.get("usage", 0)
+    limit = key_info.get("limit")
+
+    # If limit is None, assume free tier limit of 1000
+    if limit is None:
+        limit = 1000
+    return usage, limit
+
+
+def _get_http_client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            base_url=settings.TAVILY_BASE_URL,
+            limits=httpx.Limits(
+                max_connections=settings.TAVILY_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.TAVILY_MAX_CONNECTIONS,
+                keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(
+                settings.TAVILY_TIMEOUT, connect=settings.TAVILY_CONNECT_TIMEOUT
+            ),
+        )
+    return _http_client
+
+
+async def close_client() -> None:
+    """Close the pooled Tavily client (used on application shutdown)."""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+async def _request(method: str, path: str, api_key: str, **kwargs) -> Dict[str, Any]:
+    """
+    Call the Tavily API and return the JSON body. 429s, 5xx and connection
+    errors are retried up to TAVILY_MAX_RETRIES times, other errors raise
+    TavilyError right away.
+    """
+    max_retries = settings.TAVILY_MAX_RETRIES
+    for attempt in range(max_retries + 1):
+        retry_after = None
+        try:
+            response = await _get_http_client().request(
+                method,
+                path,
+                headers={"Authorization": f"Bearer {api_key}"},
+                **kwargs,
+            )
+        except httpx.TransportError as e:  # Includes timeouts
+            error = TavilyError(f"{type(e).__name__}: {e}")
+        else:
+            if response.status_code == 200:
+                return response.json()
+            error = TavilyError(
+                f"Tavily {path} returned HTTP {response.status_code}: "
+                f"{response.text[:200]}",
+                response.status_code,
+            )
+            if response.status_code != 429 and response.status_code < 500:
+                raise error  # Bad request, invalid key, quota exceeded (432/433)
+            retry_after = parse_retry_after(response.headers)
+
+        if attempt == max_retries:
+            raise error
+        logger.warning("%s, retry %d/%d", error, attempt + 1, max_retries)
+        await asyncio.sleep(
+            retry_after if retry_after is not None else min(2**attempt, 10)
+        )
+
 
 class TavilyService:
     """
@@ -22,14 +145,8 @@ class TavilyService:
         self.enabled = getattr(settings, "TAVILY_ENABLED", False) or bool(api_key)
         self.credit_threshold = getattr(settings, "TAVILY_CREDIT_THRESHOLD", 50)
 
-        if self.enabled and self.api_key:
-            try:
-                self.client = TavilyClient(api_key=self.api_key)
-            except Exception as e:
-                logger.warning(f"Failed to initialize Tavily client: {e}")
-                self.enabled = False
-        else:
-            self.client = None
+        if not self.api_key:
+            self.enabled = False
 
     @classmethod
     def for_user(cls, user=None):
@@ -41,22 +158,31 @@ class TavilyService:
             custom_key = decrypt_value(user.custom_tavily_api_key)
         return cls(api_key=custom_key)
 
-    def _check_credits(self) -> bool:
+    async def _check_credits(self) -> bool:
         """
-        Check if we have enough credits remaining.
+        Check if we have enough credits remaining and the circuit breaker is
+        closed, reconciling the local ledger with /usage when it is due.
         Returns True if we can proceed, False if below threshold.
         """
-        if not self.enabled or not self.client:
+        if not self.enabled:
             return False
 
+        ledger = get_ledger(self.api_key)
+        if ledger.reconcile_due():
+            # Concurrent searches share one /usage call
+            await _reconcile_flights.run(
+                ledger.key_fingerprint, lambda: self._reconcile(ledger)
+            )
+        return ledger.allow()
+
+    async def _reconcile(self, ledger: CreditLedger) -> None:
         try:
-            # Note: Tavily SDK doesn't have built-in usage check
-            # We'll implement this if needed, for now assume we can proceed
-            # In production, you'd call the /usage API endpoint here
-            return True
+            data = await _request("GET", "/usage", self.api_key, timeout=5.0)
         except Exception as e:
             logger.warning(f"Failed to check Tavily credits: {e}")
-            return False
+            ledger.skip_reconcile()
+            return
+        ledger.reconcile(*_parse_usage(data))
 
     async def get_credits_info(self) -> Dict[str, Any]:
         """
@@ -70,45 +196,77 @@ class TavilyService:
             }
 
         try:
-            import httpx
-
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    "https://api.tavily.com/usage",
-                    headers={"Authorization": f"Bearer {self.api_key}"},
-                    timeout=5.0,
-                )
-
-                if response.status_code == 200:
-                    data = response.json()
-                    # Extract usage info from response
-                    # Expected structure: {"key": {"usage": X, "limit": Y}, "account": {...}}
-                    key_info = data.get("key", {})
-                    usage = key_info.get("usage", 0)
-                    limit = key_info.get("limit")
-
-                    # If limit is None, assume free tier limit of 1000
-                    if limit is None:
-                        limit = 1000
-
-                    return {
-                        "enabled": True,
-                        "usage": usage,
-                        "limit": limit,
-                        "remaining": limit - usage,
-                    }
-                else:
-                    logger.warning(
-                        f"Failed to fetch Tavily usage: HTTP {response.status_code}"
-                    )
-                    return {
-                        "enabled": True,
-                        "error": f"API returned status {response.status_code}",
-                    }
+            data = await _request("GET", "/usage", self.api_key, timeout=5.0)
+        except TavilyError as e:
+            logger.warning(f"Failed to fetch Tavily usage: {e}")
+            if e.status_code is not None:
+                return {
+                    "enabled": True,
+                    "error": f"API returned status {e.status_code}",
+                }
+            return {"enabled": True, "error": str(e)}
         except Exception as e:
             logger.warning(f"Failed to fetch Tavily credits: {e}")
             return {"enabled": True, "error": str(e)}
 
+        usage, limit = _parse_usage(data)
+        ledger = get_ledger(self.api_key)
+        ledger.reconcile(usage, limit)
+
+        return {
+            "enabled": True,
+            "usage": usage,
+            "limit": limit,
+            "remaining": limit - usage,
+            "ledger": ledger.snapshot(),
+        }
+
+    async def search(
+        self, query: str, call_type: str = "lesson", **params
+    ) -> Dict[str, Any]:
+        """
+        POST /search with the given Tavily search parameters, through the
+        search cache. call_type ("course", "lesson", "question") picks the TTL.
+        Responses served from the cache have "from_cache": True. Raises
+        TavilyUnavailable without calling Tavily when credits are low or the
+        circuit breaker is open.
+        """
+        credits = SEARCH_CREDITS.get(params.get("search_depth", "basic"), 1)
+        key = None
+        if settings.TAVILY_CACHE_ENABLED:
+            key = tavily_cache_key(query, **params)
+            cached = await tavily_cache.get(key, ttl=_cache_ttl(call_type))
+            if cached is not None:
+                search_stats["cached_searches"] += 1
+                search_stats["credits_saved"] += credits
+                logger.info(f"Tavily cache hit for {call_type} search")
+                return {**json.loads(cached), "from_cache": True}
+
+        if not await self._check_credits():
+            raise TavilyUnavailable("Tavily credits low or circuit breaker open")
+
+        # Charged up front so concurrent searches see each other's credits
+        ledger = get_ledger(self.api_key)
+        ledger.charge(credits)
+        try:
+            response = await _request(
+                "POST", "/search", self.api_key, json={"query": query, **params}
+            )
+        except TavilyError as e:
+            ledger.charge(-credits)  # Failed searches are not billed
+            ledger.record_failure(e.status_code)
+            raise
+        except BaseException:
+            ledger.charge(-credits)
+            raise
+        ledger.record_success()
+        search_stats["searches"] += 1
+        search_stats["credits_spent"] += credits
+
+        if key and response.get("results"):
+            await tavily_cache.set(key, json.dumps(response), ttl=_cache_ttl(call_type))
+        return response
+
     async def search_for_course_context(
         self, topic: str, language: str = "en"
     ) -> Optional[str]:
@@ -122,10 +280,8 @@ class TavilyService:
         Returns:
             Formatted string with search results, or None if search fails/disabled
         """
-        if not self.enabled or not self._check_credits():
-            logger.info(
-                "Tavily search disabled or credits low - skipping course context"
-            )
+        if not self.enabled:
+            logger.info("Tavily search disabled - skipping course context")
             return None
 
         # Craft search query based on language
@@ -140,8 +296,9 @@ class TavilyService:
 
         try:
             logger.info(f"Tavily search for course: {topic} (language: {language})")
-            response = self.client.search(
+            response = await self.search(
                 query=query,
+                call_type="course",
                 search_depth="basic",  # 1 credit
                 max_results=5,
                 include_answer=False,
@@ -167,6 +324,9 @@ class TavilyService:
             )
             return context
 
+        except TavilyUnavailable as e:
+            logger.info(f"Skipping Tavily search: {e}")
+            return None
         except Exception as e:
             # Graceful degradation: log error but don't fail the request
             logger.warning(f"Tavily search failed (likely quota exceeded): {e}")
@@ -187,10 +347,8 @@ class TavilyService:
         Returns:
             Formatted string with search results and citation instructions, or None
         """
-        if not self.enabled or not self._check_credits():
-            logger.info(
-                "Tavily search disabled or credits low - skipping lesson context"
-            )
+        if not self.enabled:
+            logger.info("Tavily search disabled - skipping lesson context")
             return None
 
         # Combine topic and lesson for better results
@@ -205,8 +363,9 @@ class TavilyService:
 
         try:
             logger.info(f"Tavily search for lesson: {lesson_title}")
-            response = self.client.search(
+            response = await self.search(
                 query=query,
+                call_type="lesson",
                 search_depth="advanced",  # basic 1 credit, advanced 2 credits
                 max_results=5,
                 include_answer=False,
@@ -240,6 +399,9 @@ class TavilyService:
             )
             return context
 
+        except TavilyUnavailable as e:
+            logger.info(f"Skipping Tavily search: {e}")
+            return None
         except Exception as e:
             logger.warning(f"Tavily search failed for lesson: {e}")
             return None
@@ -259,7 +421,7 @@ class TavilyService:
         Returns:
             Formatted string with search results, or None
         """
-        if not self.enabled or not self._check_credits():
+        if not self.enabled:
             logger.info(
                 "Tavily search disabled - answering question without web context"
             )
@@ -270,8 +432,9 @@ class TavilyService:
 
         try:
             logger.info(f"Tavily search for question: {question[:100]}...")
-            response = self.client.search(
+            response = await self.search(
                 query=query,
+                call_type="question",
                 search_depth="basic",  # 1 credit
                 max_results=3,
                 include_answer="basic",  # Get a quick answer from Tavily
@@ -303,9 +466,13 @@ class TavilyService:
             logger.info(f"Successfully retrieved web context for question")
             return context
 
+        except TavilyUnavailable as e:
+            logger.info(f"Skipping Tavily search: {e}")
+            return None
         except Exception as e:
             logger.warning(f"Tavily search failed for question: {e}")
             return None
 
 
-# Default singleton instance (uses global settings)\ntavily_service = TavilyService()
+# Default singleton instance (uses global settings)
+tavily_service = TavilyService()
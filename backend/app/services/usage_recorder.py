@@ -0,0 +1,91 @@
+"""
+LLM Usage Recorder
+Collects one record per LLM call (tokens, latency, call site) and writes them
+to the llm_usage table in batches from a background task, so recording never
+adds a database round trip to the request path.
+"""
+
+import asyncio
+import logging
+from typing import List, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class UsageRecorder:
+    def __init__(self, batch_size: int, flush_interval: float, max_pending: int):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.recorded = 0
+        self.dropped = 0
+
+    def record(self, **fields) -> None:
+        """Queue a usage record (LLMUsage column values). Never blocks."""
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_pending)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        try:
+            self._queue.put_nowait(fields)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def _run(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + self.flush_interval
+            try:
+                while len(batch) < self.batch_size:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+            except asyncio.CancelledError:
+                await self._write(batch)  # Don't lose a half collected batch
+                raise
+            await self._write(batch)
+
+    async def _write(self, batch: List[dict]) -> None:
+        from app.core.db import AsyncSessionLocal
+        from app.models.base import LLMUsage
+
+        try:
+            async with AsyncSessionLocal() as session:
+                session.add_all([LLMUsage(**fields) for fields in batch])
+                await session.commit()
+            self.recorded += len(batch)
+        except Exception as e:
+            self.dropped += len(batch)
+            logger.warning(f"Failed to write {len(batch)} LLM usage records: {e}")
+
+    async def stop(self) -> None:
+        """Stop the writer and flush whatever is still queued."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._queue is not None:
+            batch = []
+            while not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            if batch:
+                await self._write(batch)
+
+
+usage_recorder = UsageRecorder(
+    batch_size=settings.LLM_USAGE_BATCH_SIZE,
+    flush_interval=settings.LLM_USAGE_FLUSH_INTERVAL,
+    max_pending=settings.LLM_USAGE_MAX_PENDING,
+)
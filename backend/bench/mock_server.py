@@ -0,0 +1,361 @@
+"""
+Mock LLM / Tavily server for benchmarks
+A deterministic stand-in for the OpenAI-compatible API (chat completions,
+streaming, files and batches) and for Tavily (/search, /usage), so the whole
+backend can be load-tested without spending credits.
+
+Run it and point the backend at it:
+
+    python -m bench.mock_server --port 9100 --latency 0.5 --token-rate 200
+    OPENAI_BASE_URL=http://127.0.0.1:9100/v1 OPENAI_API_KEY=mock \\
+    TAVILY_BASE_URL=http://127.0.0.1:9100 TAVILY_API_KEY=mock ...
+
+Responses depend only on the prompt and --seed: the same request always gets
+the same content, and errors/429s are injected with a seeded RNG.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import time
+from typing import Dict, List
+
+from fastapi import FastAPI, File, Form, Request, UploadFile
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+
+WORDS = (
+    "data model function value system process example method result type "
+    "structure pattern concept variable object module interface state design "
+    "error test input output layer cache request response memory thread"
+).split()
+
+
+class MockConfig:
+    def __init__(self, **kwargs):
+        self.latency = 0.2  # Seconds before the first token
+        self.token_rate = 500.0  # Completion tokens per second
+        self.error_rate = 0.0  # Fraction of calls answered with a 500
+        self.rate_limit_rate = 0.0  # Fraction of calls answered with a 429
+        self.retry_after = 1.0  # Retry-After sent with 429s
+        self.modules = 5  # Modules in a generated course index
+        self.lessons_per_module = 4
+        self.lesson_tokens = 1200  # Approximate size of a lesson
+        self.answer_tokens = 250  # Approximate size of a question answer
+        self.search_latency = 0.3  # Tavily /search latency
+        self.batch_delay = 5.0  # Seconds until a submitted batch completes
+        self.seed = 42
+        self.__dict__.update(kwargs)
+
+
+def _rng(*parts) -> random.Random:
+    digest = hashlib.sha256("|".join(map(str, parts)).encode()).hexdigest()
+    return random.Random(int(digest[:16], 16))
+
+
+def _text(rng: random.Random, tokens: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(max(1, tokens)))
+
+
+def _course_index(config: MockConfig, prompt: str) -> str:
+    rng = _rng(config.seed, "index", prompt)
+    modules = []
+    for m in range(1, config.modules + 1):
+        lessons = [
+            {"title": _text(rng, 4).title(), "path": f"{m}.{l}"}
+            for l in range(1, config.lessons_per_module + 1)
+        ]
+        modules.append(
+            {"title": f"Module {m}: {_text(rng, 3).title()}", "lessons": lessons}
+        )
+    return json.dumps(modules, indent=2)
+
+
+def _lesson(config: MockConfig, prompt: str) -> str:
+    rng = _rng(config.seed, "lesson", prompt)
+    sections = ["Introduction", "Core Concepts", "Examples", "Exercises"]
+    per_section = max(1, config.lesson_tokens // len(sections))
+    parts = [f"# {_text(rng, 4).title()}"]
+    for section in sections:
+        parts.append(f"## {section}")
+        parts.append(_text(rng, per_section // 2))
+        if section == "Examples":
+            parts.append("```python\nfor item in items:\n    print(item)\n```")
+        parts.append(_text(rng, per_section // 2))
+    return "\n\n".join(parts)
+
+
+def completion_text(config: MockConfig, prompt: str) -> str:
+    """The deterministic content for a chat prompt of the backend."""
+    if "JSON array of Modules" in prompt:
+        return _course_index(config, prompt)
+    if "The student asks" in prompt:
+        return _text(_rng(config.seed, "answer", prompt), config.answer_tokens)
+    return _lesson(config, prompt)
+
+
+def _tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def _completion_body(model: str, prompt: str, text: str) -> Dict:
+    return {
+        "id": "chatcmpl-mock",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": text},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": {
+            "prompt_tokens": _tokens(prompt),
+            "completion_tokens": _tokens(text),
+            "total_tokens": _tokens(prompt) + _tokens(text),
+        },
+    }
+
+
+def create_app(config: MockConfig) -> FastAPI:
+    app = FastAPI(title="Mock LLM/Tavily server")
+    injector = random.Random(config.seed)
+    stats = {"chat": 0, "errors": 0, "throttled": 0, "search": 0, "batches": 0}
+    files: Dict[str, str] = {}
+    batches: Dict[str, Dict] = {}
+    app.state.stats = stats
+
+    def injected_failure():
+        roll = injector.random()
+        if roll < config.rate_limit_rate:
+            stats["throttled"] += 1
+            return JSONResponse(
+                {"error": {"message": "Rate limit reached", "type": "rate_limit"}},
+                status_code=429,
+                headers={"retry-after": str(config.retry_after)},
+            )
+        if roll < config.rate_limit_rate + config.error_rate:
+            stats["errors"] += 1
+            return JSONResponse(
+                {"error": {"message": "Injected server error", "type": "server"}},
+                status_code=500,
+            )
+        return None
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        stats["chat"] += 1
+        failure = injected_failure()
+        if failure is not None:
+            return failure
+
+        prompt = "\n".join(m.get("content") or "" for m in body["messages"])
+        model = body.get("model", "mock")
+        text = completion_text(config, prompt)
+
+        if not body.get("stream"):
+            await asyncio.sleep(config.latency + _tokens(text) / config.token_rate)
+            return _completion_body(model, prompt, text)
+
+        include_usage = (body.get("stream_options") or {}).get("include_usage")
+
+        async def chunks():
+            await asyncio.sleep(config.latency)
+            step = 16  # ~4 tokens per chunk
+            delay = (step / 4) / config.token_rate
+            for i in range(0, len(text), step):
+                chunk = {
+                    "id": "chatcmpl-mock",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [
+                        {
+                            "index": 0,
+                            "delta": {"content": text[i : i + step]},
+                            "finish_reason": None,
+                        }
+                    ],
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+                await asyncio.sleep(delay)
+            if include_usage:
+                usage_chunk = _completion_body(model, prompt, text)
+                usage_chunk.update(object="chat.completion.chunk", choices=[])
+                yield f"data: {json.dumps(usage_chunk)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(chunks(), media_type="text/event-stream")
+
+    @app.get("/v1/models")
+    async def models():
+        return {"object": "list", "data": [{"id": "mock", "object": "model"}]}
+
+    # Batch API: files + batches
+    @app.post("/v1/files")
+    async def upload_file(file: UploadFile = File(...), purpose: str = Form(...)):
+        file_id = f"file-{len(files) + 1}"
+        files[file_id] = (await file.read()).decode("utf-8")
+        return {
+            "id": file_id,
+            "object": "file",
+            "bytes": len(files[file_id]),
+            "created_at": int(time.time()),
+            "filename": file.filename,
+            "purpose": purpose,
+            "status": "processed",
+        }
+
+    @app.get("/v1/files/{file_id}/content")
+    async def file_content(file_id: str):
+        if file_id not in files:
+            return JSONResponse({"error": {"message": "No such file"}}, 404)
+        return PlainTextResponse(files[file_id])
+
+    def batch_object(batch_id: str) -> Dict:
+        batch = batches[batch_id]
+        if batch["status"] == "in_progress" and time.time() >= batch["ready_at"]:
+            output = []
+            for line in files[batch["input_file_id"]].splitlines():
+                if not line.strip():
+                    continue
+                request = json.loads(line)
+                body = request["body"]
+                prompt = "\n".join(m.get("content") or "" for m in body["messages"])
+                text = completion_text(config, prompt)
+                output.append(
+                    json.dumps(
+                        {
+                            "id": f"batch_req_{request['custom_id']}",
+                            "custom_id": request["custom_id"],
+                            "response": {
+                                "status_code": 200,
+                                "request_id": request["custom_id"],
+                                "body": _completion_body(
+                                    body.get("model", "mock"), prompt, text
+                                ),
+                            },
+                            "error": None,
+                        }
+                    )
+                )
+            output_id = f"file-{len(files) + 1}"
+            files[output_id] = "\n".join(output) + "\n"
+            batch.update(status="completed", output_file_id=output_id)
+        total = batch["total"]
+        done = total if batch["status"] == "completed" else 0
+        return {
+            "id": batch_id,
+            "object": "batch",
+            "endpoint": batch["endpoint"],
+            "input_file_id": batch["input_file_id"],
+            "completion_window": batch["completion_window"],
+            "status": batch["status"],
+            "created_at": batch["created_at"],
+            "output_file_id": batch.get("output_file_id"),
+            "error_file_id": None,
+            "request_counts": {"total": total, "completed": done, "failed": 0},
+            "metadata": batch.get("metadata"),
+        }
+
+    @app.post("/v1/batches")
+    async def create_batch(request: Request):
+        body = await request.json()
+        input_file_id = body["input_file_id"]
+        if input_file_id not in files:
+            return JSONResponse({"error": {"message": "No such file"}}, 404)
+        stats["batches"] += 1
+        batch_id = f"batch-{len(batches) + 1}"
+        batches[batch_id] = {
+            "endpoint": body["endpoint"],
+            "input_file_id": input_file_id,
+            "completion_window": body["completion_window"],
+            "metadata": body.get("metadata"),
+            "status": "in_progress",
+            "created_at": int(time.time()),
+            "ready_at": time.time() + config.batch_delay,
+            "total": sum(1 for l in files[input_file_id].splitlines() if l.strip()),
+        }
+        return batch_object(batch_id)
+
+    @app.get("/v1/batches/{batch_id}")
+    async def retrieve_batch(batch_id: str):
+        if batch_id not in batches:
+            return JSONResponse({"error": {"message": "No such batch"}}, 404)
+        return batch_object(batch_id)
+
+    @app.post("/v1/batches/{batch_id}/cancel")
+    async def cancel_batch(batch_id: str):
+        if batch_id not in batches:
+            return JSONResponse({"error": {"message": "No such batch"}}, 404)
+        if batches[batch_id]["status"] == "in_progress":
+            batches[batch_id]["status"] = "cancelled"
+        return batch_object(batch_id)
+
+    # Tavily
+    @app.post("/search")
+    async def search(request: Request):
+        body = await request.json()
+        stats["search"] += 1
+        failure = injected_failure()
+        if failure is not None:
+            return failure
+        await asyncio.sleep(config.search_latency)
+        query = body.get("query", "")
+        rng = _rng(config.seed, "search", query)
+        max_results = body.get("max_results", 5)
+        results: List[Dict] = []
+        for i in range(max_results):
+            result = {
+                "title": _text(rng, 5).title(),
+                "url": f"https://example.com/{i}/{hashlib.md5(query.encode()).hexdigest()[:8]}",
+                "content": _text(rng, 80),
+                "score": round(1 - i * 0.1, 2),
+            }
+            if body.get("include_raw_content"):
+                result["raw_content"] = _text(rng, 800)
+            results.append(result)
+        return {
+            "query": query,
+            "answer": _text(rng, 40) if body.get("include_answer") else None,
+            "results": results,
+            "response_time": config.search_latency,
+        }
+
+    @app.get("/usage")
+    async def usage():
+        return {
+            "key": {"usage": stats["search"], "limit": 1000000},
+            "account": {"current_plan": "mock"},
+        }
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    defaults = MockConfig()
+    for name, value in vars(defaults).items():
+        parser.add_argument(
+            "--" + name.replace("_", "-"), type=type(value), default=value
+        )
+    args = parser.parse_args()
+
+    import uvicorn
+
+    config = MockConfig(**{k: v for k, v in vars(args).items() if k in vars(defaults)})
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,453 @@
+"""
+End-to-end throughput benchmark
+Drives the public API (create course, generate lesson, generate-all-lessons,
+ask question, full-course PDF/EPUB export) with a configurable concurrency and
+reports throughput, p50/p95/p99 latency and peak RSS of the backend. Results
+are written as JSON so runs can be compared (--compare).
+
+Against a running backend (already pointed at bench.mock_server):
+
+    python -m bench.run_benchmark --base-url http://127.0.0.1:8000/api/v1 \\
+        --backend-pid $(pgrep -f "uvicorn app.main") --output results.json
+
+Or let it start the mock server and the backend itself (DATABASE_URL and the
+other required settings are taken from the environment):
+
+    python -m bench.run_benchmark --spawn --latency 0.5 --token-rate 200 \\
+        --output results.json --compare previous.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+SCENARIOS = [
+    "create_course",
+    "generate_lesson",
+    "generate_all_lessons",
+    "ask_question",
+    "export_pdf",
+    "export_epub",
+]
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+def summarize(latencies: List[float], errors: int, wall: float) -> Dict:
+    return {
+        "ops": len(latencies),
+        "errors": errors,
+        "wall_s": round(wall, 3),
+        "throughput_ops_s": round(len(latencies) / wall, 3) if wall > 0 else None,
+        "mean_s": round(sum(latencies) / len(latencies), 3) if latencies else None,
+        "p50_s": _round(percentile(latencies, 50)),
+        "p95_s": _round(percentile(latencies, 95)),
+        "p99_s": _round(percentile(latencies, 99)),
+        "max_s": _round(max(latencies) if latencies else None),
+    }
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 3) if value is not None else None
+
+
+def read_rss_mb(pid: int) -> Dict[str, Optional[float]]:
+    """Current and peak (VmHWM) resident set size of a process, Linux only."""
+    rss = {"rss_mb": None, "peak_rss_mb": None}
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    rss["rss_mb"] = round(int(line.split()[1]) / 1024, 1)
+                elif line.startswith("VmHWM:"):
+                    rss["peak_rss_mb"] = round(int(line.split()[1]) / 1024, 1)
+    except (OSError, ValueError):
+        pass
+    return rss
+
+
+class RSSSampler:
+    """Samples the RSS of a process in the background and keeps the maximum."""
+
+    def __init__(self, pid: Optional[int], interval: float = 0.2):
+        self.pid = pid
+        self.interval = interval
+        self.peak_mb: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        while True:
+            rss = read_rss_mb(self.pid)["rss_mb"]
+            if rss is not None:
+                self.peak_mb = max(self.peak_mb or 0.0, rss)
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if self.pid:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> Dict:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if not self.pid:
+            return {}
+        # VmHWM is the kernel's own high-water mark, sampling may miss spikes
+        return {
+            "sampled_peak_rss_mb": self.peak_mb,
+            **read_rss_mb(self.pid),
+        }
+
+
+async def run_ops(name: str, ops: List[Callable], concurrency: int) -> Dict:
+    """Run the operations with bounded concurrency and summarize them."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors: List[str] = []
+
+    async def run(op: Callable) -> None:
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await op()
+            except Exception as e:
+                errors.append(f"{type(e).__name__}: {e}")
+                return
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(run(op) for op in ops))
+    result = summarize(latencies, len(errors), time.perf_counter() - started)
+    if errors:
+        result["sample_errors"] = errors[:5]
+    print(
+        f"{name:<22} ops={result['ops']:<4} err={result['errors']:<3} "
+        f"thr={result['throughput_ops_s']}/s p50={result['p50_s']} "
+        f"p95={result['p95_s']} p99={result['p99_s']}"
+    )
+    return result
+
+
+class Benchmark:
+    def __init__(self, client: httpx.AsyncClient, args: argparse.Namespace):
+        self.client = client
+        self.args = args
+        self.courses: List[Dict] = []
+        self.lesson_ids: List[int] = []
+
+    async def login(self) -> None:
+        username = f"bench_{int(time.time() * 1000)}"
+        credentials = {"username": username, "password": "bench-password"}
+        response = await self.client.post("/auth/register", json=credentials)
+        response.raise_for_status()
+        response = await self.client.post("/auth/login", data=credentials)
+        response.raise_for_status()
+        token = response.json()["access_token"]
+        self.client.headers["Authorization"] = f"Bearer {token}"
+
+    async def _request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        response = await self.client.request(method, url, **kwargs)
+        response.raise_for_status()
+        return response
+
+    @staticmethod
+    def _lessons(course: Dict) -> List[Dict]:
+        return [
+            lesson
+            for module in json.loads(course["index_json"])
+            for lesson in module.get("lessons", [])
+        ]
+
+    async def create_course(self) -> Dict:
+        async def create(i: int) -> None:
+            response = await self._request(
+                "POST",
+                "/courses/",
+                json={
+                    "topic": f"Benchmark topic {i}",
+                    "use_web_research": self.args.web_research,
+                },
+            )
+            self.courses.append(response.json())
+
+        ops = [lambda i=i: create(i) for i in range(self.args.courses)]
+        return await run_ops("create_course", ops, self.args.concurrency)
+
+    async def generate_lesson(self) -> Dict:
+        course = self.courses[0]
+        lessons = self._lessons(course)[: self.args.lessons]
+
+        async def generate(lesson: Dict) -> None:
+            response = await self._request(
+                "POST",
+                "/lessons/generate",
+                json={
+                    "course_id": course["id"],
+                    "title": lesson["title"],
+                    "path_in_index": lesson["path"],
+                    "use_web_research": self.args.web_research,
+                },
+            )
+            self.lesson_ids.append(response.json()["id"])
+
+        ops = [lambda lesson=lesson: generate(lesson) for lesson in lessons]
+        return await run_ops("generate_lesson", ops, self.args.concurrency)
+
+    async def generate_all_lessons(self) -> Dict:
+        # One job per remaining course; each op lasts until its job is done
+        courses = self.courses[1:] or self.courses[:1]
+        generated = []
+
+        async def generate_all(course: Dict) -> None:
+            response = await self._request(
+                "POST",
+                f"/courses/{course['id']}/generate-all-lessons",
+                json={
+                    "use_web_research": self.args.web_research,
+                    "mode": self.args.mode,
+                },
+            )
+            total = response.json().get("to_generate", 0)
+            while total:
+                status = (
+                    await self._request(
+                        "GET", f"/courses/{course['id']}/generation-status"
+                    )
+                ).json()
+                if status["completed"] + status["failed"] >= status["total"]:
+                    if status["failed"]:
+                        raise RuntimeError(f"{status['failed']} lessons failed")
+                    break
+                await asyncio.sleep(self.args.poll_interval)
+            generated.append(total)
+
+        ops = [lambda course=course: generate_all(course) for course in courses]
+        result = await run_ops("generate_all_lessons", ops, len(ops))
+        result["lessons"] = sum(generated)
+        result["lessons_per_s"] = (
+            round(sum(generated) / result["wall_s"], 3) if result["wall_s"] else None
+        )
+        return result
+
+    async def ask_question(self) -> Dict:
+        if not self.lesson_ids:
+            raise RuntimeError("ask_question needs generate_lesson to run first")
+
+        async def ask(i: int) -> None:
+            lesson_id = self.lesson_ids[i % len(self.lesson_ids)]
+            await self._request(
+                "POST",
+                f"/lessons/{lesson_id}/ask",
+                json={"question": f"Can you explain point {i} again?"},
+            )
+
+        ops = [lambda i=i: ask(i) for i in range(self.args.questions)]
+        return await run_ops("ask_question", ops, self.args.concurrency)
+
+    async def _export(self, name: str, kind: str) -> Dict:
+        course = self.courses[0]
+
+        async def export() -> None:
+            response = await self._request(
+                "GET", f"/courses/{course['id']}/download-full-{kind}"
+            )
+            if not response.content:
+                raise RuntimeError("Empty export")
+
+        ops = [export for _ in range(self.args.exports)]
+        return await run_ops(name, ops, self.args.concurrency)
+
+    async def export_pdf(self) -> Dict:
+        return await self._export("export_pdf", "pdf")
+
+    async def export_epub(self) -> Dict:
+        return await self._export("export_epub", "epub")
+
+
+async def wait_until_up(url: str, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get(url, timeout=2.0)
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.3)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def spawn_servers(args: argparse.Namespace) -> List[subprocess.Popen]:
+    mock = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "bench.mock_server",
+            "--port",
+            str(args.mock_port),
+            "--latency",
+            str(args.latency),
+            "--token-rate",
+            str(args.token_rate),
+            "--error-rate",
+            str(args.error_rate),
+            "--rate-limit-rate",
+            str(args.rate_limit_rate),
+            "--batch-delay",
+            str(args.batch_delay),
+        ],
+        cwd=BACKEND_DIR,
+    )
+    mock_url = f"http://127.0.0.1:{args.mock_port}"
+    env = {
+        **os.environ,
+        "OPENAI_BASE_URL": f"{mock_url}/v1",
+        "OPENAI_API_KEY": "mock",
+        "TAVILY_BASE_URL": mock_url,
+        "TAVILY_API_KEY": "mock",
+        "LLM_BATCH_POLL_INTERVAL": "1",
+    }
+    backend = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "app.main:app",
+            "--port",
+            str(args.backend_port),
+            "--log-level",
+            "warning",
+        ],
+        cwd=BACKEND_DIR,
+        env=env,
+    )
+    args.base_url = f"http://127.0.0.1:{args.backend_port}/api/v1"
+    args.backend_pid = backend.pid
+    return [mock, backend]
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BACKEND_DIR,
+            stderr=subprocess.DEVNULL,
+            text=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: Dict, baseline_path: str) -> None:
+    """Print throughput and p95 changes against a previous results file."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {baseline_path} ({baseline['meta'].get('git')}):")
+    for name, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+        line = f"  {name:<22}"
+        for key in ("throughput_ops_s", "p95_s"):
+            old, new = previous.get(key), current.get(key)
+            if old and new:
+                line += f" {key}: {old} -> {new} ({(new - old) / old * 100:+.1f}%)"
+        print(line)
+
+
+async def run(args: argparse.Namespace) -> Dict:
+    await wait_until_up(args.base_url.rsplit("/api/", 1)[0] + "/")
+    sampler = RSSSampler(args.backend_pid)
+    sampler.start()
+
+    results = {
+        "meta": {
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "git": git_revision(),
+            "args": {k: v for k, v in vars(args).items() if k != "compare"},
+        },
+        "scenarios": {},
+    }
+    async with httpx.AsyncClient(
+        base_url=args.base_url, timeout=args.timeout
+    ) as client:
+        bench = Benchmark(client, args)
+        await bench.login()
+        for name in args.scenarios.split(","):
+            results["scenarios"][name] = await getattr(bench, name)()
+
+    results["backend_memory"] = await sampler.stop()
+    if results["backend_memory"]:
+        print(f"backend memory: {results['backend_memory']}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000/api/v1")
+    parser.add_argument("--backend-pid", type=int, help="PID to sample RSS from")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--courses", type=int, default=2)
+    parser.add_argument("--lessons", type=int, default=8)
+    parser.add_argument("--questions", type=int, default=20)
+    parser.add_argument("--exports", type=int, default=2)
+    parser.add_argument(
+        "--mode", choices=["interactive", "batch"], default="interactive"
+    )
+    parser.add_argument("--web-research", action="store_true")
+    parser.add_argument("--poll-interval", type=float, default=0.5)
+    parser.add_argument("--timeout", type=float, default=600.0)
+    parser.add_argument("--output", default="bench-results.json")
+    parser.add_argument("--compare", help="Previous results file to compare with")
+    spawn = parser.add_argument_group("spawned servers")
+    spawn.add_argument("--spawn", action="store_true")
+    spawn.add_argument("--backend-port", type=int, default=9200)
+    spawn.add_argument("--mock-port", type=int, default=9100)
+    spawn.add_argument("--latency", type=float, default=0.2)
+    spawn.add_argument("--token-rate", type=float, default=500.0)
+    spawn.add_argument("--error-rate", type=float, default=0.0)
+    spawn.add_argument("--rate-limit-rate", type=float, default=0.0)
+    spawn.add_argument("--batch-delay", type=float, default=5.0)
+    args = parser.parse_args()
+
+    unknown = set(args.scenarios.split(",")) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    processes = spawn_servers(args) if args.spawn else []
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait(timeout=10)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+import os
+
+import pytest
+
+# Settings needs these to import; tests never reach the database or the LLM
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite:///:memory:")
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+os.environ.setdefault("OPENAI_BASE_URL", "http://127.0.0.1:9/v1")
+
+
+@pytest.fixture
+def user_files(tmp_path, monkeypatch):
+    """PDFService.BASE_DIR (the user files volume) in a temporary directory."""
+    from app.services.pdf_service import PDFService
+
+    monkeypatch.setattr(PDFService, "BASE_DIR", tmp_path)
+    return tmp_path
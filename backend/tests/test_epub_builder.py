@@ -0,0 +1,55 @@
+import xml.etree.ElementTree as ET
+
+from app.services.epub_builder import _nav_list, to_xhtml
+
+
+def _parse(xhtml):
+    return ET.fromstring(f"<div>{xhtml}</div>")
+
+
+def test_html_becomes_well_formed_xhtml():
+    html = (
+        '<p class=a class=b>One&nbsp;&amp; two<br>three<img src="x.png">\n'
+        "<ul><li>open item</ul>\x0b<p>stray</span> end"
+    )
+    chapter = to_xhtml(html)
+    root = _parse(chapter["xhtml"])
+    paragraph = root.find("p")
+    assert paragraph.get("class") == "a"
+    assert paragraph.find("br") is not None and paragraph.find("img") is not None
+    assert "One & two" in paragraph.text
+    assert "\x0b" not in chapter["xhtml"]
+
+
+def test_headings_are_collected_up_to_the_nav_depth():
+    html = (
+        '<h1 id="loops">Loops</h1><h2 id="for-loops">The <code>for</code>\n'
+        'loop</h2><h3 id="details">Details</h3><h2>No id</h2>'
+    )
+    assert to_xhtml(html)["headings"] == [
+        [1, "loops", "Loops"],
+        [2, "for-loops", "The for loop"],
+    ]
+
+
+def test_nav_list_nests_by_depth():
+    nav = _nav_list(
+        [
+            (0, "ch001.xhtml", "Intro"),
+            (1, "ch001.xhtml#a", "A"),
+            (2, "ch001.xhtml#a1", "A.1"),
+            (0, "ch002.xhtml", "Next & last"),
+        ]
+    )
+    root = ET.fromstring(nav)
+    top = root.findall("li")
+    assert [li.find("a").text for li in top] == ["Intro", "Next & last"]
+    nested = top[0].find("ol/li")
+    assert nested.find("a").get("href") == "ch001.xhtml#a"
+    assert nested.find("ol/li/a").text == "A.1"
+
+
+def test_nav_list_never_skips_a_level():
+    root = ET.fromstring(_nav_list([(0, "a", "A"), (3, "b", "B"), (1, "c", "C")]))
+    children = root.find("li").findall("ol/li")
+    assert [li.find("a").text for li in children] == ["B", "C"]
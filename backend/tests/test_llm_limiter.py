@@ -0,0 +1,127 @@
+import asyncio
+import time
+
+import pytest
+
+from app.services.llm_limiter import (
+    ERROR,
+    OK,
+    THROTTLED,
+    AdaptiveLimiter,
+    PriorityTicket,
+    priority_ticket,
+)
+
+
+def _limiter(initial=4.0, latency_target=10.0):
+    return AdaptiveLimiter(
+        endpoint="http://llm",
+        key_fingerprint="test",
+        initial=initial,
+        min_window=1.0,
+        max_window=8.0,
+        latency_target=latency_target,
+    )
+
+
+def test_window_grows_additively_on_fast_successes():
+    limiter = _limiter()
+    limiter.in_flight = 1
+    limiter._release(0.1, OK, None)
+    assert limiter.window == pytest.approx(4.25)
+    assert limiter.successes == 1
+
+
+def test_window_shrinks_multiplicatively():
+    limiter = _limiter(latency_target=0.5)
+    limiter.in_flight = 3
+    limiter._release(1.0, OK, None)  # Slower than the target
+    assert limiter.window == pytest.approx(3.6)
+    limiter._release(0.1, ERROR, None)
+    assert limiter.window == pytest.approx(2.7)
+    limiter._release(0.1, THROTTLED, 0)
+    assert limiter.window == pytest.approx(1.35)
+    limiter.in_flight = 1
+    limiter._release(0.1, THROTTLED, 0)
+    assert limiter.window == 1.0  # Never below min_window
+    assert (limiter.errors, limiter.throttled) == (1, 2)
+
+
+def test_slots_are_handed_over_in_order():
+    limiter = _limiter(initial=1.0)
+
+    async def main():
+        first = await limiter.acquire()
+        order = []
+
+        async def wait(name):
+            slot = await limiter.acquire()
+            order.append(name)
+            slot.release()
+
+        waiters = [asyncio.create_task(wait(n)) for n in ("a", "b")]
+        await asyncio.sleep(0)
+        assert limiter.queue_depth == 2
+        first.release()
+        await asyncio.gather(*waiters)
+        return order
+
+    assert asyncio.run(main()) == ["a", "b"]
+    assert limiter.in_flight == 0
+
+
+def test_retry_after_pauses_every_caller():
+    limiter = _limiter()
+
+    async def main():
+        slot = await limiter.acquire()
+        slot.release(THROTTLED, retry_after=0.1)
+        started = time.monotonic()
+        (await limiter.acquire()).release()
+        return time.monotonic() - started
+
+    assert asyncio.run(main()) >= 0.09
+
+
+def test_low_priority_waits_for_normal_callers_and_half_the_window():
+    limiter = _limiter(initial=4.0)
+
+    async def main():
+        slots = [await limiter.acquire(low_priority=True) for _ in range(2)]
+        low = asyncio.create_task(limiter.acquire(low_priority=True))
+        await asyncio.sleep(0)
+        assert not low.done()  # At most half of the window
+        normal = await limiter.acquire()
+        slots.append(normal)
+        for slot in slots:
+            slot.release()
+        (await low).release()
+
+    asyncio.run(main())
+    assert limiter.in_flight == 0
+
+
+def test_promoted_ticket_moves_to_the_normal_lane():
+    limiter = _limiter(initial=1.0, latency_target=0)  # Window stays at 1
+
+    async def main():
+        busy = await limiter.acquire()
+        ticket = PriorityTicket()
+
+        async def prefetch():
+            priority_ticket.set(ticket)
+            return await limiter.acquire(low_priority=True)
+
+        low = asyncio.create_task(prefetch())
+        await asyncio.sleep(0)
+        assert ticket.promote() is True
+        normal = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        busy.release()
+        await asyncio.sleep(0.01)
+        # Low-priority waiters would yield to the normal caller, it no longer does
+        assert low.done() and not normal.done()
+        (await low).release()
+        (await normal).release()
+
+    asyncio.run(main())
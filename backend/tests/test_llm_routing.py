@@ -0,0 +1,38 @@
+import pytest
+
+from app.core.config import settings
+from app.services import llm_routing
+from app.services.llm_routing import LatencyTracker, Provider, hedge_delay
+
+PROVIDER = Provider("default", "sk-test", "http://llm/v1", "model")
+
+
+@pytest.fixture
+def tracker(monkeypatch):
+    tracker = LatencyTracker(window=100)
+    monkeypatch.setattr(llm_routing, "latency_tracker", tracker)
+    monkeypatch.setattr(settings, "LLM_HEDGE_MIN_SAMPLES", 5)
+    monkeypatch.setattr(settings, "LLM_HEDGE_PERCENTILE", 0.9)
+    monkeypatch.setattr(settings, "LLM_HEDGE_MIN_DELAY", 1.0)
+    return tracker
+
+
+def test_no_hedging_without_enough_samples(tracker):
+    for _ in range(4):
+        tracker.add("default", "lesson", False, 5.0)
+    assert hedge_delay(PROVIDER, "lesson", False) is None
+
+
+def test_delay_is_the_observed_percentile(tracker):
+    for latency in range(1, 11):
+        tracker.add("default", "lesson", False, float(latency))
+    assert hedge_delay(PROVIDER, "lesson", False) == 10.0
+    # Samples are kept per call site and per streamed/non-streamed
+    assert hedge_delay(PROVIDER, "lesson", True) is None
+    assert hedge_delay(PROVIDER, "quiz", False) is None
+
+
+def test_delay_has_a_floor(tracker):
+    for _ in range(5):
+        tracker.add("default", "lesson", True, 0.2)
+    assert hedge_delay(PROVIDER, "lesson", True) == 1.0
@@ -0,0 +1,86 @@
+import asyncio
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import lesson_service, pdf_merge
+
+CONTENT = "# Loops\n\nA loop repeats.\n"
+
+
+@pytest.fixture
+def lesson(user_files):
+    directory = user_files / "1" / "Course"
+    directory.mkdir(parents=True)
+    (directory / "Loops.md").write_text(CONTENT, encoding="utf-8")
+    (directory / "Loops.pdf").write_bytes(b"%PDF")
+    return SimpleNamespace(
+        id=5, title="Loops", content_markdown=CONTENT, pdf_path="1/Course/Loops.pdf"
+    )
+
+
+def test_current_pdf_is_fresh(lesson, user_files):
+    assert pdf_merge.fresh_lesson_pdf(lesson) == user_files / lesson.pdf_path
+
+
+def test_pdf_of_older_content_is_stale(lesson):
+    lesson.content_markdown = CONTENT + "Regenerated.\n"
+    assert pdf_merge.fresh_lesson_pdf(lesson) is None
+
+
+def test_unfinished_render_is_stale(lesson, user_files):
+    pdf_file = user_files / lesson.pdf_path
+    # The markdown was saved after the PDF: a render is pending or failed
+    mtime = pdf_file.stat().st_mtime
+    os.utime(pdf_file.with_suffix(".md"), (mtime + 10, mtime + 10))
+    assert pdf_merge.fresh_lesson_pdf(lesson) is None
+
+
+def test_missing_pdf_is_not_fresh(lesson, user_files):
+    (user_files / lesson.pdf_path).unlink()
+    assert pdf_merge.fresh_lesson_pdf(lesson) is None
+    lesson.pdf_path = None
+    assert pdf_merge.fresh_lesson_pdf(lesson) is None
+
+
+class _Session:
+    """AsyncSessionLocal stand-in: the lesson row is not found."""
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, query):
+        return SimpleNamespace(scalars=lambda: SimpleNamespace(first=lambda: None))
+
+
+def test_merge_and_background_renders_share_one_run(lesson, monkeypatch):
+    lesson.content_markdown = CONTENT + "Regenerated.\n"
+    calls = []
+
+    async def convert_markdown_to_pdf(content, user_id, course_title, lesson_title):
+        calls.append(content)
+        await asyncio.sleep(0.01)
+        return lesson.pdf_path
+
+    monkeypatch.setattr(
+        lesson_service.PDFService,
+        "convert_markdown_to_pdf",
+        staticmethod(convert_markdown_to_pdf),
+    )
+    monkeypatch.setattr(lesson_service, "AsyncSessionLocal", _Session)
+
+    async def main():
+        return await asyncio.gather(
+            pdf_merge._lesson_pdf(lesson, 1, "Course"),
+            lesson_service.render_pdf(
+                lesson.id, lesson.content_markdown, 1, "Course", lesson.title
+            ),
+        )
+
+    merged, background = asyncio.run(main())
+    assert calls == [lesson.content_markdown]
+    assert merged.name == "Loops.pdf" and background == lesson.pdf_path
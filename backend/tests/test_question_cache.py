@@ -0,0 +1,34 @@
+import pytest
+
+from app.core.config import settings
+from app.services.question_cache import QuestionCache, cosine, embed_question
+
+LESSON = "# Loops\n\n## Exercises\n\n1. Sum a list\n2. Reverse a string\n"
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    monkeypatch.setattr(settings, "QUESTION_CACHE_ENABLED", True)
+    return QuestionCache(threshold=0.85, ttl=3600, max_per_lesson=10)
+
+
+def test_other_exercise_is_a_miss(cache):
+    cache.add(1, LESSON, 10, "explain exercise 1", "Sum with a loop.")
+    assert cache.lookup(1, LESSON, "explain exercise 2") is None
+    assert cache.lookup(1, LESSON, "Explain exercise 1, please")[0] == 10
+
+
+def test_other_line_is_a_miss(cache):
+    cache.add(1, LESSON, 10, "What does line 3 do?", "It loops.")
+    assert cache.lookup(1, LESSON, "What does line 4 do?") is None
+
+
+def test_paraphrase_is_a_hit(cache):
+    cache.add(1, LESSON, 10, "What is a closure?", "A function with state.")
+    assert cache.lookup(1, LESSON, "what are closures")[0] == 10
+
+
+def test_variable_order_matters():
+    a = embed_question("Why is x faster than y?")
+    b = embed_question("Why is y faster than x?")
+    assert cosine(a, b) < settings.QUESTION_CACHE_THRESHOLD
@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+
+from app.services import render_cache
+
+COURSE = "# Course\n\n## Lesson 1\n"
+
+
+@pytest.fixture(autouse=True)
+def toolchain(user_files, monkeypatch):
+    async def tool_version(tool):
+        return f"{tool} 1.0"
+
+    monkeypatch.setattr(render_cache, "tool_version", tool_version)
+
+
+def _builder(calls):
+    async def build(path):
+        calls.append(path)
+        await asyncio.sleep(0.01)
+        path.write_bytes(b"%PDF")
+        return True
+
+    return build
+
+
+def _get(markdown, build):
+    return render_cache.get_or_render(markdown, "pdf", 1, 2, build=build)
+
+
+def test_second_download_is_served_from_the_cache():
+    calls = []
+
+    async def main():
+        first = await _get(COURSE, _builder(calls))
+        second = await _get(COURSE, _builder(calls))
+        return first, second
+
+    first, second = asyncio.run(main())
+    assert first == second and first.read_bytes() == b"%PDF"
+    assert len(calls) == 1
+    assert ".partial." in calls[0].name  # Renamed once complete
+
+
+def test_concurrent_downloads_share_one_render():
+    calls = []
+
+    async def main():
+        return await asyncio.gather(*(_get(COURSE, _builder(calls)) for _ in range(3)))
+
+    assert len(set(asyncio.run(main()))) == 1
+    assert len(calls) == 1
+
+
+def test_new_content_replaces_the_old_artifact():
+    calls = []
+
+    async def main():
+        old = await _get(COURSE, _builder(calls))
+        new = await _get(COURSE + "More.\n", _builder(calls))
+        return old, new
+
+    old, new = asyncio.run(main())
+    assert old != new
+    assert not old.exists() and new.exists()
+
+
+def test_failed_render_leaves_nothing_behind():
+    async def build(path):
+        path.write_bytes(b"half")
+        return False
+
+    assert asyncio.run(_get(COURSE, build)) is None
+    assert list(render_cache.course_cache_dir(1, 2).iterdir()) == []
+
+
+def test_evict_course_removes_every_artifact():
+    path = asyncio.run(_get(COURSE, _builder([])))
+    render_cache.evict_course(1, 2)
+    assert not path.parent.exists()
@@ -0,0 +1,125 @@
+import asyncio
+
+from app.services import lesson_service
+from app.services.llm_service import LLMService
+from app.services.singleflight import SingleFlight
+
+
+def test_concurrent_callers_share_one_run():
+    flights = SingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "done"
+
+    async def main():
+        return await asyncio.gather(*(flights.run("k", work) for _ in range(3)))
+
+    results = asyncio.run(main())
+    assert calls == [1]
+    assert [leader for _, leader in results] == [True, False, False]
+    assert all(result == "done" for result, _ in results)
+
+
+def test_cancelled_leader_does_not_cancel_the_work():
+    flights = SingleFlight()
+
+    async def work():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def main():
+        leader = asyncio.create_task(flights.run("k", work))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flights.run("k", work))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await follower
+
+    assert asyncio.run(main()) == ("done", False)
+
+
+def test_cancel_unshared_leaves_shared_work_alone():
+    flights = SingleFlight()
+
+    async def work():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def main():
+        first = asyncio.create_task(flights.run("k", work))
+        await asyncio.sleep(0)
+        assert flights.cancel_unshared("k") is True
+        # The only caller was cancelled along with the work
+        (outcome,) = await asyncio.gather(first, return_exceptions=True)
+        assert isinstance(outcome, asyncio.CancelledError)
+
+        callers = [asyncio.create_task(flights.run("k", work)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        assert flights.waiting("k") == 2
+        assert flights.cancel_unshared("k") is False
+        return await asyncio.gather(*callers)
+
+    assert [result for result, _ in asyncio.run(main())] == ["done", "done"]
+
+
+def _fake_lesson_pipeline(monkeypatch):
+    rendered = []
+
+    async def generate_lesson_content(*args, **kwargs):
+        await asyncio.sleep(0.05)
+        return "# Lesson"
+
+    async def store_lesson(course_id, title, path_in_index, content):
+        return object(), True
+
+    async def render_lesson_pdf(lesson, user_id, course_title):
+        rendered.append(user_id)
+
+    monkeypatch.setattr(
+        LLMService, "generate_lesson_content", staticmethod(generate_lesson_content)
+    )
+    monkeypatch.setattr(lesson_service, "store_lesson", store_lesson)
+    monkeypatch.setattr(lesson_service, "render_lesson_pdf", render_lesson_pdf)
+    return rendered
+
+
+class _User:
+    id = 7
+
+
+def _generate(path):
+    return lesson_service.generate_lesson(
+        1, "Course", "{}", "en", "Lesson", path, user=_User()
+    )
+
+
+def test_created_goes_to_a_surviving_follower(monkeypatch):
+    rendered = _fake_lesson_pipeline(monkeypatch)
+
+    async def main():
+        leader = asyncio.create_task(_generate("1"))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(_generate("1"))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await follower
+
+    _, created = asyncio.run(main())
+    assert created is True
+    assert rendered == []  # The follower queues the PDF
+
+
+def test_pdf_is_queued_when_every_caller_is_cancelled(monkeypatch):
+    rendered = _fake_lesson_pipeline(monkeypatch)
+
+    async def main():
+        leader = asyncio.create_task(_generate("2"))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        await asyncio.sleep(0.1)
+
+    asyncio.run(main())
+    assert rendered == [_User.id]
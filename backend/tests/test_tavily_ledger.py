@@ -0,0 +1,51 @@
+import pytest
+
+from app.core.config import settings
+from app.services.tavily_ledger import CreditLedger
+
+
+@pytest.fixture
+def ledger(monkeypatch):
+    monkeypatch.setattr(settings, "TAVILY_BREAKER_FAILURES", 3)
+    monkeypatch.setattr(settings, "TAVILY_CREDIT_THRESHOLD", 10)
+    return CreditLedger("test")
+
+
+def test_consecutive_outages_open_the_breaker(ledger):
+    ledger.record_failure(503)
+    ledger.record_failure(None)  # Timeout or transport error
+    assert ledger.allow()
+    ledger.record_failure(500)
+    assert ledger.is_open()
+    assert not ledger.allow()
+    assert ledger.short_circuited == 1
+
+
+def test_client_errors_do_not_count(ledger):
+    for status_code in (400, 401, 429, 400):
+        ledger.record_failure(status_code)
+    assert ledger.failures == 0
+    assert ledger.allow()
+
+
+def test_success_resets_the_count(ledger):
+    ledger.record_failure(502)
+    ledger.record_failure(502)
+    ledger.record_success()
+    ledger.record_failure(502)
+    assert not ledger.is_open()
+
+
+def test_quota_exhausted_opens_until_topped_up(ledger):
+    ledger.record_failure(432)
+    assert ledger.is_open()
+    assert ledger.remaining == 0
+    ledger.reconcile(usage=100, limit=1000)
+    assert ledger.allow()
+
+
+def test_low_credits_skip_searches(ledger):
+    ledger.reconcile(usage=995, limit=1000)
+    assert not ledger.allow()
+    ledger.charge(-10)  # A failed search is refunded
+    assert ledger.allow()